@@ -5,10 +5,71 @@ class Settings(BaseModel):
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_API_BASE: str | None = os.getenv("OPENAI_API_BASE")
     OPENAI_MODEL_LLM: str = os.getenv("OPENAI_MODEL_LLM", "gpt-4o-mini")
+    # Enrutado por fila en los procesos masivos del LLM: filas limpias sin entonaciones que generar
+    # no llaman al modelo; filas cortas sin ruido van a LLM_MODEL_SMALL (vacío = todo al modelo completo)
+    LLM_ROUTING: bool = (os.getenv("LLM_ROUTING") or "1").lower() not in ("0", "false", "no", "off")
+    LLM_MODEL_SMALL: str = os.getenv("LLM_MODEL_SMALL") or ""
+    LLM_SMALL_MAX_CHARS: int = int(os.getenv("LLM_SMALL_MAX_CHARS") or "1500")
     OPENAI_MODEL_TTS: str = os.getenv("OPENAI_MODEL_TTS", "gpt-4o-mini-tts")
     DEFAULT_VOICE_Q: str = os.getenv("DEFAULT_VOICE_Q", "onyx")
     DEFAULT_VOICE_R: str = os.getenv("DEFAULT_VOICE_R", "sage")
     BASE_URL: str = os.getenv("BASE_URL", "http://localhost")
     PORT: int = int(os.getenv("PORT", "8000"))
+    # Pipeline LLM -> TTS: concurrencia independiente por etapa y cola entre ambas
+    PIPELINE_LLM_WORKERS: int = int(os.getenv("PIPELINE_LLM_WORKERS") or "4")
+    PIPELINE_TTS_WORKERS: int = int(os.getenv("PIPELINE_TTS_WORKERS") or "4")
+    PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE") or "8")
+    # Dispatcher de llamadas al proveedor: slots simultáneos por tipo y cuántos
+    # quedan reservados para peticiones interactivas (botones de una tarjeta)
+    DISPATCH_TTS_SLOTS: int = int(os.getenv("DISPATCH_TTS_SLOTS") or "8")
+    DISPATCH_LLM_SLOTS: int = int(os.getenv("DISPATCH_LLM_SLOTS") or "8")
+    DISPATCH_INTERACTIVE_RESERVED: int = int(os.getenv("DISPATCH_INTERACTIVE_RESERVED") or "1")
+    # Pre-síntesis especulativa tras editar un registro (opt-in por proyecto en el .info):
+    # espera desde la última edición, renders por proyecto y hora, y workers
+    SPECULATIVE_TTS_DEBOUNCE_MS: int = int(os.getenv("SPECULATIVE_TTS_DEBOUNCE_MS") or "1500")
+    SPECULATIVE_TTS_BUDGET: int = int(os.getenv("SPECULATIVE_TTS_BUDGET") or "60")
+    SPECULATIVE_TTS_WORKERS: int = int(os.getenv("SPECULATIVE_TTS_WORKERS") or "2")
+    # Almacenamiento de los mp3: "local" (BASE_VOICES_DIR) o "s3" (bucket S3 / MinIO, requiere boto3).
+    # Credenciales S3 por las variables estándar de AWS (AWS_ACCESS_KEY_ID, ...)
+    AUDIO_STORE: str = os.getenv("AUDIO_STORE") or "local"
+    AUDIO_S3_BUCKET: str = os.getenv("AUDIO_S3_BUCKET") or ""
+    AUDIO_S3_PREFIX: str = os.getenv("AUDIO_S3_PREFIX") or ""
+    AUDIO_S3_ENDPOINT_URL: str | None = os.getenv("AUDIO_S3_ENDPOINT_URL")
+    AUDIO_S3_REGION: str | None = os.getenv("AUDIO_S3_REGION")
+    AUDIO_S3_PART_MB: int = int(os.getenv("AUDIO_S3_PART_MB") or "8")
+    # URL pública del bucket o CDN; sin ella se sirven URLs prefirmadas de AUDIO_URL_EXPIRES segundos
+    AUDIO_PUBLIC_BASE_URL: str | None = os.getenv("AUDIO_PUBLIC_BASE_URL")
+    AUDIO_URL_EXPIRES: int = int(os.getenv("AUDIO_URL_EXPIRES") or "3600")
+    # Motor TTS por defecto: "openai" o "local" (síntesis offline en CPU para borradores).
+    # Cada proyecto puede elegir otro en el .info ("voices": {"provider": "local"})
+    TTS_PROVIDER: str = os.getenv("TTS_PROVIDER") or "openai"
+    # Motor local: "piper" (modelos .onnx en LOCAL_TTS_VOICES_DIR) o "espeak" (espeak-ng),
+    # procesos del pool, voces por defecto / precargadas y bitrate del mp3 (kbps)
+    LOCAL_TTS_ENGINE: str = os.getenv("LOCAL_TTS_ENGINE") or "piper"
+    LOCAL_TTS_VOICES_DIR: str = os.getenv("LOCAL_TTS_VOICES_DIR") or ""
+    LOCAL_TTS_WORKERS: int = int(os.getenv("LOCAL_TTS_WORKERS") or "2")
+    # Procesos del motor local reservados a peticiones interactivas (por defecto ninguno:
+    # los borradores masivos usan todos los workers)
+    LOCAL_TTS_INTERACTIVE_RESERVED: int = int(os.getenv("LOCAL_TTS_INTERACTIVE_RESERVED") or "0")
+    LOCAL_TTS_VOICE_Q: str = os.getenv("LOCAL_TTS_VOICE_Q") or ""
+    LOCAL_TTS_VOICE_R: str = os.getenv("LOCAL_TTS_VOICE_R") or ""
+    LOCAL_TTS_PRELOAD: str = os.getenv("LOCAL_TTS_PRELOAD") or ""
+    LOCAL_TTS_BITRATE: int = int(os.getenv("LOCAL_TTS_BITRATE") or "64")
+    # Subida de PDFs en lote: procesos que extraen y analizan los PDFs (0 = uno por CPU),
+    # máximo de ficheros por lote y tamaño máximo de cada PDF (MB)
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS") or "0")
+    INGEST_MAX_FILES: int = int(os.getenv("INGEST_MAX_FILES") or "500")
+    INGEST_MAX_FILE_MB: int = int(os.getenv("INGEST_MAX_FILE_MB") or "100")
+    # Trazas (spans por petición y por job) en <proyecto>/.trace/; TRACING=0 las desactiva.
+    # Con TRACE_OTLP_ENDPOINT (p.ej. http://localhost:4318/v1/traces) se envían también a un colector OTLP/HTTP
+    TRACING: bool = (os.getenv("TRACING") or "1").lower() not in ("0", "false", "no", "off")
+    TRACE_OTLP_ENDPOINT: str | None = os.getenv("TRACE_OTLP_ENDPOINT")
+    # Profiler de muestreo bajo demanda (requiere trazas): sin PROFILER_TOKEN está desactivado.
+    # Muestras por segundo, duración máxima, perfiles simultáneos y % máximo del intérprete para el muestreo
+    PROFILER_TOKEN: str = os.getenv("PROFILER_TOKEN") or ""
+    PROFILE_HZ: int = int(os.getenv("PROFILE_HZ") or "100")
+    PROFILE_MAX_SECONDS: int = int(os.getenv("PROFILE_MAX_SECONDS") or "60")
+    PROFILE_MAX_SESSIONS: int = int(os.getenv("PROFILE_MAX_SESSIONS") or "2")
+    PROFILE_MAX_OVERHEAD_PCT: float = float(os.getenv("PROFILE_MAX_OVERHEAD_PCT") or "2")
 
 settings = Settings()
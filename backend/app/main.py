@@ -1,7 +1,10 @@
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from .routers import parsing, records, tts, llm
+from .routers import parsing, records, tts, llm, pipeline, runs, admin, export, audio, search, traces, snapshots
+from .services import profiler, tracing
 from .utils import BASE_VOICES_DIR
 
 app = FastAPI(title="Entrevista TTS API", version="1.0")
@@ -12,12 +15,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"]
     ,allow_headers=["*"]
+    ,expose_headers=["X-Total-Count", "X-Trace-Id", "X-Profile-Id"]
 )
 
 app.include_router(parsing.router)
 app.include_router(records.router)
 app.include_router(tts.router)
 app.include_router(llm.router)
+app.include_router(pipeline.router)
+app.include_router(runs.router)
+app.include_router(admin.router)
+app.include_router(export.router)
+app.include_router(export.import_router)
+app.include_router(audio.router)
+app.include_router(search.router)
+app.include_router(traces.router)
+app.include_router(snapshots.router)
 
 # Servimos /voices estáticamente para reproducir mp3 desde el frontend
 app.mount("/voices", StaticFiles(directory=str(BASE_VOICES_DIR)), name="voices")
@@ -42,3 +55,56 @@ async def ensure_cors_headers(request, call_next):
         response.headers.setdefault("Access-Control-Allow-Methods", "GET,POST,PUT,PATCH,DELETE,OPTIONS,HEAD")
         response.headers.setdefault("Access-Control-Allow-Headers", "*")
     return response
+
+
+async def _stop_profile_after(body, profile_id: str):
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        # stop() escribe el perfil a disco: fuera del event loop
+        await run_in_threadpool(profiler.stop, profile_id)
+
+
+# Traza por petición de la API (ver services/tracing.py). Se registra después
+# del middleware de CORS, así que lo envuelve y mide también su tiempo.
+# Con `X-Profile: <segundos>` y `X-Profile-Token` se perfila además la petición
+# hasta que termina de enviarse la respuesta (ver services/profiler.py).
+@app.middleware("http")
+async def trace_requests(request, call_next):
+    if not request.url.path.startswith("/api/") or request.url.path.startswith("/api/traces/"):
+        return await call_next(request)
+    with tracing.trace(f"{request.method} {request.url.path}", path=request.url.path) as root:
+        profile = None
+        if root is not None and "x-profile" in request.headers:
+            if not profiler.check_token(request.headers.get("x-profile-token")):
+                return JSONResponse({"detail": "X-Profile-Token no válido o profiler desactivado"}, status_code=403)
+            try:
+                profile = profiler.start_request(None, float(request.headers["x-profile"] or 0))
+            except ValueError:
+                return JSONResponse({"detail": "X-Profile debe ser un número de segundos"}, status_code=400)
+            except profiler.ProfilerError as e:
+                return JSONResponse({"detail": str(e)}, status_code=409)
+        try:
+            response = await call_next(request)
+        except BaseException:
+            if profile is not None:
+                await run_in_threadpool(profiler.stop, profile.id)
+            raise
+        if root is not None:
+            # el router ya resolvió la ruta: nombre por plantilla y proyecto de la URL
+            route = request.scope.get("route")
+            if route is not None:
+                root.name = f"{request.method} {route.path}"
+            project_id = request.scope.get("path_params", {}).get("project_id")
+            if project_id:
+                tracing.bind_project(project_id)
+            root.set(status=response.status_code)
+            response.headers["X-Trace-Id"] = root.trace.trace_id
+            if profile is not None:
+                profile.label = root.name
+                if project_id:
+                    profiler.bind(profile, project_id)
+                response.headers["X-Profile-Id"] = profile.id
+                response.body_iterator = _stop_profile_after(response.body_iterator, profile.id)
+    return response
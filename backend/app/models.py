@@ -23,15 +23,41 @@ class TTSOneRequest(BaseModel):
     part: str  # "pregunta" | "respuesta"
     prompt_override: str | None = None
     voice_override: str | None = None
+    provider: str | None = None  # "openai" | "local"; por defecto el del proyecto
 
 class LLMProcessRequest(BaseModel):
     # Permite reprocesar todo el CSV con el LLM
     overwrite_texts: bool = True
     overwrite_prompts: bool = True
     project_prompt: str | None = None
+    # enrutado por fila (saltar el LLM, modelo pequeño o completo); None = LLM_ROUTING
+    routing: bool | None = None
 
 
 class LLMProcessOneRequest(BaseModel):
     overwrite_texts: bool = True
     overwrite_prompts: bool = True
     part: str = "both"  # 'pregunta' | 'respuesta' | 'both'
+
+
+class RecordEdit(BaseModel):
+    num: int
+    fields: UpdateRecord
+
+
+class FindReplace(BaseModel):
+    find: str = Field(min_length=1)
+    replace: str = ""
+    # columnas donde buscar: pregunta, respuesta, entonacion_p, entonacion_r
+    columns: list[str] = Field(default_factory=lambda: ["pregunta", "respuesta", "entonacion_p", "entonacion_r"])
+    regex: bool = False
+    case_sensitive: bool = True
+    nums: list[int] | None = None  # limitar a estos registros
+
+
+class BatchUpdateRequest(BaseModel):
+    updates: list[RecordEdit] = Field(default_factory=list)
+    find_replace: FindReplace | None = None
+    # True: si alguna fila no valida no se escribe nada
+    all_or_nothing: bool = True
+    dry_run: bool = False
@@ -0,0 +1,95 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse
+from ..services import dispatcher
+from ..services import profiler
+from ..services import prompt_builder
+from ..services import singleflight
+from ..services import speculative
+from ..config import settings
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+@router.get("/dispatcher")
+def dispatcher_stats():
+    """Slots en uso, peticiones en espera por clase (interactive/bulk/speculative) y tiempos de espera."""
+    return dispatcher.stats()
+
+
+@router.get("/singleflight")
+def singleflight_stats():
+    """Peticiones TTS/LLM idénticas recibidas, ejecutadas y agrupadas (`coalesced`)."""
+    return singleflight.stats()
+
+
+@router.get("/prompt_cache")
+def prompt_cache_stats():
+    """Tokens de entrada, `cached_tokens` y tasa de acierto de la caché de prefijos del proveedor por proyecto."""
+    return prompt_builder.stats()
+
+
+@router.get("/speculative")
+def speculative_stats():
+    """Pre-síntesis especulativa: renders en cola, hechos, descartados (superseded, budget...) y gasto por proyecto."""
+    return speculative.stats()
+
+
+def require_profiler_token(x_profile_token: str | None = Header(None)) -> None:
+    if not profiler.enabled():
+        raise HTTPException(403, "Profiler desactivado (define PROFILER_TOKEN y no desactives las trazas)")
+    if not profiler.check_token(x_profile_token):
+        raise HTTPException(403, "X-Profile-Token no válido")
+
+
+@router.post("/profile/{project_id}", dependencies=[Depends(require_profiler_token)])
+def profile_job(
+    project_id: str,
+    seconds: float = Query(10, gt=0),
+    trace_id: str | None = None,
+    wait: bool = False,
+):
+    """Perfila durante `seconds` el job en curso del proyecto (TTS/LLM masivo, pipeline, pre-síntesis).
+
+    `trace_id` elige un job concreto (ver `/api/traces/{project_id}?kind=job`). Con `wait=true`
+    responde al terminar con el resumen; si no, devuelve el `id` para consultarlo después.
+    """
+    try:
+        sess = profiler.start_job(project_id, seconds, trace_id=trace_id)
+    except LookupError as e:
+        raise HTTPException(404, str(e))
+    except profiler.ProfilerError as e:
+        raise HTTPException(409, str(e))
+    if wait:
+        sess.done.wait(settings.PROFILE_MAX_SECONDS + 5)
+        return sess.meta or {"id": sess.id, "running": True}
+    return {"id": sess.id, "label": sess.label, "trace_ids": sess.trace_ids, "running": True}
+
+
+@router.get("/profiles/{project_id}", dependencies=[Depends(require_profiler_token)])
+def list_profiles(project_id: str):
+    """Perfiles en curso y guardados del proyecto, del más reciente al más antiguo."""
+    return {"project_id": project_id, "profiles": profiler.list_profiles(project_id)}
+
+
+@router.get("/profiles/{project_id}/{profile_id}", dependencies=[Depends(require_profiler_token)])
+def get_profile(project_id: str, profile_id: str, format: str = Query("json", pattern="^(json|folded)$")):
+    """Resumen de un perfil (muestras, hz, overhead y funciones con más tiempo propio e inclusivo)
+    o, con `format=folded`, las pilas colapsadas para flamegraph.pl / speedscope / inferno.
+    """
+    if format == "folded":
+        path = profiler.folded_path(project_id, profile_id)
+        if path is None:
+            raise HTTPException(404, "Perfil no encontrado o aún en curso")
+        return FileResponse(path, media_type="text/plain; charset=utf-8", filename=f"{profile_id}.folded")
+    meta = profiler.read_meta(project_id, profile_id)
+    if meta is None:
+        raise HTTPException(404, "Perfil no encontrado")
+    return meta
+
+
+@router.delete("/profiles/{project_id}/{profile_id}", dependencies=[Depends(require_profiler_token)])
+def stop_profile(project_id: str, profile_id: str):
+    """Termina antes de tiempo un perfil en curso y lo guarda."""
+    if not any(r["id"] == profile_id for r in profiler.running(project_id)):
+        raise HTTPException(404, "No hay ningún perfil en curso con ese id")
+    return profiler.stop(profile_id)
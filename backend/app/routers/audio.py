@@ -0,0 +1,58 @@
+import orjson
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import RedirectResponse
+from ..services import audio_meta
+from ..services import audio_store
+from ..services import streaming
+from ..utils import BASE_VOICES_DIR
+from app.services.project_logger import log
+
+router = APIRouter(prefix="/api/audio", tags=["audio"])
+
+
+@router.get("/{project_id}/timeline")
+def audio_timeline(
+    project_id: str,
+    request: Request,
+    peaks: int = Query(audio_meta.PEAKS, ge=0, le=audio_meta.PEAKS),
+    gap_ms: int = Query(0, ge=0),
+):
+    """Duración, tamaño, URL y picos de forma de onda de cada audio, con su posición en la línea de tiempo de la entrevista.
+
+    Sustituye a los HEAD por tarjeta y a descargar los mp3 para conocer su duración.
+    """
+    if not (BASE_VOICES_DIR / project_id).is_dir():
+        raise HTTPException(status_code=404, detail="Project not found")
+    log(project_id, f"audio_timeline called peaks={peaks} gap_ms={gap_ms}")
+    # orjson directly: jsonable_encoder is ~10x slower on the peak arrays of a large project
+    body = orjson.dumps(audio_meta.timeline(project_id, peaks=peaks, gap_ms=gap_ms))
+    encoding = streaming.negotiate_encoding(request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        body = b"".join(streaming.compress([body], encoding))
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.api_route("/{project_id}/{num}/{part}", methods=["GET", "HEAD"])
+def audio_play(project_id: str, num: int, part: str, request: Request):
+    """Redirige al mp3 de una parte (`/voices/...` en disco, URL pública o prefirmada en S3).
+
+    El audio no pasa por los workers de la API. HEAD responde 200/404 sin redirigir
+    (una URL prefirmada para GET no vale para HEAD).
+    """
+    if part not in audio_store.PREFIXES:
+        raise HTTPException(status_code=400, detail="part debe ser 'pregunta' o 'respuesta'")
+    store = audio_store.get_store()
+    key = audio_store.audio_key(project_id, num, part)
+    if request.method == "HEAD":
+        st = store.stat(key)
+        if st is None:
+            raise HTTPException(status_code=404, detail="Audio not found")
+        size, version = st
+        return Response(headers={"Content-Type": audio_store.CONTENT_TYPE, "Content-Length": str(size), "ETag": f'"{version}"'})
+    url = store.signed_url(key)
+    if url is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    # no-cache: la URL firmada caduca y el mp3 puede regenerarse
+    return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-cache"})
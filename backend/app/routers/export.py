@@ -0,0 +1,81 @@
+import asyncio
+import io
+from typing import Iterable, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from ..services import csv_store
+from ..services import project_archive
+from ..services import run_control
+from ..services import streaming
+from ..utils import BASE_VOICES_DIR
+
+router = APIRouter(prefix="/api/export", tags=["export"])
+import_router = APIRouter(prefix="/api/import", tags=["export"])
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+
+def _stream(rows: Iterable[dict], fmt: str, request: Request) -> StreamingResponse:
+    encode = streaming.ndjson if fmt == "ndjson" else streaming.json_array
+    encoding = streaming.negotiate_encoding(request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(streaming.compress(encode(rows), encoding), media_type=MEDIA_TYPES[fmt], headers=headers)
+
+
+def _check_project(project_id: str) -> None:
+    # antes de empezar a enviar: después ya no se puede cambiar el status code
+    if not (BASE_VOICES_DIR / project_id).is_dir():
+        raise HTTPException(status_code=404, detail="Project not found")
+
+
+@router.get("/{project_id}/records")
+def export_records(project_id: str, request: Request, format: str = Query("ndjson", pattern="^(ndjson|json)$")):
+    """Registros del proyecto en streaming (NDJSON o array JSON), comprimidos según `Accept-Encoding`."""
+    _check_project(project_id)
+    return _stream(csv_store.stream_records(project_id), format, request)
+
+
+@router.get("/{project_id}/status")
+def export_status_rows(project_id: str, request: Request, format: str = Query("ndjson", pattern="^(ndjson|json)$")):
+    """Filas del CSV de estado del último proceso masivo (`{num, processed, failed, error}`) en streaming."""
+    _check_project(project_id)
+    return _stream(csv_store.stream_status_rows(project_id), format, request)
+
+
+@router.get("/{project_id}/archive")
+def export_archive(project_id: str, gzip: bool = False):
+    """Proyecto completo (registros, `.info`, audios) como tar generado al vuelo, con sha256 por entrada.
+
+    Con `gzip=true` se comprime (`.tar.gz`); los mp3 apenas se comprimen, así que por defecto va sin comprimir.
+    """
+    _check_project(project_id)
+    chunks = project_archive.export_archive(project_id)
+    ext = "tar"
+    media_type = "application/x-tar"
+    if gzip:
+        chunks = streaming.compress(chunks, "gzip")
+        ext = "tar.gz"
+        media_type = "application/gzip"
+    headers = {"Content-Disposition": f'attachment; filename="{project_id}.{ext}"'}
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+
+@import_router.post("")
+async def import_archive(request: Request, project_id: Optional[str] = None):
+    """Importa un archivo de `/api/export/{id}/archive` (tar o tar.gz en el cuerpo), leído en streaming.
+
+    Sin `project_id` se usa el id del archivo. Los audios idénticos (mismo sha256) a los del destino no se
+    reescriben; los registros y el `.info` se sustituyen solo si todos los checksums son correctos.
+    """
+    body = io.BufferedReader(streaming.BodyReader(request.stream(), asyncio.get_running_loop()), project_archive.CHUNK_SIZE)
+    try:
+        result = await run_in_threadpool(project_archive.import_archive, body, project_id)
+    except project_archive.ArchiveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except run_control.RunConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"ok": True, **result}
@@ -1,27 +1,58 @@
-from fastapi import APIRouter, BackgroundTasks
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from ..config import settings
 from ..services import csv_store
 from ..services import llm_processing
+from ..services import llm_routing
+from ..services import dispatcher
+from ..services import prompt_builder
+from ..services import tracing
+from ..services import run_control
+from ..services.project_info import get_config
 from app.services.project_logger import log
 
 router = APIRouter(prefix="/api", tags=["llm"])
 
 
-def run_llm_all_background(project_id: str, overwrite_texts: bool = True, overwrite_prompts: bool = True, project_prompt: str | None = None) -> None:
+def run_llm_all_background(project_id: str, overwrite_texts: bool = True, overwrite_prompts: bool = True, project_prompt: str | None = None,
+                           run: run_control.Run | None = None, routing: bool | None = None) -> None:
     """Worker that runs the LLM processing per-row and updates status CSV."""
-    log(project_id, "run_llm_all_background started")
-    status_path = csv_store.init_status_csv(project_id)
+    with dispatcher.context(dispatcher.BULK, project_id), tracing.job("llm.bulk", project_id):
+        _run_llm_all(project_id, overwrite_texts, overwrite_prompts, project_prompt, run, settings.LLM_ROUTING if routing is None else routing)
+
+
+def _run_llm_all(project_id: str, overwrite_texts: bool, overwrite_prompts: bool, project_prompt: str | None, run: run_control.Run | None = None,
+                 routing: bool = False) -> None:
+    log(project_id, f"run_llm_all_background started routing={routing}")
+    resumed = run is not None and run.resumed
+    status_path = csv_store.init_status_csv(project_id, keep_processed=resumed)
     log(project_id, f"LLM status CSV initialized at {status_path}")
+    # a resumed run skips the rows finished before it was cancelled
+    done = csv_store.processed_nums(project_id) if resumed else set()
+    cancelled = False
     try:
         for num, _ in csv_store.iter_records(project_id):
+            if num in done:
+                continue
             try:
+                if run is not None:
+                    run.checkpoint()
                 # process_one updates the main CSV per-row
-                llm_processing.process_one(project_id, num, overwrite_texts=overwrite_texts, overwrite_prompts=overwrite_prompts, project_prompt=project_prompt)
+                with tracing.span("llm.row", num=num):
+                    llm_processing.process_one(project_id, num, overwrite_texts=overwrite_texts, overwrite_prompts=overwrite_prompts, project_prompt=project_prompt,
+                                               run=run, routing=routing)
                 log(project_id, f"llm processed num={num}")
                 csv_store.mark_status_processed(project_id, num)
+            except run_control.RunCancelled:
+                # the row stays unprocessed (and unchanged): a resumed run starts here
+                log(project_id, f"run_llm_all_background cancelled at num={num}")
+                cancelled = True
+                break
             except Exception as e:
                 log(project_id, f"llm failed num={num}: {e}", level="ERROR")
                 csv_store.mark_status_failed(project_id, num, error=str(e))
     finally:
+        if run is not None:
+            run.finish(cancelled=cancelled)
         log(project_id, "run_llm_all_background finished")
         status = csv_store.read_status(project_id)
         processed = status.get("processed", 0)
@@ -33,17 +64,27 @@ def run_llm_all_background(project_id: str, overwrite_texts: bool = True, overwr
 
 @router.post("/llm/start/{project_id}")
 def llm_start(project_id: str, background_tasks: BackgroundTasks, body: dict | None = None):
-    """Start bulk LLM processing in background. Frontend should poll `/llm/check_status` and `/llm/status_rows` for progress."""
+    """Start bulk LLM processing in background. Frontend should poll `/llm/check_status` and `/llm/status_rows` for progress.
+
+    The run can be paused, resumed and cancelled through `/runs/{project_id}/...`; 409 if another run is in progress.
+    Body (optional): overwrite_texts, overwrite_prompts, project_prompt, routing (per-row model routing, see `/llm/routing`).
+    """
     body = body or {}
     overwrite_texts = bool(body.get("overwrite_texts", True))
     overwrite_prompts = bool(body.get("overwrite_prompts", True))
     project_prompt = body.get("project_prompt")
+    routing = bool(body.get("routing", settings.LLM_ROUTING))
+    try:
+        run = run_control.begin(project_id, "llm", {"overwrite_texts": overwrite_texts, "overwrite_prompts": overwrite_prompts, "project_prompt": project_prompt,
+                                                    "routing": routing})
+    except run_control.RunConflict as e:
+        raise HTTPException(409, str(e))
 
     # initialize status csv immediately
     csv_store.init_status_csv(project_id)
     log(project_id, f"llm_start called - background LLM scheduled overwrite_texts={overwrite_texts} overwrite_prompts={overwrite_prompts}")
-    background_tasks.add_task(run_llm_all_background, project_id, overwrite_texts, overwrite_prompts, project_prompt)
-    return {"ok": True}
+    background_tasks.add_task(run_llm_all_background, project_id, overwrite_texts, overwrite_prompts, project_prompt, run, routing)
+    return {"ok": True, "run_id": run.id}
 
 
 @router.get("/llm/check_status/{project_id}")
@@ -56,3 +97,32 @@ def llm_check_status(project_id: str):
 def llm_status_rows(project_id: str):
     log(project_id, "llm_status_rows called")
     return {"rows": csv_store.get_status_rows(project_id)}
+
+
+@router.get("/llm/prompt/{project_id}")
+def llm_prompt(project_id: str, project_prompt: str | None = None):
+    """Plantillas efectivas, prefijo estable (system + contexto) y uso de la caché de prompts del proyecto."""
+    builder = prompt_builder.get_builder(project_id, project_prompt)
+    return {
+        "templates": prompt_builder.project_templates(get_config(project_id).raw),
+        "prefix": list(builder.prefix),
+        "prefix_hash": builder.prefix_hash,
+        "cache_key": builder.cache_key,
+        "usage": prompt_builder.stats(project_id),
+    }
+
+
+@router.get("/llm/routing/{project_id}")
+def llm_routing_report(project_id: str, overwrite_texts: bool = True, overwrite_prompts: bool = True):
+    """Informe del enrutado por fila del LLM.
+
+    - `stats`: filas, latencia y tokens por ruta (skip | small | full) de lo ya procesado en este proceso,
+      y el ruido detectado.
+    - `preview`: rutas que tomaría ahora cada fila del CSV con esos `overwrite_*` (sin llamar al modelo).
+    """
+    return {
+        "enabled": settings.LLM_ROUTING,
+        "models": {"small": llm_routing.small_model(), "full": settings.OPENAI_MODEL_LLM},
+        "stats": llm_routing.report(project_id),
+        "preview": llm_routing.preview(project_id, overwrite_texts, overwrite_prompts),
+    }
@@ -1,22 +1,76 @@
+from typing import List
 
-from fastapi import APIRouter, UploadFile, File, Form
-from ..services.csv_store import create_csv_from_text
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from ..services.csv_store import create_csv_from_result
+from ..services import batch_ingest
+from ..services import pdf_parser
+from ..services import project_info
+from ..services import tracing
 from ..utils import create_project, get_csv_path
-import pdfplumber
+from app.services.project_logger import log
+import json
 
-router = APIRouter(prefix="/api", tags=["parse"]) 
+router = APIRouter(prefix="/api", tags=["parse"])
 
 @router.post("/upload")
-async def upload_pdf(file: UploadFile = File(...), project_id: str = Form(None)):
+async def upload_pdf(file: UploadFile = File(...), project_id: str = Form(None), speaker_labels: str = Form(None)):
+    """Sube un PDF y crea (o sobreescribe) el CSV del proyecto.
+
+    `speaker_labels` (JSON opcional) define las etiquetas de cada rol, p.ej.
+    `{"pregunta": ["P"], "respuesta": ["R"]}`. Si no se envía se usan las del `.info`
+    del proyecto (`speaker_labels`) o las de por defecto ("Pregunta:"/"Respuesta:").
+    """
     assert file.filename.lower().endswith(".pdf"), "Debe ser un PDF"
     # Si no se pasa project_id, se crea uno nuevo
     project_id = create_project(project_id)
-    # leemos el pdf a memoria y extraemos texto
-    text = ""
-    with pdfplumber.open(file.file) as pdf:
-        for page in pdf.pages:
-            t = page.extract_text() or ""
-            text += "\n" + t
-
-    csv_path = create_csv_from_text(text, project_id=project_id, overwrite=True)
-    return {"ok": True, "csv": str(csv_path), "project_id": project_id}
+    tracing.bind_project(project_id)
+    try:
+        labels = json.loads(speaker_labels) if speaker_labels else project_info.get_config(project_id).raw.get("speaker_labels")
+    except ValueError as e:
+        raise HTTPException(400, f"speaker_labels no es JSON válido: {e}")
+    # extraemos el texto página a página
+    with tracing.span("pdf.extract_text") as sp:
+        pages = pdf_parser.extract_pages(file.file)
+        if sp is not None:
+            sp.set(pages=len(pages))
+
+    try:
+        result = pdf_parser.parse_pages(pages, labels=labels)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    csv_path = create_csv_from_result(result, project_id=project_id, overwrite=True)
+    for issue in result.issues:
+        log(project_id, f"upload_pdf: malformed block kind={issue.kind} page={issue.page} detail={issue.detail}", level="WARNING")
+    return {"ok": True, "csv": str(csv_path), "project_id": project_id, "pairs": len(result.blocks), "malformed": result.report()}
+
+
+@router.post("/upload/batch")
+async def upload_batch(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...), speaker_labels: str = Form(None)):
+    """Sube varios PDFs (o zips con PDFs) y crea un proyecto por PDF, en paralelo.
+
+    El título (y la fecha, si el nombre empieza por AAAA-MM-DD) de cada proyecto sale del nombre
+    del fichero. `speaker_labels` (JSON opcional) se aplica a todos. Responde enseguida con el
+    `id` del lote; el progreso por fichero y el resumen están en `GET /api/upload/batch/{id}`.
+    """
+    try:
+        labels = json.loads(speaker_labels) if speaker_labels else None
+    except ValueError as e:
+        raise HTTPException(400, f"speaker_labels no es JSON válido: {e}")
+    try:
+        state = await run_in_threadpool(batch_ingest.create, [(f.filename, f.file) for f in files], labels)
+    except batch_ingest.BatchTooLarge as e:
+        raise HTTPException(400, str(e))
+    if state["summary"]["queued"]:
+        background_tasks.add_task(batch_ingest.run, state["id"])
+    return state
+
+
+@router.get("/upload/batch/{batch_id}")
+def upload_batch_status(batch_id: str):
+    """Progreso de un lote: estado de cada fichero (queued | running | done | failed, con su
+    `project_id` o `error`) y `summary` con los totales, páginas, pares y ficheros por segundo."""
+    try:
+        return batch_ingest.status(batch_id)
+    except batch_ingest.BatchNotFound:
+        raise HTTPException(404, "Batch not found")
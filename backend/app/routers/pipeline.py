@@ -0,0 +1,79 @@
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from ..services import csv_store
+from ..services import pipeline
+from ..services import tracing
+from ..services import tts_providers
+from ..services import run_control
+from app.services.project_logger import log
+
+router = APIRouter(prefix="/api", tags=["pipeline"])
+
+
+def run_pipeline_background(project_id: str, body: dict, run: run_control.Run | None = None) -> None:
+    """Worker that runs the overlapped LLM -> TTS pipeline and updates status CSV."""
+    with tracing.job("pipeline", project_id):
+        _run_pipeline(project_id, body, run)
+
+
+def _run_pipeline(project_id: str, body: dict, run: run_control.Run | None = None) -> None:
+    log(project_id, "run_pipeline_background started")
+    if run is not None and run.resumed:
+        csv_store.init_status_csv(project_id, keep_processed=True)
+    try:
+        pipeline.run_pipeline(
+            project_id,
+            overwrite_texts=bool(body.get("overwrite_texts", True)),
+            overwrite_prompts=bool(body.get("overwrite_prompts", True)),
+            project_prompt=body.get("project_prompt"),
+            llm_workers=body.get("llm_workers"),
+            tts_workers=body.get("tts_workers"),
+            queue_size=body.get("queue_size"),
+            tts_provider=body.get("provider"),
+            routing=body.get("routing"),
+            run=run,
+        )
+    except Exception as e:
+        log(project_id, f"run_pipeline_background failed: {e}", level="ERROR")
+    finally:
+        if run is not None:
+            run.finish()
+        status = csv_store.read_status(project_id)
+        # Keep the status CSV after completion so frontend polling can read processed==total
+        log(project_id, f"run_pipeline_background finished processed={status.get('processed', 0)} failed={status.get('failed', 0)} total={status.get('total', 0)}")
+
+
+@router.post("/pipeline/start/{project_id}")
+def pipeline_start(project_id: str, background_tasks: BackgroundTasks, body: dict | None = None):
+    """Start LLM cleanup + TTS in one background job; each row is synthesized as soon as its LLM pass ends.
+
+    Body (all optional): overwrite_texts, overwrite_prompts, project_prompt, llm_workers, tts_workers, queue_size,
+    provider (TTS engine: "openai" | "local"; by default the project's).
+    Poll `/pipeline/check_status` and `/pipeline/status_rows` for progress.
+    The run can be paused, resumed and cancelled through `/runs/{project_id}/...`; 409 if another run is in progress.
+    """
+    body = body or {}
+    if body.get("provider"):
+        try:
+            tts_providers.get(body["provider"])
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    try:
+        run = run_control.begin(project_id, "pipeline", body)
+    except run_control.RunConflict as e:
+        raise HTTPException(409, str(e))
+    csv_store.init_status_csv(project_id)
+    log(project_id, f"pipeline_start called - background pipeline scheduled body={body}")
+    background_tasks.add_task(run_pipeline_background, project_id, body, run)
+    return {"ok": True, "run_id": run.id}
+
+
+@router.get("/pipeline/check_status/{project_id}")
+def pipeline_check_status(project_id: str):
+    log(project_id, "pipeline_check_status called")
+    return csv_store.read_status(project_id)
+
+
+@router.get("/pipeline/status_rows/{project_id}")
+def pipeline_status_rows(project_id: str):
+    log(project_id, "pipeline_status_rows called")
+    return {"rows": csv_store.get_status_rows(project_id)}
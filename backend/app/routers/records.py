@@ -1,21 +1,54 @@
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from ..services import csv_store
-from ..models import Record, UpdateRecord, LLMProcessRequest, LLMProcessOneRequest
+from ..services import project_catalog
+from ..services import dispatcher
+from ..services import singleflight
+from ..services import record_edits
+from ..services import streaming
+from ..services import speculative
+from ..services import audio_store
+from ..services import search_index
+from ..models import Record, UpdateRecord, BatchUpdateRequest, LLMProcessRequest, LLMProcessOneRequest
 from ..services.llm_processing import process_all
 from ..services.llm_processing import process_one
-from ..services.project_info import read_info
-from ..utils import get_csv_path, list_projects, BASE_VOICES_DIR
-import pandas as pd
+from ..services.llm_processing import stream_one
+from ..services.project_info import get_config
+from ..utils import get_csv_path, BASE_VOICES_DIR
 from app.services.project_logger import log
 import logging
 
 router = APIRouter(prefix="/api", tags=["records"]) 
 
-# Endpoint para listar proyectos
+# Endpoint para listar proyectos (desde el catálogo; ver services/project_catalog.py)
 @router.get("/projects")
-def get_projects():
-    return list_projects()
+def get_projects(
+    response: Response,
+    q: str | None = None,
+    sort: str = "title",
+    order: str = "asc",
+    offset: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1, le=1000),
+):
+    """Lista proyectos con búsqueda por subcadena (`q`), orden y paginación.
+
+    Devuelve la página como lista (compatible con clientes anteriores) y el total
+    de coincidencias en la cabecera `X-Total-Count`.
+    """
+    try:
+        projects, total = project_catalog.list_projects(q=q, sort=sort, order=order, offset=offset, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["X-Total-Count"] = str(total)
+    return projects
+
+
+@router.post("/projects/catalog/rebuild")
+def rebuild_project_catalog():
+    """Reconstruye el catálogo escaneando `static/voices` (carpetas editadas a mano)."""
+    n = project_catalog.rebuild()
+    return {"ok": True, "projects": n}
 
 
 @router.post('/projects')
@@ -36,15 +69,20 @@ def post_create_project(body: dict):
 
 @router.delete('/projects/{project_id}')
 def delete_project(project_id: str):
-    """Eliminar un proyecto y su carpeta de datos (audios, csv, .info).
+    """Eliminar un proyecto, sus audios (audio store) y su carpeta de datos (csv, .info).
     Devuelve 404 si no existe. Registra la operación en el logger del proyecto.
     """
     try:
         proj_dir = BASE_VOICES_DIR / project_id
         if not proj_dir.exists():
             raise HTTPException(status_code=404, detail="Project not found")
+        # audio first (a bucket in multi-node setups), then the project folder
+        removed = audio_store.get_store().delete_project(project_id)
+        log(project_id, f"delete_project removed {removed} audio blobs")
         import shutil
         shutil.rmtree(proj_dir)
+        project_catalog.remove_project(project_id)
+        search_index.remove_project(project_id)
         return {"ok": True}
     except HTTPException:
         raise
@@ -56,12 +94,7 @@ def delete_project(project_id: str):
 def list_records(project_id: str):
     try:
         log(project_id, "list_records called")
-        df = csv_store.read_csv(project_id)
-        # Reemplaza NaN, pd.NA e infinitos por None para compatibilidad JSON
-        df = df.replace({pd.NA: None, float('nan'): None, float('inf'): None, float('-inf'): None})
-        df = df.where(pd.notnull(df), None)
-        records = df.to_dict(orient="records")
-        return records
+        return csv_store.read_records(project_id).to_dicts()
     except Exception as e:
         # Devuelve el error en la respuesta para depuración
         raise HTTPException(status_code=500, detail=f"Error al procesar records: {e}")
@@ -70,12 +103,41 @@ def list_records(project_id: str):
 def patch_record(project_id: str, num: int, body: UpdateRecord):
     try:
         log(project_id, f"patch_record called num={num} updates={list(body.model_dump(exclude_none=True).keys())}")
-        rec = csv_store.update_record(project_id, num, **body.model_dump(exclude_none=True))
+        # the changed columns come from the write itself (under the project lock)
+        rec, changed = csv_store.update_record_changes(project_id, num, **body.model_dump(exclude_none=True))
     except Exception as e:
         log(project_id, f"patch_record failed num={num}: {e}", level="ERROR")
         raise HTTPException(status_code=400, detail=str(e))
+    if changed and speculative.enabled(project_id):
+        speculative.schedule(project_id, num, changed)
     return rec
 
+@router.post("/records/{project_id}/batch")
+def batch_update_records(project_id: str, body: BatchUpdateRequest):
+    """Varias ediciones `{num, fields}` y un buscar/reemplazar opcional, escritos de una vez.
+
+    Devuelve un resultado por fila (`ok`, `fields` o `error`) y los registros modificados.
+    Con `all_or_nothing` (por defecto) cualquier fila inválida cancela el lote (400).
+    """
+    try:
+        result = record_edits.apply_batch(
+            project_id,
+            [(u.num, u.fields.model_dump(exclude_none=True)) for u in body.updates],
+            find_replace=body.find_replace.model_dump() if body.find_replace else None,
+            all_or_nothing=body.all_or_nothing,
+            dry_run=body.dry_run,
+        )
+    except ValueError as e:
+        log(project_id, f"batch_update_records failed: {e}", level="ERROR")
+        raise HTTPException(status_code=400, detail=str(e))
+    if not result["ok"] and body.all_or_nothing:
+        raise HTTPException(status_code=400, detail=result)
+    if result["written"]:
+        for r in result["results"]:
+            if r["ok"]:
+                speculative.schedule(project_id, r["num"], r["fields"])
+    return result
+
 @router.get("/csv/{project_id}")
 def get_csv_path_api(project_id: str):
     return {"path": str(get_csv_path(project_id))}
@@ -86,7 +148,8 @@ def llm_process(project_id: str, body: LLMProcessRequest):
     al LLM como contexto adicional para guiar la limpieza y las entonaciones.
     """
     log(project_id, "llm_process called - process_all start")
-    n = process_all(project_id, body.overwrite_texts, body.overwrite_prompts, project_prompt=body.project_prompt)
+    with dispatcher.context(dispatcher.BULK, project_id):
+        n = process_all(project_id, body.overwrite_texts, body.overwrite_prompts, project_prompt=body.project_prompt, routing=body.routing)
     log(project_id, f"llm_process completed - processed={n}")
     return {"processed": n}
 
@@ -97,16 +160,63 @@ def llm_process_one(project_id: str, num: int, body: LLMProcessOneRequest):
     """
     try:
         log(project_id, f"llm_process_one called num={num} part={body.part}")
-        # read project-level prompt from .info and pass it to the processing function
-        try:
-            info = read_info(project_id) or {}
-            project_prompt = info.get("project_prompt")
-        except Exception:
-            project_prompt = None
+        # read project-level prompt from the cached .info and pass it to the processing function
+        project_prompt = get_config(project_id).project_prompt
+        row = csv_store.get_record(project_id, num)
+        before = row if speculative.enabled(project_id) else None
+
+        def run():
+            # interactive: jumps ahead of bulk runs waiting for an LLM slot
+            with dispatcher.context(dispatcher.INTERACTIVE, project_id):
+                return process_one(project_id, num, body.overwrite_texts, body.overwrite_prompts, part=body.part, project_prompt=project_prompt)
 
-        updated = process_one(project_id, num, body.overwrite_texts, body.overwrite_prompts, part=body.part, project_prompt=project_prompt)
-        log(project_id, f"llm_process_one completed num={num}")
+        # identical requests on the same row text share one LLM call and its result
+        # (writes to other rows, e.g. a bulk run, do not split them)
+        content = tuple(row.get(c) for c in ("pregunta", "respuesta", "entonacion_p", "entonacion_r")) if row else None
+        key = singleflight.fingerprint("llm", project_id, num, body.part, body.overwrite_texts, body.overwrite_prompts, project_prompt, content)
+        updated, shared = singleflight.llm_calls.do(key, run)
+        log(project_id, f"llm_process_one completed num={num} coalesced={shared}")
     except Exception as e:
         log(project_id, f"llm_process_one failed num={num}: {e}", level="ERROR")
         raise HTTPException(status_code=400, detail=str(e))
-    return {"ok": True, "record": updated}
+    if before is not None and not shared:
+        speculative.schedule(project_id, num, speculative.changed_fields(before, updated))
+    return {"ok": True, "record": updated, "coalesced": shared}
+
+
+@router.post("/llm/process/{project_id}/{num}/stream")
+def llm_process_one_stream(project_id: str, num: int, body: LLMProcessOneRequest):
+    """Como `llm_process_one`, pero envía la salida del modelo por SSE según se genera.
+
+    Eventos: `delta` ({field, text}) para `pregunta_limpia`, `respuesta_limpia`,
+    `entonacion_p` y `entonacion_r`, en ese orden; `record` ({record}) cuando el
+    objeto completo valida y se ha guardado; `error` ({detail}) si falla. Si la
+    salida no llega completa, el registro no se modifica.
+    """
+    log(project_id, f"llm_process_one_stream called num={num} part={body.part}")
+    # antes de empezar a enviar: después ya no se puede cambiar el status code
+    before = csv_store.get_record(project_id, num)
+    if before is None:
+        raise HTTPException(status_code=400, detail="Registro no encontrado")
+    project_prompt = get_config(project_id).project_prompt
+
+    def events(stop):
+        # interactive: jumps ahead of bulk runs waiting for an LLM slot
+        with dispatcher.context(dispatcher.INTERACTIVE, project_id):
+            yield from stream_one(project_id, num, body.overwrite_texts, body.overwrite_prompts, part=body.part, project_prompt=project_prompt,
+                                  stop=stop)
+
+    async def messages():
+        try:
+            async for event, data in streaming.in_thread(events, name=f"llm-stream-{num}"):
+                if event == "record":
+                    speculative.schedule(project_id, num, speculative.changed_fields(before, data["record"]))
+                yield streaming.sse(event, data)
+            log(project_id, f"llm_process_one_stream completed num={num}")
+        except Exception as e:
+            log(project_id, f"llm_process_one_stream failed num={num}: {e}", level="ERROR")
+            yield streaming.sse("error", {"detail": str(e)})
+
+    # no-transform / X-Accel-Buffering: que los proxies no acumulen el stream
+    headers = {"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"}
+    return StreamingResponse(messages(), media_type="text/event-stream", headers=headers)
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from ..services import csv_store
+from ..services import run_control
+from .tts import run_tts_all_background
+from .llm import run_llm_all_background
+from .pipeline import run_pipeline_background
+from app.services.project_logger import log
+
+router = APIRouter(prefix="/api", tags=["runs"])
+
+
+@router.get("/runs/{project_id}")
+def run_status(project_id: str):
+    """Estado de la ejecución masiva actual o la última del proyecto (TTS, LLM o pipeline).
+
+    `state`: running | paused | cancelling | cancelled | done. El progreso por fila sigue en `check_status`.
+    """
+    return {"project_id": project_id, "run": run_control.status(project_id)}
+
+
+@router.post("/runs/{project_id}/pause")
+def run_pause(project_id: str):
+    """Pausa la ejecución en curso: las llamadas en vuelo terminan y se espera antes de la siguiente fila o parte."""
+    try:
+        state = run_control.pause(project_id)
+    except run_control.RunStateError as e:
+        raise HTTPException(409, str(e))
+    return {"ok": True, "run": state}
+
+
+@router.post("/runs/{project_id}/cancel")
+def run_cancel(project_id: str):
+    """Cancela la ejecución en curso: se abortan las llamadas en vuelo y se conserva todo lo ya generado."""
+    try:
+        state = run_control.cancel(project_id)
+    except run_control.RunStateError as e:
+        raise HTTPException(409, str(e))
+    return {"ok": True, "run": state}
+
+
+@router.post("/runs/{project_id}/resume")
+def run_resume(project_id: str, background_tasks: BackgroundTasks):
+    """Reanuda una ejecución pausada, o relanza una cancelada desde la primera fila sin terminar
+    (con los mismos parámetros con los que se inició)."""
+    try:
+        state, restart = run_control.resume(project_id)
+        if restart:
+            params = state.get("params") or {}
+            run = run_control.begin(project_id, state["kind"], params, resume=True)
+    except (run_control.RunStateError, run_control.RunConflict) as e:
+        raise HTTPException(409, str(e))
+    if not restart:
+        return {"ok": True, "run": state, "restarted": False}
+
+    csv_store.init_status_csv(project_id, keep_processed=True)
+    log(project_id, f"run_resume: restarting {run.kind} run {state['id']} as {run.id}")
+    if run.kind == "tts":
+        background_tasks.add_task(run_tts_all_background, project_id, params.get("provider"), run)
+    elif run.kind == "llm":
+        background_tasks.add_task(
+            run_llm_all_background, project_id,
+            bool(params.get("overwrite_texts", True)), bool(params.get("overwrite_prompts", True)), params.get("project_prompt"), run,
+            params.get("routing"),
+        )
+    else:
+        background_tasks.add_task(run_pipeline_background, project_id, params, run)
+    return {"ok": True, "run": run_control.status(project_id), "restarted": True}
@@ -0,0 +1,40 @@
+import time
+from fastapi import APIRouter, HTTPException, Query
+from ..services import search_index
+
+router = APIRouter(prefix="/api", tags=["search"])
+
+
+@router.get("/search")
+def search(
+    q: str,
+    project: list[str] | None = Query(None),
+    field: list[str] | None = Query(None),
+    raw: bool = False,
+    limit: int = Query(20, ge=1, le=search_index.MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+):
+    """Búsqueda de texto completo en los bloques de todos los proyectos.
+
+    - `q`: palabras (coincidencia por prefijo, sin distinguir tildes) y "frases exactas";
+      con `raw=true`, sintaxis FTS5 (OR, NOT, NEAR(...)).
+    - `project` / `field` (repetibles): limitar a esos proyectos / columnas.
+
+    Devuelve los bloques ordenados por relevancia (bm25) con fragmentos resaltados
+    (`snippets[campo]`: lista de trozos, los impares son la coincidencia), el número
+    de coincidencias por proyecto y `took_ms`.
+    """
+    t0 = time.perf_counter()
+    try:
+        out = search_index.search(q, projects=project, fields=field, raw=raw, limit=limit, offset=offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    out["took_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return out
+
+
+@router.post("/search/rebuild")
+def rebuild_search_index():
+    """Reconstruye el índice de búsqueda desde los CSV de todos los proyectos."""
+    n = search_index.rebuild()
+    return {"ok": True, "rows": n}
@@ -0,0 +1,77 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+from ..services import run_control
+from ..services import snapshots
+from ..utils import BASE_VOICES_DIR
+
+router = APIRouter(prefix="/api/snapshots", tags=["snapshots"])
+
+
+def _check_project(project_id: str) -> None:
+    if not (BASE_VOICES_DIR / project_id).is_dir():
+        raise HTTPException(status_code=404, detail="Project not found")
+
+
+@router.get("/{project_id}")
+def list_snapshots(project_id: str):
+    """Instantáneas del proyecto, de la más reciente a la más antigua."""
+    _check_project(project_id)
+    return {"project_id": project_id, "snapshots": snapshots.list_snapshots(project_id)}
+
+
+@router.post("/{project_id}")
+def create_snapshot(project_id: str, body: dict | None = None):
+    """Crea una instantánea del estado actual (registros, `.info` y audios).
+
+    Body (opcional): name. Los audios que no han cambiado se comparten con las instantáneas anteriores.
+    """
+    _check_project(project_id)
+    name = (body or {}).get("name")
+    return {"ok": True, "snapshot": snapshots.create(project_id, str(name) if name else None)}
+
+
+@router.get("/{project_id}/{snapshot_id}")
+def get_snapshot(project_id: str, snapshot_id: str):
+    """Manifiesto completo de una instantánea (incluye el sha256 de cada audio)."""
+    _check_project(project_id)
+    try:
+        return snapshots.get(project_id, snapshot_id)
+    except snapshots.SnapshotNotFound:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
+
+@router.get("/{project_id}/{snapshot_id}/diff")
+def diff_snapshot(project_id: str, snapshot_id: str, against: Optional[str] = None):
+    """Cambios desde la instantánea hasta `against` (otra instantánea) o, sin él, hasta el estado actual."""
+    _check_project(project_id)
+    try:
+        return snapshots.diff(project_id, snapshot_id, against)
+    except snapshots.SnapshotNotFound:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
+
+@router.post("/{project_id}/{snapshot_id}/restore")
+def restore_snapshot(project_id: str, snapshot_id: str, backup: bool = True):
+    """Restaura registros, `.info` y audios de la instantánea.
+
+    Con `backup=true` (por defecto) antes se guarda una instantánea del estado actual. 409 si hay una ejecución masiva en curso.
+    """
+    _check_project(project_id)
+    try:
+        return {"ok": True, **snapshots.restore(project_id, snapshot_id, backup)}
+    except snapshots.SnapshotNotFound:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    except run_control.RunConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.delete("/{project_id}/{snapshot_id}")
+def delete_snapshot(project_id: str, snapshot_id: str):
+    """Borra la instantánea y los contenidos que ya no usa ninguna otra."""
+    _check_project(project_id)
+    try:
+        freed = snapshots.delete(project_id, snapshot_id)
+    except snapshots.SnapshotNotFound:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return {"ok": True, "freed_bytes": freed}
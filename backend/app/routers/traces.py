@@ -0,0 +1,35 @@
+import datetime
+from fastapi import APIRouter, HTTPException, Query
+from ..services import tracing
+
+router = APIRouter(prefix="/api", tags=["traces"])
+
+
+@router.get("/traces/{project_id}")
+def list_traces(
+    project_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    date: datetime.date | None = None,
+    kind: str | None = Query(None, pattern="^(request|job)$"),
+    min_ms: float = Query(0.0, ge=0),
+):
+    """Trazas recientes del proyecto (peticiones y jobs en segundo plano), de la más nueva a la más antigua.
+
+    `date` (YYYY-MM-DD) limita a un día; `kind` a `request` o `job`; `min_ms` a las más lentas.
+    """
+    return {"project_id": project_id, "traces": tracing.list_traces(project_id, limit=limit, date=date, kind=kind, min_ms=min_ms)}
+
+
+@router.get("/traces/{project_id}/{trace_id}")
+def get_trace(project_id: str, trace_id: str, min_ms: float = Query(0.0, ge=0)):
+    """Vista en cascada de una traza: spans con `offset_ms`, `duration_ms` y `depth`,
+    resumen de tiempo por nombre de span y jobs lanzados desde ella (`linked`).
+
+    `min_ms` oculta los spans más cortos (siguen contando en el resumen).
+    """
+    if not trace_id.isalnum():
+        raise HTTPException(400, "trace_id no válido")
+    out = tracing.waterfall(project_id, trace_id, min_ms=min_ms)
+    if out is None:
+        raise HTTPException(404, "Traza no encontrada")
+    return out
@@ -1,7 +1,15 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from ..services import csv_store
 from ..services import project_info
-from ..services.tts_service import synthesize_block, synthesize
+from ..services import project_catalog
+from ..services import dispatcher
+from ..services import singleflight
+from ..services import speculative
+from ..services import audio_store
+from ..services import tracing
+from ..services import tts_providers
+from ..services import run_control
+from ..services.tts_service import synthesize_block, synthesize, project_tts
 from ..models import TTSOneRequest
 from ..utils import get_project_dir
 from pathlib import Path
@@ -10,34 +18,58 @@ from app.services.project_logger import log
 router = APIRouter(prefix="/api", tags=["tts"]) 
 
 
-def run_tts_all_background(project_id: str) -> None:
+def run_tts_all_background(project_id: str, provider: str | None = None, run: run_control.Run | None = None) -> None:
     """Worker that runs the TTS bulk and updates status CSV."""
+    with dispatcher.context(dispatcher.BULK, project_id), tracing.job("tts.bulk", project_id):
+        _run_tts_all(project_id, provider, run)
+
+
+def _run_tts_all(project_id: str, provider_name: str | None = None, run: run_control.Run | None = None) -> None:
     log(project_id, "run_tts_all_background started")
-    status_path = csv_store.init_status_csv(project_id)
+    resumed = run is not None and run.resumed
+    status_path = csv_store.init_status_csv(project_id, keep_processed=resumed)
     log(project_id, f"Status CSV initialized at {status_path}")
-    # Read project defaults (.info) once at start
-    info = project_info.read_info(project_id)
+    # a resumed run skips the rows finished before it was cancelled
+    done = csv_store.processed_nums(project_id) if resumed else set()
+    cancelled = False
     try:
+        # Read project defaults (.info) once at start
+        provider, voice_q, voice_r = project_tts(project_id, provider_name)
+        log(project_id, f"run_tts_all_background provider={provider.name}")
         for num, row in csv_store.iter_records(project_id):
+            if num in done:
+                continue
             try:
+                if run is not None:
+                    run.checkpoint()
                 # pass voices from info when synthesizing
-                synthesize_block(
-                    project_id,
-                    num,
-                    row["pregunta"],
-                    row["respuesta"],
-                    entonacion_p=row.get("entonacion_p"),
-                    entonacion_r=row.get("entonacion_r"),
-                    voice_q=info.get("voices", {}).get("interviewer"),
-                    voice_r=info.get("voices", {}).get("interviewee"),
-                )
+                with tracing.span("tts.row", num=num):
+                    synthesize_block(
+                        project_id,
+                        num,
+                        row["pregunta"],
+                        row["respuesta"],
+                        entonacion_p=row.get("entonacion_p"),
+                        entonacion_r=row.get("entonacion_r"),
+                        voice_q=voice_q,
+                        voice_r=voice_r,
+                        provider=provider,
+                        run=run,
+                    )
                 log(project_id, f"synthesized block num={num}")
                 csv_store.mark_status_processed(project_id, num)
+            except run_control.RunCancelled:
+                # the row stays unprocessed: a resumed run starts here
+                log(project_id, f"run_tts_all_background cancelled at num={num}")
+                cancelled = True
+                break
             except Exception as e:
                 # mark failed with a short error message
                 log(project_id, f"synthesis failed num={num}: {e}", level="ERROR")
                 csv_store.mark_status_failed(project_id, num, error=str(e))
     finally:
+        if run is not None:
+            run.finish(cancelled=cancelled)
         log(project_id, "run_tts_all_background finished")
         # Eliminar el CSV de estado si todas las filas fueron procesadas o marcadas como fallidas
         status = csv_store.read_status(project_id)
@@ -52,13 +84,27 @@ def run_tts_all_background(project_id: str) -> None:
 
 
 @router.post("/tts/start/{project_id}")
-def tts_start(project_id: str, background_tasks: BackgroundTasks):
-    """Start bulk TTS in background. Returns immediately. Frontend should poll `/tts/check_status` and `/tts/status_rows` for log."""
+def tts_start(project_id: str, background_tasks: BackgroundTasks, body: dict | None = None):
+    """Start bulk TTS in background. Returns immediately. Frontend should poll `/tts/check_status` and `/tts/status_rows` for log.
+
+    Body (optional): provider ("openai" | "local") to override the project's TTS engine for this run.
+    The run can be paused, resumed and cancelled through `/runs/{project_id}/...`; 409 if another run is in progress.
+    """
+    provider = (body or {}).get("provider")
+    if provider:
+        try:
+            tts_providers.get(provider)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    try:
+        run = run_control.begin(project_id, "tts", {"provider": provider})
+    except run_control.RunConflict as e:
+        raise HTTPException(409, str(e))
     # initialize status csv immediately
     csv_store.init_status_csv(project_id)
-    log(project_id, "tts_start called - background TTS scheduled")
-    background_tasks.add_task(run_tts_all_background, project_id)
-    return {"ok": True}
+    log(project_id, f"tts_start called - background TTS scheduled provider={provider}")
+    background_tasks.add_task(run_tts_all_background, project_id, provider, run)
+    return {"ok": True, "run_id": run.id}
 
 
 @router.get('/projects/{project_id}/info')
@@ -95,38 +141,57 @@ def tts_status_rows(project_id: str):
 @router.post("/tts/{project_id}/{num}")
 def tts_one(project_id: str, num: int, body: TTSOneRequest):
     log(project_id, f"tts_one called num={num} part={body.part}")
-    df = csv_store.read_csv(project_id)
-    idx = df.index[df["num"] == num]
-    if len(idx) == 0:
+    row = csv_store.get_record(project_id, num)
+    if row is None:
         raise HTTPException(404, "Registro no encontrado")
-    row = df.loc[idx[0]]
 
     part = body.part.lower()
     if part not in ("pregunta", "respuesta"):
         raise HTTPException(400, "part debe ser 'pregunta' o 'respuesta'")
 
+    try:
+        provider, voice_q, voice_r = project_tts(project_id, body.provider)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     voice = body.voice_override
     if not voice:
-        voice = "onyx" if part == "pregunta" else "sage"
+        if part == "pregunta":
+            voice = voice_q or provider.default_voice("interviewer")
+        else:
+            voice = voice_r or provider.default_voice("interviewee")
+    try:
+        provider.check_voice(voice)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
 
     text = row[part]
     out_dir = get_project_dir(project_id) / str(num)
-    out_dir.mkdir(parents=True, exist_ok=True)
     out_file = out_dir / (f"p{num}.mp3" if part == "pregunta" else f"r{num}.mp3")
 
     # En lugar de concatenar guidance+texto, pasamos `input` e `instructions` separados
     guidance = (body.prompt_override or row["entonacion_p" if part == "pregunta" else "entonacion_r"]) or None
 
+    # an explicit render replaces any pending speculative one of this part
+    speculative.cancel(project_id, num, part)
+
+    def run():
+        log(project_id, f"synthesizing one file num={num} out={out_file} provider={provider.name} voice={voice}")
+        # interactive: jumps ahead of bulk runs waiting for a TTS slot
+        with dispatcher.context(dispatcher.INTERACTIVE, project_id):
+            synthesize(text, out_file, voice, instructions=guidance, provider=provider)
+        project_catalog.mark_dirty(project_id)
+
+    # identical concurrent requests (double click, several tabs) share one provider call
+    key = singleflight.fingerprint("tts", project_id, num, part, text, voice, guidance, provider.model)
     # synthesize ahora acepta (input_text, out_path, voice, instructions=None)
     try:
-        log(project_id, f"synthesizing one file num={num} out={out_file} voice={voice}")
-        synthesize(text, out_file, voice, instructions=guidance)
-        log(project_id, f"tts_one completed num={num} file={out_file}")
+        _, shared = singleflight.tts_calls.do(key, run)
+        log(project_id, f"tts_one completed num={num} file={out_file} coalesced={shared}")
     except Exception as e:
         log(project_id, f"tts_one failed num={num}: {e}", level="ERROR")
         raise HTTPException(500, str(e))
 
-    return {"ok": True, "file": str(out_file)}
+    return {"ok": True, "file": str(out_file), "coalesced": shared}
 
 
 @router.delete("/tts/{project_id}/{num}/{part}")
@@ -139,38 +204,19 @@ def tts_delete(project_id: str, num: int, part: str):
     if p not in ("pregunta", "respuesta", "all"):
         raise HTTPException(400, "part debe ser 'pregunta', 'respuesta' o 'all'")
 
-    out_dir = get_project_dir(project_id) / str(num)
+    store = audio_store.get_store()
     removed = []
 
-    if p in ("pregunta", "all"):
-        f = out_dir / f"p{num}.mp3"
-        if f.exists():
-            try:
-                f.unlink()
-                removed.append(str(f))
-                log(project_id, f"tts_delete removed file {f}")
-            except Exception:
-                log(project_id, f"tts_delete failed to remove file {f}", level="ERROR")
-                pass
-
-    if p in ("respuesta", "all"):
-        f = out_dir / f"r{num}.mp3"
-        if f.exists():
-            try:
-                f.unlink()
-                removed.append(str(f))
-                log(project_id, f"tts_delete removed file {f}")
-            except Exception:
-                log(project_id, f"tts_delete failed to remove file {f}", level="ERROR")
-                pass
-
-    # intentar borrar el directorio si queda vacío
-    try:
-        if out_dir.exists() and not any(out_dir.iterdir()):
-            out_dir.rmdir()
-            log(project_id, f"tts_delete removed dir {out_dir}")
-    except Exception:
-        log(project_id, f"tts_delete failed to remove dir {out_dir}", level="ERROR")
-        pass
+    for name in (("pregunta", "respuesta") if p == "all" else (p,)):
+        key = audio_store.audio_key(project_id, num, name)
+        try:
+            if store.delete(key):
+                removed.append(key)
+                log(project_id, f"tts_delete removed {store.name}:{key}")
+        except Exception as e:
+            log(project_id, f"tts_delete failed to remove {store.name}:{key}: {e}", level="ERROR")
+
+    if removed:
+        project_catalog.mark_dirty(project_id)
 
     return {"ok": True, "removed": removed}
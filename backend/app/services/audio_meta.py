@@ -0,0 +1,468 @@
+"""Audio metadata of the generated mp3s: duration, size and waveform peaks.
+
+Everything is read from the MP3 frame headers, without decoding audio:
+
+- duration: frames are walked header to header (frame length from bitrate,
+  sample rate and padding), summing samples per frame. ID3v2/ID3v1 tags and
+  the Xing/Info/VBRI frame of VBR files are skipped.
+- peaks: a loudness envelope from the Layer III side info. Each granule's
+  `global_gain` sets its quantizer step (1.5 dB per unit); granules with no
+  coded bits are silent. Levels are mapped to 0-255 over a `PEAK_RANGE_DB`
+  window below the file's loudest granule and max-pooled to `PEAKS` buckets.
+
+`update(key, data, version)` is called after every synthesis. The per-project
+index lives in `<project>/.audio_index.json` (peaks base64-encoded), and
+`update` appends the new entry to `<project>/.audio_index.jsonl` instead of
+rewriting the index, so a bulk run of N parts does not rewrite it N times. The
+journal is folded into the index when it outgrows it and whenever the index is
+rewritten. On read, entries are checked against the size/version of the blobs
+in the audio store, so files added, replaced or deleted by other means (bulk
+runs in other workers, deletes, older projects) are rescanned lazily. Stale
+files are read and scanned outside the index lock and merged back under it.
+Entries also keep the sha256 of the file (`content_hash`), used to skip
+identical audio on import.
+"""
+from __future__ import annotations
+import base64
+import hashlib
+import json
+import math
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from ..utils import get_project_dir
+from . import audio_store
+from . import csv_store
+from . import locks
+from . import tracing
+from app.services.project_logger import log
+
+INDEX_NAME = ".audio_index.json"
+JOURNAL_NAME = ".audio_index.jsonl"
+# the journal is folded into the index once it is larger than the index and this size
+JOURNAL_MIN_BYTES = 64 * 1024
+INDEX_VERSION = 2
+PEAKS = 100
+PEAK_RANGE_DB = 48.0
+
+# bitrate (kbps) by [version is MPEG1][layer][index]; layer 1..3
+_BITRATES = {
+    True: {
+        1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    },
+    False: {
+        1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    },
+}
+# sample rates by version bits (0 = MPEG2.5, 2 = MPEG2, 3 = MPEG1)
+_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+
+
+class FrameHeader:
+    __slots__ = ("mpeg1", "layer", "crc", "bitrate", "sample_rate", "padding", "channels", "length", "samples")
+
+    def __init__(self, b: bytes):
+        version = (b[1] >> 3) & 3
+        self.mpeg1 = version == 3
+        self.layer = 4 - ((b[1] >> 1) & 3)
+        self.crc = not (b[1] & 1)
+        self.bitrate = _BITRATES[self.mpeg1][self.layer][b[2] >> 4] * 1000
+        self.sample_rate = _SAMPLE_RATES[version][(b[2] >> 2) & 3]
+        self.padding = (b[2] >> 1) & 1
+        self.channels = 1 if (b[3] >> 6) == 3 else 2
+        if self.layer == 1:
+            self.samples = 384
+            self.length = (12 * self.bitrate // self.sample_rate + self.padding) * 4
+        else:
+            self.samples = 1152 if (self.layer == 2 or self.mpeg1) else 576
+            self.length = (self.samples // 8) * self.bitrate // self.sample_rate + self.padding
+
+    @staticmethod
+    def valid(b: bytes) -> bool:
+        """Sync word, known version/layer, no free-format/bad bitrate, known sample rate."""
+        return (
+            len(b) >= 4
+            and b[0] == 0xFF
+            and (b[1] & 0xE0) == 0xE0
+            and ((b[1] >> 3) & 3) != 1
+            and ((b[1] >> 1) & 3) != 0
+            and 0 < (b[2] >> 4) < 15
+            and ((b[2] >> 2) & 3) != 3
+        )
+
+    @property
+    def side_info_size(self) -> int:
+        if self.mpeg1:
+            return 17 if self.channels == 1 else 32
+        return 9 if self.channels == 1 else 17
+
+
+def _id3v2_size(data: bytes) -> int:
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    return 10 + size + (10 if data[5] & 0x10 else 0)
+
+
+def iter_frames(data: bytes) -> Iterator[Tuple[int, FrameHeader]]:
+    """(offset, header) of each audio frame, resyncing past garbage between frames."""
+    pos, end = _id3v2_size(data), len(data)
+    if end >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    synced = None  # (mpeg1, layer, sample_rate) of the previous frame
+    while pos + 4 <= end:
+        if FrameHeader.valid(data[pos:pos + 4]):
+            h = FrameHeader(data[pos:pos + 4])
+            nxt = pos + h.length
+            # accept if the frame fits and is followed by another header (or the end),
+            # or continues the stream we are already in sync with
+            if h.length > 4 and nxt <= end and (
+                nxt + 4 > end
+                or FrameHeader.valid(data[nxt:nxt + 4])
+                or synced == (h.mpeg1, h.layer, h.sample_rate)
+            ):
+                yield pos, h
+                synced = (h.mpeg1, h.layer, h.sample_rate)
+                pos = nxt
+                continue
+        synced = None
+        pos = data.find(b"\xff", pos + 1, end)
+        if pos < 0:
+            return
+
+
+def _is_info_frame(data: bytes, pos: int, h: FrameHeader) -> bool:
+    """Xing/Info (LAME) or VBRI header frame: metadata, not audio."""
+    off = pos + 4 + (2 if h.crc else 0) + h.side_info_size
+    return data[off:off + 4] in (b"Xing", b"Info") or data[pos + 36:pos + 40] == b"VBRI"
+
+
+def _granule_gains(data: bytes, pos: int, h: FrameHeader) -> list[Optional[int]]:
+    """global_gain of every granule/channel of a Layer III frame (None when nothing is coded)."""
+    side = data[pos + 4 + (2 if h.crc else 0):][:h.side_info_size]
+    if len(side) < h.side_info_size:
+        return []
+    nch = h.channels
+    if h.mpeg1:
+        # main_data_begin(9) private(5|3) scfsi(4/ch), then 59 bits per granule/channel
+        base, per, granules = 9 + (5 if nch == 1 else 3) + 4 * nch, 59, 2
+    else:
+        # main_data_begin(8) private(1|2), then 63 bits per channel, one granule
+        base, per, granules = 8 + (1 if nch == 1 else 2), 63, 1
+    bits = int.from_bytes(side, "big")
+    total = len(side) * 8
+    gains = []
+    for i in range(granules * nch):
+        start = base + i * per
+        part2_3_length = (bits >> (total - start - 12)) & 0xFFF
+        gains.append((bits >> (total - start - 29)) & 0xFF if part2_3_length else None)
+    return gains
+
+
+def scan(data: bytes, peaks: int = PEAKS) -> dict:
+    """Duration, frame stats and waveform peaks of an MP3 held in memory."""
+    frames = samples = 0
+    sample_rate = bitrate_sum = 0
+    levels: list[float] = []  # per frame, in dB relative to 2^0 (None-coded -> -inf)
+    for i, (pos, h) in enumerate(iter_frames(data)):
+        if i == 0 and _is_info_frame(data, pos, h):
+            continue
+        frames += 1
+        samples += h.samples
+        sample_rate = h.sample_rate
+        bitrate_sum += h.bitrate
+        if h.layer == 3:
+            gains = [g for g in _granule_gains(data, pos, h) if g is not None]
+            levels.append(max(gains) * 1.5 if gains else -math.inf)
+    duration_ms = round(samples * 1000 / sample_rate) if sample_rate else 0
+    return {
+        "bytes": len(data),
+        "duration_ms": duration_ms,
+        "frames": frames,
+        "sample_rate": sample_rate,
+        "bitrate_kbps": round(bitrate_sum / frames / 1000) if frames else 0,
+        "peaks": _peaks(levels, peaks),
+    }
+
+
+def _peaks(levels: list[float], n: int) -> bytes:
+    if not levels or n <= 0:
+        return b""
+    top = max(levels)
+    if top == -math.inf:
+        return bytes(min(n, len(levels)))
+    scaled = [max(0.0, 1 - (top - lv) / PEAK_RANGE_DB) for lv in levels]
+    n = min(n, len(scaled))
+    out = bytearray()
+    for k in range(n):
+        bucket = scaled[k * len(scaled) // n:(k + 1) * len(scaled) // n]
+        out.append(round(max(bucket) * 255))
+    return bytes(out)
+
+
+def downsample(peaks: bytes, n: int) -> bytes:
+    """Max-pool a peak array to at most `n` values."""
+    if n <= 0 or len(peaks) <= n:
+        return peaks
+    return bytes(max(peaks[k * len(peaks) // n:(k + 1) * len(peaks) // n]) for k in range(n))
+
+
+# ---------------------------------------------------------------- index
+
+def _index_path(project_id: str) -> Path:
+    return get_project_dir(project_id) / INDEX_NAME
+
+
+def _journal_path(project_id: str) -> Path:
+    return get_project_dir(project_id) / JOURNAL_NAME
+
+
+def _read_index(project_id: str) -> Dict[str, dict]:
+    """Index with the journal applied on top. Call with the `audio_index` lock held."""
+    files: Dict[str, dict] = {}
+    try:
+        with _index_path(project_id).open("r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        if isinstance(data, dict) and data.get("version") == INDEX_VERSION:
+            files = data.get("files") or {}
+    except (OSError, ValueError):
+        pass
+    try:
+        with _journal_path(project_id).open("r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # a line cut short by a crash: that entry is rescanned on read
+                    continue
+                if rec.get("v") == INDEX_VERSION:
+                    files[rec["rel"]] = rec["entry"]
+    except OSError:
+        pass
+    return files
+
+
+def _write_index(project_id: str, files: Dict[str, dict]) -> None:
+    """Replace the index with `files` and empty the journal. Call with the `audio_index` lock held."""
+    with locks.atomic_path(_index_path(project_id)) as tmp:
+        with tmp.open("w", encoding="utf-8") as fh:
+            json.dump({"version": INDEX_VERSION, "files": files}, fh, separators=(",", ":"))
+    _journal_path(project_id).unlink(missing_ok=True)
+
+
+def _append(project_id: str, entries: Dict[str, dict]) -> None:
+    """Add entries to the journal, folding it into the index when it gets large. Call with the lock held."""
+    journal = _journal_path(project_id)
+    lines = "".join(json.dumps({"v": INDEX_VERSION, "rel": rel, "entry": entry}, separators=(",", ":")) + "\n" for rel, entry in entries.items())
+    with journal.open("a+b") as fh:
+        if fh.tell():
+            fh.seek(-1, 2)
+            if fh.read(1) != b"\n":
+                # a write cut short by a crash: start on a new line
+                lines = "\n" + lines
+        fh.write(lines.encode("utf-8"))
+    size = journal.stat().st_size
+    if size <= JOURNAL_MIN_BYTES:
+        return
+    try:
+        index_size = _index_path(project_id).stat().st_size
+    except FileNotFoundError:
+        index_size = 0
+    if size > index_size:
+        _write_index(project_id, _read_index(project_id))
+
+
+def _entry(data: bytes, version: str) -> dict:
+    meta = scan(data)
+    meta["peaks"] = base64.b64encode(meta["peaks"]).decode("ascii")
+    meta["version"] = version
+    meta["sha256"] = hashlib.sha256(data).hexdigest()
+    return meta
+
+
+def _fresh(entry: Optional[dict], st: audio_store.Stat) -> bool:
+    return entry is not None and entry.get("bytes") == st[0] and entry.get("version") == st[1]
+
+
+def _build(project_id: str, key: str, data: bytes, version: str, provider: Optional[str] = None) -> Optional[dict]:
+    try:
+        entry = _entry(data, version)
+    except Exception as e:
+        # not fatal: the entry is rebuilt on the next timeline read
+        log(project_id, f"audio_meta update failed for {key}: {e}", level="ERROR")
+        return None
+    if provider:
+        entry["provider"] = provider
+    return entry
+
+
+@tracing.traced("audio_meta.update")
+def update(key: str, data: bytes, version: str, provider: Optional[str] = None) -> Optional[dict]:
+    """(Re)index one mp3 (`<project>/<num>/<p|r><num>.mp3`) from the bytes just written to the audio store.
+
+    `provider` is the TTS engine that rendered it ("openai" | "local"), shown in the timeline.
+    """
+    project_id, rel = key.split("/", 1)
+    entry = _build(project_id, key, data, version, provider)
+    if entry is None:
+        return None
+    with locks.project_lock(project_id, "audio_index"):
+        _append(project_id, {rel: entry})
+    return entry
+
+
+@tracing.traced("audio_meta.update_many")
+def update_many(project_id: str, items: Iterable[Tuple[str, bytes, str]]) -> None:
+    """`update` for several (key, data, version) of one project, with one index write."""
+    entries = {}
+    for key, data, version in items:
+        entry = _build(project_id, key, data, version)
+        if entry is not None:
+            entries[key.split("/", 1)[1]] = entry
+    if entries:
+        with locks.project_lock(project_id, "audio_index"):
+            _append(project_id, entries)
+
+
+def _snapshot(project_id: str) -> Dict[str, dict]:
+    with locks.project_lock(project_id, "audio_index"):
+        return _read_index(project_id)
+
+
+def _merge(project_id: str, seen: Dict[str, dict], scanned: Dict[str, dict], gone: Iterable[str] = ()) -> None:
+    """Write rescanned entries (and forget deleted files) unless the entry changed since `seen` was read."""
+    gone = list(gone)
+    if not scanned and not gone:
+        return
+    with locks.project_lock(project_id, "audio_index"):
+        files = _read_index(project_id)
+        for rel, entry in scanned.items():
+            # an `update` in between has the newer file
+            if files.get(rel) == seen.get(rel):
+                files[rel] = entry
+        for rel in gone:
+            if rel in files and files[rel] == seen.get(rel):
+                del files[rel]
+        _write_index(project_id, files)
+
+
+def content_hash(key: str) -> Optional[str]:
+    """sha256 of the stored mp3 `key` (None if there is none), from the index when it is fresh."""
+    project_id, rel = key.split("/", 1)
+    store = audio_store.get_store()
+    st = store.stat(key)
+    if st is None:
+        return None
+    seen = _snapshot(project_id)
+    entry = seen.get(rel)
+    if _fresh(entry, st) and entry.get("sha256"):
+        return entry["sha256"]
+    # indexed before hashes were stored, or changed by other means: rescan it
+    data = store.read(key)
+    try:
+        entry = _entry(data, st[1])
+    except Exception as e:
+        log(project_id, f"audio_meta scan failed for {rel}: {e}", level="ERROR")
+        return hashlib.sha256(data).hexdigest()
+    _merge(project_id, seen, {rel: entry})
+    return entry["sha256"]
+
+
+@tracing.traced("audio_meta.content_hashes")
+def content_hashes(project_id: str) -> Dict[str, Tuple[str, audio_store.Stat]]:
+    """{"<num>/<p|r><num>.mp3": (sha256, (size, version))} for every mp3 of the project.
+
+    One listing and one index read; only files without a fresh hashed entry are read.
+    """
+    store = audio_store.get_store()
+    blobs = store.list_project(project_id)
+    seen = _snapshot(project_id)
+    out: Dict[str, Tuple[str, audio_store.Stat]] = {}
+    scanned: Dict[str, dict] = {}
+    for rel, st in blobs.items():
+        entry = seen.get(rel)
+        if not (_fresh(entry, st) and entry.get("sha256")):
+            try:
+                data = store.read(f"{project_id}/{rel}")
+            except (FileNotFoundError, KeyError):
+                # deleted since the listing
+                continue
+            try:
+                entry = scanned[rel] = _entry(data, st[1])
+            except Exception as e:
+                log(project_id, f"audio_meta scan failed for {rel}: {e}", level="ERROR")
+                entry = {"sha256": hashlib.sha256(data).hexdigest()}
+        out[rel] = (entry["sha256"], st)
+    _merge(project_id, seen, scanned)
+    return out
+
+
+@tracing.traced("audio_meta.project_index")
+def project_index(project_id: str, nums: list[int]) -> Dict[Tuple[int, str], dict]:
+    """{(num, "p"|"r"): entry} for the existing mp3s of `nums`, rescanning stale entries."""
+    store = audio_store.get_store()
+    # one listing of the project (a directory walk, or LIST requests in S3) instead of a stat per part
+    blobs = store.list_project(project_id)
+    seen = _snapshot(project_id)
+    out: Dict[Tuple[int, str], dict] = {}
+    scanned: Dict[str, dict] = {}
+    for num in nums:
+        for prefix in ("p", "r"):
+            rel = f"{num}/{prefix}{num}.mp3"
+            st = blobs.get(rel)
+            if st is None:
+                continue
+            entry = seen.get(rel)
+            if not _fresh(entry, st):
+                try:
+                    entry = scanned[rel] = _entry(store.read(f"{project_id}/{rel}"), st[1])
+                except Exception as e:
+                    log(project_id, f"audio_meta scan failed for {rel}: {e}", level="ERROR")
+                    continue
+            out[(num, prefix)] = entry
+    # forget files that no longer exist
+    _merge(project_id, seen, scanned, [rel for rel in seen if rel not in blobs])
+    return out
+
+
+def timeline(project_id: str, peaks: int = PEAKS, gap_ms: int = 0) -> dict:
+    """Audio of every block in interview order, laid end to end.
+
+    Each part has its `start_ms` on the cumulative timeline, `duration_ms`,
+    `bytes`, a cache-busted `url`, `peaks` (0-255, at most `peaks` values) and
+    the TTS `provider` that rendered it;
+    parts without audio are None. `gap_ms` is the silence between parts.
+    """
+    nums = [num for num, _ in csv_store.iter_records(project_id)]
+    index = project_index(project_id, nums)
+    t = 0
+    total_bytes = parts = 0
+    blocks = []
+    for num in nums:
+        block: dict = {"num": num, "start_ms": t}
+        for part, prefix in (("pregunta", "p"), ("respuesta", "r")):
+            entry = index.get((num, prefix))
+            if entry is None:
+                block[part] = None
+                continue
+            if parts:
+                t += gap_ms
+            block[part] = {
+                "start_ms": t,
+                "duration_ms": entry["duration_ms"],
+                "bytes": entry["bytes"],
+                "url": audio_store.playback_url(project_id, num, part, entry["version"]),
+                "peaks": list(downsample(base64.b64decode(entry["peaks"]), peaks)),
+                # "local" marks a draft rendered offline (None if unknown)
+                "provider": entry.get("provider"),
+            }
+            t += entry["duration_ms"]
+            total_bytes += entry["bytes"]
+            parts += 1
+        block["end_ms"] = t
+        blocks.append(block)
+    return {"project_id": project_id, "total_ms": t, "parts": parts, "bytes": total_bytes, "blocks": blocks}
@@ -0,0 +1,382 @@
+"""Blob storage for the generated mp3s: local disk or an S3-compatible bucket.
+
+Audio keys are `<project_id>/<num>/<p|r><num>.mp3`, the same layout as under
+`BASE_VOICES_DIR`. Backends (selected with `AUDIO_STORE`):
+
+- `local` (default): files under `BASE_VOICES_DIR`, written to a temp file and
+  swapped in (`locks.atomic_path`), played from the `/voices` static mount.
+- `s3`: objects in `AUDIO_S3_BUCKET` (AWS, MinIO or any S3-compatible endpoint
+  via `AUDIO_S3_ENDPOINT_URL`), needs `boto3`. Uploads are streamed: chunks
+  are buffered up to `AUDIO_S3_PART_MB` and sent as multipart parts (a single
+  `put_object` for small files); the object only appears once complete and a
+  failed/cancelled upload is aborted. Playback uses `AUDIO_PUBLIC_BASE_URL`
+  (CDN / public bucket) or presigned GET URLs, so audio bytes never go through
+  the API workers.
+
+Every blob has a `version` that changes when it is rewritten (mtime_ns on disk,
+ETag in S3); it is used for cache busting and by the audio index.
+
+CSV, `.info`, status and logs stay in the project directory in both cases.
+"""
+from __future__ import annotations
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from ..config import settings
+from ..utils import BASE_VOICES_DIR
+from . import locks
+from . import tracing
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # optional dependency (AUDIO_STORE=s3)
+    boto3 = None
+
+# part -> file prefix
+PREFIXES = {"pregunta": "p", "respuesta": "r"}
+CONTENT_TYPE = "audio/mpeg"
+# S3 multipart: every part but the last must be >= 5 MiB
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+Stat = Tuple[int, str]  # (size, version)
+
+
+def audio_key(project_id: str, num: int, part: str) -> str:
+    prefix = PREFIXES[part]
+    return f"{project_id}/{int(num)}/{prefix}{int(num)}.mp3"
+
+
+def key_for(path: Path) -> str:
+    """Key of a path under `BASE_VOICES_DIR` (callers still build output paths from the project dir)."""
+    return Path(path).resolve().relative_to(BASE_VOICES_DIR.resolve()).as_posix()
+
+
+class BlobWriter:
+    """File-like sink handed out by `AudioStore.writer`; `size` / `version` are set once the blob is stored."""
+
+    def __init__(self):
+        self.size = 0
+        self.version: Optional[str] = None
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        self._write(data)
+        return len(data)
+
+    def _write(self, data: bytes) -> None:
+        raise NotImplementedError
+
+
+class AudioStore:
+    name = "base"
+
+    @contextmanager
+    def writer(self, key: str) -> Iterator[BlobWriter]:
+        """Stream a blob; it replaces `key` only if the block exits without an exception."""
+        raise NotImplementedError
+
+    def read(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def stat(self, key: str) -> Optional[Stat]:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def list_project(self, project_id: str) -> Dict[str, Stat]:
+        """{"<num>/<file>.mp3": (size, version)} for every audio blob of the project."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> bool:
+        """Remove a blob; False if it did not exist."""
+        raise NotImplementedError
+
+    def delete_project(self, project_id: str) -> int:
+        removed = 0
+        for rel in self.list_project(project_id):
+            removed += self.delete(f"{project_id}/{rel}")
+        return removed
+
+    def public_url(self, key: str, version: Optional[str] = None) -> Optional[str]:
+        """Stable URL clients can fetch directly, or None if access must be signed."""
+        raise NotImplementedError
+
+    def signed_url(self, key: str) -> Optional[str]:
+        """Short-lived URL to play `key` (None if it does not exist)."""
+        raise NotImplementedError
+
+
+class _FileWriter(BlobWriter):
+    def __init__(self, fh):
+        super().__init__()
+        self._fh = fh
+
+    def _write(self, data: bytes) -> None:
+        self._fh.write(data)
+
+
+class LocalAudioStore(AudioStore):
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    @contextmanager
+    def writer(self, key: str) -> Iterator[BlobWriter]:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # temp file + rename: players and other workers never see a truncated mp3
+        with locks.atomic_path(path) as tmp:
+            with tmp.open("wb") as fh:
+                w = _FileWriter(fh)
+                yield w
+        w.version = str(path.stat().st_mtime_ns)
+
+    def read(self, key: str) -> bytes:
+        return self.path(key).read_bytes()
+
+    def stat(self, key: str) -> Optional[Stat]:
+        try:
+            st = self.path(key).stat()
+        except OSError:
+            return None
+        return st.st_size, str(st.st_mtime_ns)
+
+    def list_project(self, project_id: str) -> Dict[str, Stat]:
+        out: Dict[str, Stat] = {}
+        try:
+            dirs = [e for e in os.scandir(self.root / project_id) if e.is_dir() and e.name.isdigit()]
+        except OSError:
+            return out
+        for d in dirs:
+            try:
+                for f in os.scandir(d.path):
+                    if f.name.endswith(".mp3") and f.is_file():
+                        st = f.stat()
+                        out[f"{d.name}/{f.name}"] = (st.st_size, str(st.st_mtime_ns))
+            except OSError:
+                continue
+        return out
+
+    def delete(self, key: str) -> bool:
+        path = self.path(key)
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return False
+        # drop the block directory once it is empty
+        try:
+            path.parent.rmdir()
+        except OSError:
+            pass
+        return True
+
+    def public_url(self, key: str, version: Optional[str] = None) -> Optional[str]:
+        url = f"/voices/{quote(key)}"
+        return f"{url}?v={version}" if version else url
+
+    def signed_url(self, key: str) -> Optional[str]:
+        st = self.stat(key)
+        return self.public_url(key, st[1]) if st else None
+
+
+class _MultipartWriter(BlobWriter):
+    def __init__(self, store: "S3AudioStore", key: str):
+        super().__init__()
+        self._store = store
+        self._key = key
+        self._buf = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: list[dict] = []
+
+    def _write(self, data: bytes) -> None:
+        self._buf += data
+        while len(self._buf) >= self._store.part_size:
+            self._send(bytes(self._buf[:self._store.part_size]))
+            del self._buf[:self._store.part_size]
+
+    def _send(self, body: bytes) -> None:
+        s = self._store
+        if self._upload_id is None:
+            resp = s.client.create_multipart_upload(Bucket=s.bucket, Key=self._key, ContentType=CONTENT_TYPE)
+            self._upload_id = resp["UploadId"]
+        n = len(self._parts) + 1
+        with tracing.span("s3.upload_part", part=n, bytes=len(body)):
+            resp = s.client.upload_part(Bucket=s.bucket, Key=self._key, UploadId=self._upload_id, PartNumber=n, Body=body)
+        self._parts.append({"PartNumber": n, "ETag": resp["ETag"]})
+
+    def complete(self) -> None:
+        s = self._store
+        if self._upload_id is None:
+            # whole file fits in one part: a plain PUT
+            resp = s.client.put_object(Bucket=s.bucket, Key=self._key, Body=bytes(self._buf), ContentType=CONTENT_TYPE)
+        else:
+            if self._buf or not self._parts:
+                self._send(bytes(self._buf))
+            resp = s.client.complete_multipart_upload(
+                Bucket=s.bucket, Key=self._key, UploadId=self._upload_id, MultipartUpload={"Parts": self._parts}
+            )
+        self._buf = bytearray()
+        self.version = resp["ETag"].strip('"')
+
+    def abort(self) -> None:
+        if self._upload_id is not None:
+            try:
+                self._store.client.abort_multipart_upload(Bucket=self._store.bucket, Key=self._key, UploadId=self._upload_id)
+            except Exception:
+                # leftover parts are removed by the bucket's lifecycle rule (AbortIncompleteMultipartUpload)
+                pass
+
+
+class S3AudioStore(AudioStore):
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        public_base_url: Optional[str] = None,
+        url_expires: int = 3600,
+        part_size: int = 8 * 1024 * 1024,
+        max_connections: int = 32,
+    ):
+        if boto3 is None:
+            raise RuntimeError("AUDIO_STORE=s3 requiere el paquete boto3 (pip install boto3)")
+        if not bucket:
+            raise RuntimeError("AUDIO_STORE=s3 requiere AUDIO_S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.public_base_url = public_base_url.rstrip("/") if public_base_url else None
+        self.url_expires = url_expires
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        # one client for all threads (boto3 clients are thread-safe); the pool
+        # covers the TTS slots of bulk runs uploading at the same time
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            config=BotoConfig(signature_version="s3v4", max_pool_connections=max_connections),
+        )
+
+    def _obj(self, key: str) -> str:
+        return self.prefix + key
+
+    @contextmanager
+    def writer(self, key: str) -> Iterator[BlobWriter]:
+        w = _MultipartWriter(self, self._obj(key))
+        try:
+            yield w
+            with tracing.span("s3.complete"):
+                w.complete()
+        except BaseException:
+            w.abort()
+            raise
+
+    def read(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=self._obj(key))["Body"].read()
+
+    def stat(self, key: str) -> Optional[Stat]:
+        try:
+            resp = self.client.head_object(Bucket=self.bucket, Key=self._obj(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return resp["ContentLength"], resp["ETag"].strip('"')
+
+    def _list(self, prefix: str) -> Iterator[dict]:
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            yield from page.get("Contents", ())
+
+    @tracing.traced("s3.list_project")
+    def list_project(self, project_id: str) -> Dict[str, Stat]:
+        base = self._obj(f"{project_id}/")
+        return {
+            obj["Key"][len(base):]: (obj["Size"], obj["ETag"].strip('"'))
+            for obj in self._list(base)
+            if obj["Key"].endswith(".mp3")
+        }
+
+    def delete(self, key: str) -> bool:
+        # DELETE succeeds for missing keys too; HEAD first to report what was removed
+        if self.stat(key) is None:
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=self._obj(key))
+        return True
+
+    def delete_project(self, project_id: str) -> int:
+        keys = [obj["Key"] for obj in self._list(self._obj(f"{project_id}/"))]
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": k} for k in keys[i:i + 1000]], "Quiet": True},
+            )
+        return len(keys)
+
+    def public_url(self, key: str, version: Optional[str] = None) -> Optional[str]:
+        if not self.public_base_url:
+            return None
+        url = f"{self.public_base_url}/{quote(self._obj(key))}"
+        return f"{url}?v={version}" if version else url
+
+    def signed_url(self, key: str) -> Optional[str]:
+        if self.stat(key) is None:
+            return None
+        if self.public_base_url:
+            return self.public_url(key)
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._obj(key), "ResponseContentType": CONTENT_TYPE},
+            ExpiresIn=self.url_expires,
+        )
+
+
+_store: Optional[AudioStore] = None
+_store_lock = threading.Lock()
+
+
+def _from_settings() -> AudioStore:
+    kind = (settings.AUDIO_STORE or "local").lower()
+    if kind == "local":
+        return LocalAudioStore(BASE_VOICES_DIR)
+    if kind == "s3":
+        return S3AudioStore(
+            bucket=settings.AUDIO_S3_BUCKET,
+            prefix=settings.AUDIO_S3_PREFIX,
+            endpoint_url=settings.AUDIO_S3_ENDPOINT_URL,
+            region=settings.AUDIO_S3_REGION,
+            public_base_url=settings.AUDIO_PUBLIC_BASE_URL,
+            url_expires=settings.AUDIO_URL_EXPIRES,
+            part_size=settings.AUDIO_S3_PART_MB * 1024 * 1024,
+        )
+    raise RuntimeError(f"AUDIO_STORE no soportado: {kind!r} (local | s3)")
+
+
+def get_store() -> AudioStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _from_settings()
+    return _store
+
+
+def playback_url(project_id: str, num: int, part: str, version: Optional[str] = None) -> str:
+    """URL to put in listings: direct when the store allows it, else the API redirect (signed on demand)."""
+    url = get_store().public_url(audio_key(project_id, num, part), version)
+    if url is not None:
+        return url
+    url = f"/api/audio/{project_id}/{int(num)}/{part}"
+    return f"{url}?v={version}" if version else url
@@ -0,0 +1,284 @@
+"""Batch ingestion: many PDFs (or a zip of PDFs) -> one project per PDF.
+
+The uploaded files are copied to `<VOICES_DIR>/.ingest/<batch_id>/` and then
+processed by a pool of worker processes (`INGEST_WORKERS`, one per CPU by
+default): text extraction with pdfplumber and parsing are pure Python, so
+threads would serialise on the GIL. The pool is started with "spawn" on first
+use and shared by all batches, so concurrent batches do not multiply the
+processes.
+
+A coordinator (the background task of the upload) keeps at most one file per
+worker in flight, which makes `running` in the progress accurate, and creates
+each project as its result arrives: `.info` with metadata from the file name
+(see `metadata_from_filename`) and `entrevista.csv`. A file that cannot be
+read or has no blocks is reported as failed and does not create a project.
+
+Progress is kept in `batch.json` next to the files (any uvicorn worker can
+serve it). Each PDF is deleted once processed.
+"""
+from __future__ import annotations
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import ulid
+
+from ..config import settings
+from ..utils import BASE_VOICES_DIR, create_project
+from . import csv_store
+from . import locks
+from . import pdf_parser
+from . import project_info
+from app.services.project_logger import log
+
+DIR_NAME = ".ingest"
+_BATCH_ID = re.compile(r"^[0-9a-z]{26}$")
+_DATE_PREFIX = re.compile(r"^(\d{4}-\d{2}-\d{2})[\s_.-]*(.*)$")
+
+
+class BatchNotFound(LookupError):
+    """No batch with that id."""
+
+
+class BatchTooLarge(ValueError):
+    """More files than INGEST_MAX_FILES, or a file over INGEST_MAX_FILE_MB."""
+
+
+def _dir(batch_id: str) -> Path:
+    if not _BATCH_ID.match(batch_id or ""):
+        raise BatchNotFound(batch_id)
+    return BASE_VOICES_DIR / DIR_NAME / batch_id
+
+
+def metadata_from_filename(filename: str) -> dict:
+    """`.info` fields for a PDF: title from the name, `date` from a leading YYYY-MM-DD.
+
+    "2023-05-12_entrevista_ana-garcia.pdf" -> {"title": "entrevista ana-garcia",
+    "date": "2023-05-12", "source_file": "2023-05-12_entrevista_ana-garcia.pdf"}
+    """
+    stem = Path(filename).stem
+    meta = {"source_file": filename}
+    m = _DATE_PREFIX.match(stem)
+    if m:
+        meta["date"] = m.group(1)
+        stem = m.group(2)
+    meta["title"] = re.sub(r"\s+", " ", stem.replace("_", " ")).strip() or Path(filename).stem
+    return meta
+
+
+# ---------------------------------------------------------------------------
+# worker process side
+
+
+def _parse(path: str, labels: Optional[dict]) -> Tuple[pdf_parser.ParseResult, int]:
+    pages = pdf_parser.extract_pages(path)
+    return pdf_parser.parse_pages(pages, labels=labels), len(pages)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+# ---------------------------------------------------------------------------
+# API process side
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def workers() -> int:
+    return max(1, settings.INGEST_WORKERS or os.cpu_count() or 1)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers(), mp_context=multiprocessing.get_context("spawn"))
+            # start every worker now instead of on the first files
+            for _ in range(workers()):
+                _pool.submit(_ping)
+        return _pool
+
+
+def _reset_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _write_state(batch_id: str, state: dict) -> None:
+    state["updated_at"] = time.time()
+    with locks.atomic_path(_dir(batch_id) / "batch.json") as tmp:
+        with tmp.open("w", encoding="utf-8") as fh:
+            json.dump(state, fh, ensure_ascii=False)
+
+
+def _safe_name(name: str) -> str:
+    # only the file name: a zip entry or multipart filename may carry a path
+    return Path(name.replace("\\", "/")).name
+
+
+def create(uploads: List[Tuple[str, BinaryIO]], labels: Optional[dict] = None) -> dict:
+    """Register a batch from (filename, file) pairs; zips are expanded to their PDFs.
+
+    Copies the files to the batch folder and returns the initial state; the
+    caller then runs `run(batch_id)` in the background.
+    """
+    batch_id = str(ulid.new()).lower()
+    d = _dir(batch_id)
+    d.mkdir(parents=True)
+    max_bytes = settings.INGEST_MAX_FILE_MB * 1024 * 1024
+    files: List[dict] = []
+
+    def add(name: str, src: BinaryIO, size: Optional[int] = None) -> None:
+        if len(files) >= settings.INGEST_MAX_FILES:
+            raise BatchTooLarge(f"Máximo {settings.INGEST_MAX_FILES} ficheros por lote")
+        entry = {"index": len(files), "name": name, "status": "queued", "project_id": None, "error": None}
+        files.append(entry)
+        if not name.lower().endswith(".pdf"):
+            entry.update(status="failed", error="No es un PDF")
+            return
+        if size is not None and size > max_bytes:
+            entry.update(status="failed", error=f"Supera {settings.INGEST_MAX_FILE_MB} MB")
+            return
+        written = 0
+        with (d / f"{entry['index']}.pdf").open("wb") as dst:
+            # the size declared in a zip is not trusted
+            for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                written += len(chunk)
+                if written > max_bytes:
+                    entry.update(status="failed", error=f"Supera {settings.INGEST_MAX_FILE_MB} MB")
+                    break
+                dst.write(chunk)
+
+    try:
+        for filename, fh in uploads:
+            name = _safe_name(filename or "")
+            if name.lower().endswith(".zip"):
+                try:
+                    with zipfile.ZipFile(fh) as zf:
+                        for info in zf.infolist():
+                            inner = _safe_name(info.filename)
+                            if info.is_dir() or info.filename.startswith("__MACOSX/") or inner.startswith("."):
+                                continue
+                            with zf.open(info) as src:
+                                add(inner, src, info.file_size)
+                except zipfile.BadZipFile:
+                    add(name, fh)
+                    files[-1].update(status="failed", error="Zip no válido")
+            else:
+                add(name, fh)
+    except BaseException:
+        shutil.rmtree(d, ignore_errors=True)
+        raise
+    for entry in files:
+        if entry["status"] == "failed":
+            (d / f"{entry['index']}.pdf").unlink(missing_ok=True)
+    state = {
+        "id": batch_id,
+        "state": "queued",
+        "created_at": time.time(),
+        "labels": labels,
+        "workers": workers(),
+        "files": files,
+    }
+    _write_state(batch_id, state)
+    return status(batch_id)
+
+
+def _read_state(batch_id: str) -> dict:
+    try:
+        with (_dir(batch_id) / "batch.json").open("r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        raise BatchNotFound(batch_id) from None
+
+
+def status(batch_id: str) -> dict:
+    """State of the batch with per-file progress and a `summary` of the counts."""
+    state = _read_state(batch_id)
+    state.pop("labels", None)
+    files = state["files"]
+    counts: Dict[str, int] = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+    for f in files:
+        counts[f["status"]] += 1
+    end = state.get("finished_at") or time.time()
+    elapsed = end - state["started_at"] if state.get("started_at") else 0.0
+    state["summary"] = {
+        "total": len(files),
+        **counts,
+        "pairs": sum(f.get("pairs") or 0 for f in files),
+        "pages": sum(f.get("pages") or 0 for f in files),
+        "elapsed_s": round(elapsed, 2),
+        "files_per_s": round(counts["done"] / elapsed, 2) if elapsed else None,
+    }
+    return state
+
+
+def _finish_file(entry: dict, result: pdf_parser.ParseResult, pages: int, labels: Optional[dict]) -> None:
+    if not result.blocks:
+        raise ValueError("No se encontró ningún bloque de pregunta/respuesta")
+    project_id = create_project()
+    meta = metadata_from_filename(entry["name"])
+    if labels:
+        meta["speaker_labels"] = labels
+    project_info.write_info(project_id, meta)
+    csv_store.create_csv_from_result(result, project_id, overwrite=True)
+    for issue in result.issues:
+        log(project_id, f"batch ingest: malformed block kind={issue.kind} page={issue.page} detail={issue.detail}", level="WARNING")
+    log(project_id, f"batch ingest: created from {entry['name']} ({len(result.blocks)} pairs, {pages} pages)")
+    entry.update(project_id=project_id, pairs=len(result.blocks), pages=pages, malformed=len(result.issues))
+
+
+def run(batch_id: str) -> None:
+    """Process the queued files of a batch (background task of the upload)."""
+    state = _read_state(batch_id)
+    labels = state.get("labels")
+    d = _dir(batch_id)
+    queue = [f for f in state["files"] if f["status"] == "queued"]
+    state.update(state="running", started_at=time.time())
+    _write_state(batch_id, state)
+    pending: Dict[Future, Tuple[dict, float, ProcessPoolExecutor]] = {}
+    pool = _get_pool()
+    try:
+        while queue or pending:
+            # one file per worker in flight: the rest stay "queued"
+            while queue and len(pending) < workers():
+                entry = queue.pop(0)
+                entry["status"] = "running"
+                pending[pool.submit(_parse, str(d / f"{entry['index']}.pdf"), labels)] = (entry, time.perf_counter(), pool)
+            _write_state(batch_id, state)
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                entry, t0, used = pending.pop(fut)
+                try:
+                    result, pages = fut.result()
+                    _finish_file(entry, result, pages, labels)
+                    entry["status"] = "done"
+                except BrokenProcessPool:
+                    # a worker died (e.g. out of memory on a huge PDF): the other files get a fresh pool
+                    _reset_pool(used)
+                    pool = _get_pool()
+                    entry.update(status="failed", error="El proceso que analizaba el PDF terminó inesperadamente")
+                except Exception as e:
+                    entry.update(status="failed", error=str(e)[:500] or type(e).__name__)
+                entry["ms"] = round((time.perf_counter() - t0) * 1000)
+                (d / f"{entry['index']}.pdf").unlink(missing_ok=True)
+    finally:
+        for entry in queue + [e for e, _, _ in pending.values()]:
+            entry.update(status="failed", error=entry.get("error") or "Lote interrumpido")
+        state.update(state="done", finished_at=time.time())
+        _write_state(batch_id, state)
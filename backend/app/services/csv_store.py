@@ -1,196 +1,346 @@
 from __future__ import annotations
-import pandas as pd
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
 from . import pdf_parser
+from . import locks
+from . import project_catalog
+from . import search_index
+from . import tracing
+from . import record_store
+from .record_store import COLUMNS, Record, RecordTable
 from ..utils import get_csv_path
 from app.services.project_logger import log
 
-COLUMNS = ["num", "pregunta", "respuesta", "entonacion_p", "entonacion_r", "notas"]
+if TYPE_CHECKING:
+    import pandas as pd
 
 STATUS_COLUMNS = ["num", "processed", "failed", "error"]
 
-def create_csv_from_text(raw_text: str, project_id: str, overwrite: bool = False) -> Path:
+# Every read-modify-write cycle on the project CSVs runs under the project's
+# "csv" lock, shared by the threads of a bulk run and by every uvicorn worker,
+# and every write goes to a temp file that atomically replaces the CSV.
+# Rows are handled as `record_store.Record`s; pandas is only imported by
+# `read_csv` / `write_csv` (bulk analytics and export).
+
+
+def _status_path(project_id: str) -> Path:
+    csv_path = get_csv_path(project_id)
+    return csv_path.parent / (csv_path.stem + ".status.csv")
+
+
+def _write_records(records, path: Path) -> None:
+    with locks.atomic_path(path) as tmp:
+        record_store.write_rows(tmp, records)
+
+
+def _iter_status_rows(path: Path) -> Iterator[dict]:
+    for r in record_store.iter_dicts(path):
+        yield {
+            "num": int(r["num"]),
+            "processed": r.get("processed") == "True",
+            "failed": r.get("failed") == "True",
+            "error": r.get("error") or "",
+        }
+
+
+def _read_status_rows(path: Path) -> list[dict]:
+    return list(_iter_status_rows(path))
+
+
+def _write_status_rows(rows: list[dict], path: Path) -> None:
+    # booleans are written as True/False, like the pandas-written files
+    with locks.atomic_path(path) as tmp:
+        record_store.write_dicts(tmp, STATUS_COLUMNS, ({**r, "processed": str(bool(r["processed"])), "failed": str(bool(r["failed"]))} for r in rows))
+
+
+def create_csv_from_text(raw_text: str, project_id: str, overwrite: bool = False, labels: dict | None = None) -> Path:
     csv_path = get_csv_path(project_id)
-    csv_path.parent.mkdir(parents=True, exist_ok=True)
     log(project_id, f"create_csv_from_text called (overwrite={overwrite}) for {csv_path}")
     if csv_path.exists() and not overwrite:
         log(project_id, f"CSV already exists and overwrite=False -> returning {csv_path}")
         return csv_path
-    pairs = pdf_parser.extract_pairs(raw_text)
-    log(project_id, f"Extracted {len(pairs)} pairs from raw_text")
-    rows = [
-        {
-            "num": i + 1,
-            "pregunta": q,
-            "respuesta": r,
-            "entonacion_p": "",
-            "entonacion_r": "",
-            "notas": "",
-        }
-        for i, (q, r) in enumerate(pairs)
-    ]
-    df = pd.DataFrame(rows, columns=COLUMNS)
-    df.to_csv(csv_path, index=False)
-    log(project_id, f"Wrote CSV with {len(df)} rows to {csv_path}")
+    result = pdf_parser.parse_transcript(raw_text, labels=labels)
+    return create_csv_from_result(result, project_id, overwrite=overwrite)
+
+@tracing.traced("csv.create")
+def create_csv_from_result(result: pdf_parser.ParseResult, project_id: str, overwrite: bool = False) -> Path:
+    """Write the blocks of an already parsed transcript as the project's CSV."""
+    csv_path = get_csv_path(project_id)
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    with locks.project_lock(project_id):
+        if csv_path.exists() and not overwrite:
+            log(project_id, f"CSV already exists and overwrite=False -> returning {csv_path}")
+            return csv_path
+        _write_pairs(result, project_id, csv_path)
+    project_catalog.refresh_project(project_id)
     return csv_path
 
-def read_csv(project_id: str) -> pd.DataFrame:
+
+def _write_pairs(result: pdf_parser.ParseResult, project_id: str, csv_path: Path) -> None:
+    pairs = result.pairs()
+    log(project_id, f"Extracted {len(pairs)} pairs from raw_text ({len(result.issues)} malformed blocks reported)")
+    records = [Record(i + 1, q, r) for i, (q, r) in enumerate(pairs)]
+    _write_records(records, csv_path)
+    search_index.index_records(project_id, records)
+    log(project_id, f"Wrote CSV with {len(records)} rows to {csv_path}")
+
+@tracing.traced("csv.read_records")
+def read_records(project_id: str) -> RecordTable:
+    """All the records of the project, indexed by num (empty table if there is no CSV)."""
+    csv_path = get_csv_path(project_id)
+    log(project_id, f"read_records called for {csv_path}")
+    if not csv_path.exists():
+        log(project_id, f"CSV not found at {csv_path}, returning empty table")
+        return RecordTable()
+    table = record_store.read_table(csv_path)
+    log(project_id, f"read_records loaded {len(table)} rows from {csv_path}")
+    return table
+
+@tracing.traced("csv.get_record")
+def get_record(project_id: str, num: int) -> Optional[Record]:
+    """Single record lookup; streams the CSV and stops at the matching row."""
+    csv_path = get_csv_path(project_id)
+    log(project_id, f"get_record called for num={num}")
+    if not csv_path.exists():
+        log(project_id, f"CSV not found at {csv_path}")
+        return None
+    return record_store.find(csv_path, num)
+
+def stream_records(project_id: str) -> Iterator[dict]:
+    """Yield the records as dicts straight from the CSV, one row in memory at a time."""
+    csv_path = get_csv_path(project_id)
+    log(project_id, f"stream_records called for {csv_path}")
+    if not csv_path.exists():
+        return
+    for rec in record_store.iter_rows(csv_path):
+        yield rec.to_dict()
+
+@tracing.traced("csv.write_records")
+def write_records(table: RecordTable, project_id: str, changed: Optional[list[int]] = None) -> None:
+    """Write the whole table; `changed` (nums) limits the search index update to those rows."""
+    csv_path = get_csv_path(project_id)
+    log(project_id, f"write_records called - writing {len(table)} rows to {csv_path}")
+    with locks.project_lock(project_id):
+        _write_records(table, csv_path)
+        search_index.index_records(project_id, table, changed)
+    project_catalog.mark_dirty(project_id)
+    log(project_id, f"write_records completed for {csv_path}")
+
+@tracing.traced("csv.read_csv")
+def read_csv(project_id: str) -> "pd.DataFrame":
+    """The project's records as a DataFrame (imports pandas; for analytics/export only)."""
+    import pandas as pd
+
     csv_path = get_csv_path(project_id)
     log(project_id, f"read_csv called for {csv_path}")
     if not csv_path.exists():
         log(project_id, f"CSV not found at {csv_path}, returning empty DataFrame")
         return pd.DataFrame(columns=COLUMNS)
-    df = pd.read_csv(csv_path)
+    df = pd.read_csv(csv_path, keep_default_na=False)
     # ensure notas column exists for backward compatibility
     if "notas" not in df.columns:
         df["notas"] = ""
     log(project_id, f"read_csv loaded {len(df)} rows from {csv_path}")
     return df
 
-def write_csv(df: pd.DataFrame, project_id: str) -> None:
+@tracing.traced("csv.write_csv")
+def write_csv(df: "pd.DataFrame", project_id: str) -> None:
     csv_path = get_csv_path(project_id)
     log(project_id, f"write_csv called - writing {len(df)} rows to {csv_path}")
     # Ensure all expected columns exist
     for c in COLUMNS:
         if c not in df.columns:
             df[c] = ""
-    df[COLUMNS].to_csv(csv_path, index=False)
+    with locks.project_lock(project_id):
+        with locks.atomic_path(csv_path) as tmp:
+            df[COLUMNS].to_csv(tmp, index=False)
+        search_index.index_records(project_id, record_store.read_table(csv_path))
+    project_catalog.mark_dirty(project_id)
     log(project_id, f"write_csv completed for {csv_path}")
 
 def update_record(project_id: str, num: int, **updates) -> dict:
-    df = read_csv(project_id)
+    return update_record_changes(project_id, num, **updates)[0]
+
+def update_record_changes(project_id: str, num: int, **updates) -> tuple[dict, list[str]]:
+    """`update_record` that also returns the columns whose value changed.
+
+    The comparison is made under the project lock, against the row as it was
+    just before this write.
+    """
+    with locks.project_lock(project_id):
+        return _update_record(project_id, num, **updates)
+
+def _update_record(project_id: str, num: int, **updates) -> tuple[dict, list[str]]:
+    table = read_records(project_id)
     log(project_id, f"update_record called for num={num} updates={list(updates.keys())}")
-    if df.empty:
+    if table.empty:
         log(project_id, "update_record failed - CSV aún no existe", level="ERROR")
         raise ValueError("CSV aún no existe")
-    idx = df.index[df["num"] == num]
-    if len(idx) == 0:
+    rec = table.get(num)
+    if rec is None:
         log(project_id, f"update_record failed - registro num={num} no encontrado", level="ERROR")
         raise ValueError(f"Registro num={num} no encontrado")
-    for k, v in updates.items():
-        if v is not None and k in df.columns:
-            df.at[idx[0], k] = v
-    write_csv(df, project_id)
-    # convert pandas NA / nan to None for JSON serialization
-    row = df.loc[idx[0]]
-    row = row.where(pd.notnull(row), None)
-    result = row.to_dict()
+    before = rec.values()
+    rec.update(**updates)
+    write_records(table, project_id, changed=[num])
     log(project_id, f"update_record succeeded for num={num}")
-    return result
+    changed = [c for c, old, new in zip(COLUMNS, before, rec.values()) if old != new]
+    return rec.to_dict(), changed
+
+def modify_records(project_id: str, fn: Callable[[RecordTable], bool]) -> None:
+    """Run `fn(table)` on the current records under the project lock.
+
+    The table is written back (in one atomic write) only if `fn` returns True;
+    raising or returning False leaves the CSV untouched.
+    """
+    with locks.project_lock(project_id):
+        table = read_records(project_id)
+        if table.empty:
+            log(project_id, "modify_records failed - CSV aún no existe", level="ERROR")
+            raise ValueError("CSV aún no existe")
+        before = {rec.num: rec.values() for rec in table}
+        if fn(table):
+            changed = [rec.num for rec in table if before.get(rec.num) != rec.values()]
+            # rows added or removed by `fn`: reindex the whole project
+            same_rows = len(before) == len(table) and all(rec.num in before for rec in table)
+            write_records(table, project_id, changed if same_rows else None)
+
+def update_records(project_id: str, updates: dict[int, dict]) -> int:
+    """Apply {num: {column: value}} to several rows in one locked read-modify-write.
+
+    Only the given fields are merged into the current CSV, so edits made by other
+    requests or workers since the caller read its snapshot are kept.
+    Returns the number of rows updated.
+    """
+    log(project_id, f"update_records called for {len(updates)} rows")
+    changed = 0
+
+    def apply(table: RecordTable) -> bool:
+        nonlocal changed
+        for num, fields in updates.items():
+            rec = table.get(num)
+            if rec is None:
+                log(project_id, f"update_records: registro num={num} no encontrado", level="WARNING")
+                continue
+            rec.update(**fields)
+            changed += 1
+        return True
+
+    modify_records(project_id, apply)
+    return changed
 
-def iter_records(project_id: str):
+def iter_records(project_id: str) -> Iterator[tuple[int, Record]]:
     log(project_id, "iter_records called")
-    df = read_csv(project_id)
-    for _, row in df.iterrows():
-        yield int(row["num"]), row
+    for rec in read_records(project_id):
+        yield rec.num, rec
 
 
-def init_status_csv(project_id: str) -> Path:
+@tracing.traced("status.init")
+def init_status_csv(project_id: str, keep_processed: bool = False) -> Path:
     """Create a temporary status CSV with columns (num, processed=False) for all records.
 
+    keep_processed: keep the rows already processed in the existing status CSV
+    (resuming a cancelled run); every other row starts over.
     Returns the path to the status CSV.
     """
-    csv_path = get_csv_path(project_id)
-    status_path = csv_path.parent / (csv_path.stem + ".status.csv")
-    df = read_csv(project_id)
-    rows = [
-        {"num": int(r["num"]), "processed": False, "failed": False, "error": ""}
-        for _, r in df.iterrows()
-    ]
-    import pandas as pd
-
-    status_df = pd.DataFrame(rows, columns=STATUS_COLUMNS)
+    status_path = _status_path(project_id)
     status_path.parent.mkdir(parents=True, exist_ok=True)
-    status_df.to_csv(status_path, index=False)
-    log(project_id, f"init_status_csv created {status_path} with {len(status_df)} rows")
+    with locks.project_lock(project_id):
+        done = set()
+        if keep_processed and status_path.exists():
+            done = {r["num"] for r in _iter_status_rows(status_path) if r["processed"]}
+        rows = [
+            {"num": rec.num, "processed": rec.num in done, "failed": False, "error": ""}
+            for rec in read_records(project_id)
+        ]
+        _write_status_rows(rows, status_path)
+    log(project_id, f"init_status_csv created {status_path} with {len(rows)} rows ({len(done)} kept as processed)")
     return status_path
 
 
+def processed_nums(project_id: str) -> set[int]:
+    """Nums marked processed in the status CSV (empty if there is none)."""
+    return {r["num"] for r in stream_status_rows(project_id) if r["processed"]}
+
+
+@tracing.traced("status.mark_processed")
 def mark_status_processed(project_id: str, num: int) -> None:
     """Mark a given num as processed=True in the status CSV if it exists."""
-    csv_path = get_csv_path(project_id)
-    status_path = csv_path.parent / (csv_path.stem + ".status.csv")
-    if not status_path.exists():
-        log(project_id, f"mark_status_processed: status CSV not found at {status_path}")
-        return
-    import pandas as pd
-
-    df = pd.read_csv(status_path)
-    idx = df.index[df["num"] == int(num)]
-    if len(idx) == 0:
-        log(project_id, f"mark_status_processed: no row for num={num} in {status_path}")
-        return
-    df.at[idx[0], "processed"] = True
-    df.at[idx[0], "failed"] = False
-    df.at[idx[0], "error"] = ""
-    df.to_csv(status_path, index=False)
-    log(project_id, f"mark_status_processed: marked num={num} processed in {status_path}")
+    with locks.project_lock(project_id):
+        _mark_status(project_id, num, processed=True)
 
 
+@tracing.traced("status.mark_failed")
 def mark_status_failed(project_id: str, num: int, error: str | None = None) -> None:
     """Mark a given num as failed=True and store error message."""
-    csv_path = get_csv_path(project_id)
-    status_path = csv_path.parent / (csv_path.stem + ".status.csv")
+    with locks.project_lock(project_id):
+        _mark_status(project_id, num, processed=False, error=error)
+
+
+def _mark_status(project_id: str, num: int, processed: bool, error: str | None = None) -> None:
+    fn = "mark_status_processed" if processed else "mark_status_failed"
+    status_path = _status_path(project_id)
     if not status_path.exists():
-        log(project_id, f"mark_status_failed: status CSV not found at {status_path}")
+        log(project_id, f"{fn}: status CSV not found at {status_path}")
         return
-    import pandas as pd
-
-    df = pd.read_csv(status_path)
-    idx = df.index[df["num"] == int(num)]
-    if len(idx) == 0:
-        log(project_id, f"mark_status_failed: no row for num={num} in {status_path}")
+    rows = _read_status_rows(status_path)
+    row = next((r for r in rows if r["num"] == int(num)), None)
+    if row is None:
+        log(project_id, f"{fn}: no row for num={num} in {status_path}")
         return
-    df.at[idx[0], "failed"] = True
-    df.at[idx[0], "processed"] = False
-    df.at[idx[0], "error"] = str(error)[:1000] if error else ""
-    df.to_csv(status_path, index=False)
-    log(project_id, f"mark_status_failed: marked num={num} failed in {status_path} error={str(error)[:200]}")
+    row["processed"] = processed
+    row["failed"] = not processed
+    row["error"] = str(error)[:1000] if error and not processed else ""
+    _write_status_rows(rows, status_path)
+    if processed:
+        log(project_id, f"{fn}: marked num={num} processed in {status_path}")
+    else:
+        log(project_id, f"{fn}: marked num={num} failed in {status_path} error={str(error)[:200]}")
 
 
+@tracing.traced("status.read")
 def read_status(project_id: str) -> dict:
     """Return a dict {processed: n, total: m} reading the status CSV. If missing, return total=0."""
-    csv_path = get_csv_path(project_id)
-    status_path = csv_path.parent / (csv_path.stem + ".status.csv")
+    status_path = _status_path(project_id)
     if not status_path.exists():
         # fallback: count records in main CSV
-        df = read_csv(project_id)
-        total = len(df)
+        total = len(read_records(project_id))
         log(project_id, f"read_status: no status CSV, fallback total={total}")
         return {"processed": 0, "total": total}
-    import pandas as pd
-
-    df = pd.read_csv(status_path)
-    processed = int(df[df["processed"] == True].shape[0])
-    failed = int(df[df["failed"] == True].shape[0])
-    total = int(df.shape[0])
+    rows = _read_status_rows(status_path)
+    processed = sum(1 for r in rows if r["processed"])
+    failed = sum(1 for r in rows if r["failed"])
+    total = len(rows)
     log(project_id, f"read_status: processed={processed} failed={failed} total={total} from {status_path}")
     return {"processed": processed, "failed": failed, "total": total}
 
 
 def get_status_rows(project_id: str) -> list[dict]:
-    csv_path = get_csv_path(project_id)
-    status_path = csv_path.parent / (csv_path.stem + ".status.csv")
+    status_path = _status_path(project_id)
     if not status_path.exists():
         log(project_id, f"get_status_rows: status CSV not found at {status_path}")
         return []
-    import pandas as pd
-
-    df = pd.read_csv(status_path)
-    rows = []
-    for _, r in df.iterrows():
-        rows.append({"num": int(r["num"]), "processed": bool(r["processed"]), "failed": bool(r.get("failed", False)), "error": str(r.get("error", ""))})
+    rows = _read_status_rows(status_path)
     log(project_id, f"get_status_rows: returning {len(rows)} rows from {status_path}")
     return rows
 
 
+def stream_status_rows(project_id: str) -> Iterator[dict]:
+    """Like `get_status_rows`, but yields the rows while reading the status CSV."""
+    status_path = _status_path(project_id)
+    log(project_id, f"stream_status_rows called for {status_path}")
+    if not status_path.exists():
+        return
+    yield from _iter_status_rows(status_path)
+
+
 def remove_status_csv(project_id: str) -> None:
-    csv_path = get_csv_path(project_id)
-    status_path = csv_path.parent / (csv_path.stem + ".status.csv")
+    status_path = _status_path(project_id)
     try:
-        if status_path.exists():
-            status_path.unlink()
-            log(project_id, f"remove_status_csv: removed {status_path}")
+        with locks.project_lock(project_id):
+            if status_path.exists():
+                status_path.unlink()
+                log(project_id, f"remove_status_csv: removed {status_path}")
     except Exception:
         log(project_id, f"remove_status_csv: failed to remove {status_path}", level="ERROR")
         pass
@@ -0,0 +1,178 @@
+"""Shared dispatcher for provider calls (TTS and LLM) with priority classes.
+
+Every call to the provider goes through `slot(kind)`, which waits for one of
+the `kind`'s slots. When a slot frees up it is granted to the best waiter:
+
+1. lowest priority class first: INTERACTIVE (a user clicking on a card) >
+   BULK (bulk runs / pipeline) > SPECULATIVE (background pre-renders);
+2. within a class, the project with the fewest calls in flight (fair share),
+   so a 500-row run on one project does not starve another project's run, and
+   a project that has made many calls before is not penalised once others
+   start;
+3. then FIFO.
+
+Bulk workers take a slot per provider call and give it back right after, so
+an interactive request waits at most for one in-flight call. On top of that
+`DISPATCH_INTERACTIVE_RESERVED` slots are kept for interactive requests only.
+
+The class and project of the current thread are set with `context(...)`;
+calls made without it are treated as BULK.
+"""
+from __future__ import annotations
+import contextvars
+import itertools
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from ..config import settings
+from . import tracing
+
+INTERACTIVE, BULK, SPECULATIVE = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk", SPECULATIVE: "speculative"}
+
+_current: contextvars.ContextVar[tuple[int, str]] = contextvars.ContextVar("dispatch_context", default=(BULK, ""))
+
+
+@contextmanager
+def context(priority: int, project_id: str = "") -> Iterator[None]:
+    """Run the enclosed provider calls with the given priority class and project."""
+    token = _current.set((priority, project_id))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current() -> tuple[int, str]:
+    return _current.get()
+
+
+class _Waiter:
+    __slots__ = ("priority", "project_id", "seq", "enqueued")
+
+    def __init__(self, priority: int, project_id: str, seq: int):
+        self.priority = priority
+        self.project_id = project_id
+        self.seq = seq
+        self.enqueued = time.perf_counter()
+
+
+class ProviderPool:
+    """Slots for one provider kind, granted by (priority, fair share, FIFO)."""
+
+    def __init__(self, kind: str, capacity: int, interactive_reserved: int = 0):
+        self.kind = kind
+        self.capacity = max(1, capacity)
+        self.reserved = min(max(0, interactive_reserved), self.capacity - 1)
+        self.in_use = 0
+        self._cond = threading.Condition()
+        self._waiters: list[_Waiter] = []
+        self._seq = itertools.count()
+        # calls in flight per project; entries are dropped when they reach 0
+        self._active: Dict[str, int] = {}
+        self._granted: Dict[int, int] = defaultdict(int)
+        self._waits: Dict[int, deque] = defaultdict(lambda: deque(maxlen=1000))
+
+    def _limit(self, priority: int) -> int:
+        return self.capacity if priority == INTERACTIVE else self.capacity - self.reserved
+
+    def _next(self) -> Optional[_Waiter]:
+        best = None
+        for w in self._waiters:
+            if self.in_use >= self._limit(w.priority):
+                continue
+            key = (w.priority, self._active.get(w.project_id, 0), w.seq)
+            if best is None or key < best[0]:
+                best = (key, w)
+        return best[1] if best else None
+
+    def acquire(self, priority: int, project_id: str) -> None:
+        with self._cond:
+            w = _Waiter(priority, project_id, next(self._seq))
+            self._waiters.append(w)
+            try:
+                while self._next() is not w:
+                    self._cond.wait()
+            except BaseException:
+                self._waiters.remove(w)
+                self._cond.notify_all()
+                raise
+            self._waiters.remove(w)
+            self.in_use += 1
+            self._active[project_id] = self._active.get(project_id, 0) + 1
+            self._granted[priority] += 1
+            self._waits[priority].append(time.perf_counter() - w.enqueued)
+            # another waiter may also fit now (e.g. a free interactive slot)
+            self._cond.notify_all()
+
+    def release(self, project_id: str) -> None:
+        with self._cond:
+            self.in_use -= 1
+            n = self._active.get(project_id, 0) - 1
+            if n > 0:
+                self._active[project_id] = n
+            else:
+                self._active.pop(project_id, None)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            waiting: Dict[str, int] = defaultdict(int)
+            for w in self._waiters:
+                waiting[PRIORITY_NAMES[w.priority]] += 1
+            wait_ms = {}
+            for prio, samples in self._waits.items():
+                xs = sorted(samples)
+                if xs:
+                    wait_ms[PRIORITY_NAMES[prio]] = {
+                        "p50": round(xs[len(xs) // 2] * 1000, 2),
+                        "p95": round(xs[min(len(xs) - 1, int(len(xs) * 0.95))] * 1000, 2),
+                    }
+            return {
+                "capacity": self.capacity,
+                "interactive_reserved": self.reserved,
+                "in_use": self.in_use,
+                "waiting": dict(waiting),
+                "granted": {PRIORITY_NAMES[p]: n for p, n in self._granted.items()},
+                "wait_ms": wait_ms,
+            }
+
+
+_pools: Dict[str, ProviderPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(kind: str) -> ProviderPool:
+    with _pools_lock:
+        if kind not in _pools:
+            capacity, reserved = {
+                "tts": (settings.DISPATCH_TTS_SLOTS, settings.DISPATCH_INTERACTIVE_RESERVED),
+                "llm": (settings.DISPATCH_LLM_SLOTS, settings.DISPATCH_INTERACTIVE_RESERVED),
+                # local TTS: one slot per worker process of its pool; holding one back
+                # for interactive calls would leave a warm CPU worker idle during bulk drafts
+                "tts_local": (settings.LOCAL_TTS_WORKERS, settings.LOCAL_TTS_INTERACTIVE_RESERVED),
+            }[kind]
+            _pools[kind] = ProviderPool(kind, capacity, reserved)
+        return _pools[kind]
+
+
+@contextmanager
+def slot(kind: str) -> Iterator[None]:
+    """Hold one provider slot of `kind` ("tts" | "tts_local" | "llm") for the enclosed call."""
+    priority, project_id = _current.get()
+    pool = get_pool(kind)
+    with tracing.span("dispatch.wait", pool=kind, priority=PRIORITY_NAMES[priority]):
+        pool.acquire(priority, project_id)
+    try:
+        yield
+    finally:
+        pool.release(project_id)
+
+
+def stats() -> dict:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {p.kind: p.stats() for p in pools}
@@ -1,20 +1,19 @@
 from __future__ import annotations
 from openai import OpenAI
 from ..config import settings
-from .csv_store import read_csv, write_csv
-from .project_info import read_info
-from pydantic import BaseModel
+from .csv_store import read_records, get_record, update_record, update_records
+from . import dispatcher
+from . import llm_routing
+from . import prompt_builder
+from . import tracing
+from . import run_control
+from pydantic import BaseModel, ValidationError
+from typing import Iterator
 import json
+import threading
+import time
 from app.services.project_logger import log
 
-SYSTEM_PROMPT = (
-    "Eres un asistente que corrige y normaliza texto y sugiere pautas de entonación para TTS. "
-    "Para cada par pregunta/respuesta, devuelve versiones limpiadas y naturales del texto y una sugerencia de entonación orientada a TTS. "
-    "Las sugerencias deben ser concisas, indicar ritmo, pausas, tono y cualquier marca relevante para la voz TTS. "
-    "Mantén el idioma y las variantes del texto original a menos que el contexto del proyecto indique lo contrario. "
-    "Usa el contexto si se proporciona para darle más precisión a las sugerencias."
-)
-
 # Plantilla breve para entonación – se puede editar en UI
 ENTONACION_Q = (
     "Pauta breve para la pregunta (entrevistador): indica tono, ritmo, pausas y marcas expresivas (por ejemplo: nervioso, enérgico, calmado). "
@@ -30,222 +29,309 @@ def get_client() -> OpenAI:
         return OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_API_BASE)
     return OpenAI(api_key=settings.OPENAI_API_KEY)
 
-def process_all(project_id: str, overwrite_texts: bool = True, overwrite_prompts: bool = True, project_prompt: str | None = None) -> int:
+
+class LLMOutput(BaseModel):
+    pregunta_limpia: str
+    respuesta_limpia: str
+    entonacion_p: str
+    entonacion_r: str
+
+
+def _usage_attrs(sp, resp) -> None:
+    """Token counts of a response on its trace span."""
+    usage = getattr(resp, "usage", None)
+    if sp is None or usage is None:
+        return
+    sp.set(input_tokens=getattr(usage, "input_tokens", None), output_tokens=getattr(usage, "output_tokens", None))
+
+
+def _complete(project_id: str, client: OpenAI, builder: prompt_builder.PromptBuilder, pregunta: str, respuesta: str, num: int,
+              run: run_control.Run | None = None, route: llm_routing.Route | None = None) -> dict:
+    """One LLM call for a row: cached-prefix messages + row payload -> parsed output dict.
+
+    With `run` (a bulk run) the response is streamed so that cancelling the run
+    closes the connection mid-generation; it raises `run_control.RunCancelled`.
+    With `route` the call uses the route's model and is accounted in the routing report.
+    """
+    messages = builder.messages(pregunta, respuesta)
+    model = (route.model if route is not None else None) or settings.OPENAI_MODEL_LLM
+    # Log the exact input sent to the LLM for this project (daily project logs)
+    log(project_id, f"LLM input: {json.dumps(messages, ensure_ascii=False)}", level="DEBUG")
+
+    try:
+        with dispatcher.slot("llm"), tracing.span("llm.provider", num=num, model=model) as sp:
+            t0 = time.perf_counter()
+            if run is None:
+                resp = client.responses.parse(
+                    model=model,
+                    input=messages,
+                    text_format=LLMOutput,
+                    prompt_cache_key=builder.cache_key,
+                )
+            else:
+                if run.cancelled():
+                    raise run_control.RunCancelled(run.id)
+                with client.responses.stream(
+                    model=model,
+                    input=messages,
+                    text_format=LLMOutput,
+                    extra_body={"prompt_cache_key": builder.cache_key},
+                ) as stream:
+                    for _ in stream:
+                        if run.cancelled():
+                            raise run_control.RunCancelled(run.id)
+                    resp = stream.get_final_response()
+            _usage_attrs(sp, resp)
+            if route is not None:
+                llm_routing.record(project_id, route, (time.perf_counter() - t0) * 1000, getattr(resp, "usage", None))
+    except run_control.RunCancelled:
+        log(project_id, f"LLM call cancelled for num={num}")
+        raise
+    except Exception as e:
+        log(project_id, f"LLM call failed for num={num}: {e}", level="ERROR")
+        raise
+    prompt_builder.record_usage(project_id, getattr(resp, "usage", None))
+
+    try:
+        data = resp.output_parsed  # SDK >=1.40
+        if not isinstance(data, dict):
+            # Fallback: extraer texto
+            txt = resp.output[0].content[0].text or "{}"
+            data = json.loads(txt)
+    except Exception:
+        # Fallback robusto
+        txt = getattr(resp, "output_text", "{}")
+        data = json.loads(txt or "{}")
+    return data
+
+
+def _row_output(project_id: str, client: OpenAI, builder: prompt_builder.PromptBuilder, pregunta: str, respuesta: str, num: int,
+                overwrite_texts: bool, overwrite_prompts: bool, routing: bool, run: run_control.Run | None = None) -> dict:
+    """Model output for a row; with `routing`, pre-screened locally first (see `llm_routing`)."""
+    if not routing:
+        return _complete(project_id, client, builder, pregunta, respuesta, num, run=run)
+    route = llm_routing.screen(pregunta, respuesta, overwrite_texts, overwrite_prompts)
+    sp = tracing.current()
+    if sp is not None:
+        sp.set(route=route.name)
+    if route.name != "skip":
+        return _complete(project_id, client, builder, pregunta, respuesta, num, run=run, route=route)
+    t0 = time.perf_counter()
+    data = llm_routing.local_output(pregunta, respuesta)
+    llm_routing.record(project_id, route, (time.perf_counter() - t0) * 1000)
+    log(project_id, f"LLM skipped for num={num} (noise={route.noise})")
+    return data
+
+
+def process_all(project_id: str, overwrite_texts: bool = True, overwrite_prompts: bool = True, project_prompt: str | None = None,
+                routing: bool | None = None) -> int:
     """Recorre el CSV del `project_id` y reescribe pregunta/respuesta y/o entonaciones con el LLM.
 
     project_prompt: texto opcional proporcionado por el usuario que se incluirá como contexto adicional
     para que el LLM tenga en cuenta durante la generación de limpieza y entonaciones.
+    routing: enrutar cada fila según su texto (ver `llm_routing`); por defecto `LLM_ROUTING`.
     """
-    log(project_id, f"process_all called overwrite_texts={overwrite_texts} overwrite_prompts={overwrite_prompts}")
-    df = read_csv(project_id)
-    if df.empty:
+    if routing is None:
+        routing = settings.LLM_ROUTING
+    log(project_id, f"process_all called overwrite_texts={overwrite_texts} overwrite_prompts={overwrite_prompts} routing={routing}")
+    table = read_records(project_id)
+    if table.empty:
         log(project_id, "process_all: CSV vacío, nada que procesar")
         return 0
 
-    client = get_client()
-
-    for i, row in df.iterrows():
-        pregunta = row["pregunta"]
-        respuesta = row["respuesta"]
-
-        # Pedimos al modelo que devuelva JSON compacto
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-        ]
-
-        # Añadimos contexto adicional proporcionado por el usuario si existe
-        # Importante: el prompt del proyecto se manda como role:"user" (contexto), no como system
-        
-        try:
-            info = read_info(project_id) or {}
-            interviewer = info.get("interviewer", {})
-            interviewee = info.get("interviewee", {})
-            lang = interviewer.get("language") or interviewee.get("language") or "es"
-            acc = interviewer.get("accent") or interviewee.get("accent") or ""
-            v_int = interviewer.get("voice", "")
-            v_intv = interviewee.get("voice", "")
-            proj_ctx = (
-                f"idioma={lang}, acento={acc}. "
-                f"Voz entrevistador={v_int}, voz entrevistada={v_intv}. "
-                "Ten en cuenta este contexto (idioma, acento y voces) al proponer entonaciones y adaptar la pronunciación."
-            )
-        except Exception:
-            proj_ctx = ""
-
-        messages.append(
-            {
-                "role": "user",
-                "content": f"""
-                Devuelve JSON con las claves: 
-                {{
-                "pregunta_limpia": string,
-                "respuesta_limpia": string,
-                "entonacion_p": string,
-                "entonacion_r": string
-                }}
-
-                CONTEXTO (puede estar vacío):
-                {project_prompt}
-                {proj_ctx}
-
-                TEXTO ORIGINAL:
-                PREGUNTA: {pregunta}
-                RESPUESTA: {respuesta}
-                """,
-            }
-        )
-
-        class LLMOutput(BaseModel):
-            pregunta_limpia: str
-            respuesta_limpia: str
-            entonacion_p: str
-            entonacion_r: str
-
-        # Usamos Responses API (client.responses.create) para estructura JSON
-        # Log the exact input sent to the LLM for this project (daily project logs)
-        log(project_id, f"LLM input: {json.dumps(messages, ensure_ascii=False)}", level="DEBUG")
-
-        try:
-            resp = client.responses.parse(
-                model=settings.OPENAI_MODEL_LLM,
-                input=messages,
-                text_format=LLMOutput,
-            )
-        except Exception as e:
-            log(project_id, f"LLM call failed for record index={i}: {e}", level="ERROR")
-            raise
-
-        try:
-            data = resp.output_parsed  # SDK >=1.40
-            if not isinstance(data, dict):
-                # Fallback: extraer texto
-                txt = resp.output[0].content[0].text or "{}"
-                data = json.loads(txt)
-        except Exception:
-            # Fallback robusto
-            txt = getattr(resp, "output_text", "{}")
-            data = json.loads(txt or "{}")
+    with tracing.span("llm.client"):
+        client = get_client()
+    # system + contexto del proyecto: prefijo idéntico para todas las filas (caché de prompts del proveedor)
+    builder = prompt_builder.get_builder(project_id, project_prompt)
+    changes: dict[int, dict] = {}
 
+    for row in table:
+        with tracing.span("llm.row", num=row.num):
+            data = _row_output(project_id, client, builder, row.pregunta, row.respuesta, row.num, overwrite_texts, overwrite_prompts, routing)
+
+        updates = {}
         if overwrite_texts and data.get("pregunta_limpia"):
-            df.at[i, "pregunta"] = data["pregunta_limpia"]
+            updates["pregunta"] = data["pregunta_limpia"]
         if overwrite_texts and data.get("respuesta_limpia"):
-            df.at[i, "respuesta"] = data["respuesta_limpia"]
+            updates["respuesta"] = data["respuesta_limpia"]
 
         if overwrite_prompts:
-            df.at[i, "entonacion_p"] = data.get("entonacion_p", ENTONACION_Q)
-            df.at[i, "entonacion_r"] = data.get("entonacion_r", ENTONACION_R)
+            updates["entonacion_p"] = data.get("entonacion_p", ENTONACION_Q)
+            updates["entonacion_r"] = data.get("entonacion_r", ENTONACION_R)
+        changes[row.num] = updates
 
-    write_csv(df, project_id)
-    log(project_id, f"process_all completed - wrote {len(df)} records back to CSV")
-    return len(df)
+    # merge only the generated fields (under the project lock), not the whole
+    # snapshot read at the start, so concurrent edits are not overwritten
+    update_records(project_id, changes)
+    log(project_id, f"process_all completed - wrote {len(table)} records back to CSV")
+    return len(table)
 
 
-def process_one(project_id: str, num: int, overwrite_texts: bool = True, overwrite_prompts: bool = True, part: str = "both", project_prompt: str | None = None) -> dict:
+def process_one(project_id: str, num: int, overwrite_texts: bool = True, overwrite_prompts: bool = True, part: str = "both", project_prompt: str | None = None,
+                run: run_control.Run | None = None, routing: bool = False) -> dict:
     """Procesa un único registro identificado por `num`.
 
     part: 'pregunta' | 'respuesta' | 'both' – decide qué campos actualizar.
+    run: ejecución masiva en curso; si se cancela durante la llamada no se escribe
+    nada y se lanza `run_control.RunCancelled`.
+    routing: enrutar la fila según su texto (saltar el LLM, modelo pequeño o completo; ver `llm_routing`).
     Devuelve el diccionario del registro actualizado.
     """
     log(project_id, f"process_one called num={num} part={part} overwrite_texts={overwrite_texts} overwrite_prompts={overwrite_prompts}")
-    df = read_csv(project_id)
-    if df.empty:
-        log(project_id, "process_one failed - CSV vacío o proyecto no encontrado", level="ERROR")
-        raise ValueError("CSV vacío o proyecto no encontrado")
-
-    idx = df.index[df["num"] == num]
-    if len(idx) == 0:
+    rec = get_record(project_id, num)
+    if rec is None:
+        log(project_id, f"process_one failed - registro num={num} no encontrado (o CSV vacío)", level="ERROR")
         raise ValueError("Registro no encontrado")
 
-    i = idx[0]
-    pregunta = df.at[i, "pregunta"]
-    respuesta = df.at[i, "respuesta"]
+    with tracing.span("llm.client"):
+        client = get_client()
+    builder = prompt_builder.get_builder(project_id, project_prompt)
+    data = _row_output(project_id, client, builder, rec.pregunta, rec.respuesta, num, overwrite_texts, overwrite_prompts, routing, run=run)
 
-    client = get_client()
+    return _apply(project_id, num, data, part, overwrite_texts, overwrite_prompts)
 
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-    ]
-
-    # include project context (lang/accent/voices) and optional project-level prompt
-    try:
-        info = read_info(project_id) or {}
-        interviewer = info.get("interviewer", {})
-        interviewee = info.get("interviewee", {})
-        lang = interviewer.get("language") or interviewee.get("language") or "es"
-        acc = interviewer.get("accent") or interviewee.get("accent") or ""
-        v_int = interviewer.get("voice", "")
-        v_intv = interviewee.get("voice", "")
-        proj_ctx = (
-            f"idioma={lang}, acento={acc}. "
-            f"Voz entrevistador={v_int}, voz entrevistada={v_intv}. "
-            "Ten en cuenta este contexto (idioma, acento y voces) al proponer entonaciones y adaptar la pronunciación."
-        )
-    except Exception:
-        proj_ctx = ""
-
-    messages.append(
-        {
-            "role": "user",
-            "content": f"""
-                Devuelve JSON con las claves: 
-                {{
-                "pregunta_limpia": string,
-                "respuesta_limpia": string,
-                "entonacion_p": string,
-                "entonacion_r": string
-                }}
-
-                CONTEXTO (puede estar vacío):
-                {project_prompt or ''}
-                {proj_ctx}
-
-                TEXTO ORIGINAL:
-                PREGUNTA: {pregunta}
-                RESPUESTA: {respuesta}
-                """,
-        }
-    )
-
-    class LLMOutput(BaseModel):
-        pregunta_limpia: str
-        respuesta_limpia: str
-        entonacion_p: str
-        entonacion_r: str
-
-    # Log the exact input sent to the LLM for this project (daily project logs)
-    log(project_id, f"LLM input: {json.dumps(messages, ensure_ascii=False)}", level="DEBUG")
-
-    try:
-        resp = client.responses.parse(
-            model=settings.OPENAI_MODEL_LLM,
-            input=messages,
-            text_format=LLMOutput,
-        )
-    except Exception as e:
-        log(project_id, f"LLM call failed for num={num}: {e}", level="ERROR")
-        raise
-
-
-    try:
-        data = resp.output_parsed
-        if not isinstance(data, dict):
-            txt = resp.output[0].content[0].text or "{}"
-            data = json.loads(txt)
-    except Exception:
-        txt = getattr(resp, "output_text", "{}")
-        data = json.loads(txt or "{}")
 
+def _apply(project_id: str, num: int, data: dict, part: str, overwrite_texts: bool, overwrite_prompts: bool) -> dict:
     # Aplicar cambios respetando el parámetro `part`
+    updates = {}
     if part in ("pregunta", "both") and overwrite_texts and data.get("pregunta_limpia"):
-        df.at[i, "pregunta"] = data["pregunta_limpia"]
+        updates["pregunta"] = data["pregunta_limpia"]
     if part in ("respuesta", "both") and overwrite_texts and data.get("respuesta_limpia"):
-        df.at[i, "respuesta"] = data["respuesta_limpia"]
+        updates["respuesta"] = data["respuesta_limpia"]
 
     if part in ("pregunta", "both") and overwrite_prompts:
-        df.at[i, "entonacion_p"] = data.get("entonacion_p", ENTONACION_Q)
+        updates["entonacion_p"] = data.get("entonacion_p", ENTONACION_Q)
     if part in ("respuesta", "both") and overwrite_prompts:
-        df.at[i, "entonacion_r"] = data.get("entonacion_r", ENTONACION_R)
+        updates["entonacion_r"] = data.get("entonacion_r", ENTONACION_R)
+
+    # re-read + write under the project lock: other rows may have been updated
+    # by concurrent workers while the LLM call was in flight
+    return update_record(project_id, num, **updates)
 
-    write_csv(df, project_id)
 
-    return df.loc[i].to_dict()
+class FieldStream:
+    """Incremental decoder of the model's JSON output: text deltas -> (field, decoded text) pieces.
+
+    Only string values are reported, as they grow; keys, punctuation and
+    incomplete escape sequences stay buffered until the next delta.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._state = "out"  # out | key | value
+        self._key = ""
+        self._field = None  # key whose value comes next (after ':')
+        self._expect_value = False
+
+    def feed(self, delta: str) -> list[tuple[str, str]]:
+        self._buf += delta
+        out: list[tuple[str, str]] = []
+        piece = []
+        buf, i = self._buf, 0
+        while i < len(buf):
+            ch = buf[i]
+            if self._state == "out":
+                if ch == '"':
+                    self._state = "value" if self._expect_value else "key"
+                    self._key = ""
+                elif ch == ":":
+                    self._expect_value = True
+                elif ch in ",{}":
+                    self._expect_value = False
+                i += 1
+                continue
+            if ch == "\\":
+                end = i + 2
+                if buf[i + 1:i + 2] == "u":
+                    end = i + 6
+                    # surrogate pair: wait for the low half too
+                    if "D800" <= buf[i + 2:end].upper() < "DC00":
+                        end += 6
+                if end > len(buf):
+                    break
+                try:
+                    ch = json.loads(f'"{buf[i:end]}"')
+                except ValueError:
+                    ch = buf[i:end]
+                i = end
+            elif ch == '"':
+                if self._state == "key":
+                    self._field = self._key
+                elif piece:
+                    out.append((self._field, "".join(piece)))
+                    piece = []
+                self._state = "out"
+                self._expect_value = False
+                i += 1
+                continue
+            else:
+                i += 1
+            if self._state == "key":
+                self._key += ch
+            else:
+                piece.append(ch)
+        if piece:
+            out.append((self._field, "".join(piece)))
+        # keep only what has not been consumed (an incomplete escape)
+        self._buf = buf[i:]
+        return out
+
+
+def stream_one(project_id: str, num: int, overwrite_texts: bool = True, overwrite_prompts: bool = True, part: str = "both", project_prompt: str | None = None,
+               stop: threading.Event | None = None) -> Iterator[tuple[str, dict]]:
+    """Como `process_one`, pero va devolviendo la salida del modelo según se genera.
+
+    Eventos: ("delta", {field, text}) con cada trozo de `pregunta_limpia`,
+    `respuesta_limpia`, `entonacion_p`, `entonacion_r` (en ese orden) y, al final,
+    ("record", {record}) con el registro guardado. El registro solo se escribe
+    cuando llega el objeto completo y valida contra `LLMOutput`.
+    `stop`: si se activa (el cliente se desconectó) se cierra el stream del modelo
+    entre dos eventos, se libera el slot y el registro no se modifica.
+    """
+    log(project_id, f"stream_one called num={num} part={part} overwrite_texts={overwrite_texts} overwrite_prompts={overwrite_prompts}")
+    rec = get_record(project_id, num)
+    if rec is None:
+        log(project_id, f"stream_one failed - registro num={num} no encontrado (o CSV vacío)", level="ERROR")
+        raise ValueError("Registro no encontrado")
+
+    with tracing.span("llm.client"):
+        client = get_client()
+    builder = prompt_builder.get_builder(project_id, project_prompt)
+    messages = builder.messages(rec.pregunta, rec.respuesta)
+    log(project_id, f"LLM input: {json.dumps(messages, ensure_ascii=False)}", level="DEBUG")
+
+    fields = FieldStream()
+    try:
+        with dispatcher.slot("llm"), tracing.span("llm.stream", num=num) as sp:
+            with client.responses.stream(
+                model=settings.OPENAI_MODEL_LLM,
+                input=messages,
+                text_format=LLMOutput,
+                extra_body={"prompt_cache_key": builder.cache_key},
+            ) as stream:
+                for event in stream:
+                    if stop is not None and stop.is_set():
+                        # leaving the block closes the HTTP stream: no more tokens are generated
+                        log(project_id, f"stream_one stopped num={num}: client disconnected")
+                        if sp is not None:
+                            sp.set(stopped=True)
+                        return
+                    if event.type == "response.output_text.delta":
+                        if sp is not None and "ttft_ms" not in sp.attrs:
+                            sp.set(ttft_ms=sp.elapsed_ms())
+                        for field, text in fields.feed(event.delta):
+                            yield "delta", {"field": field, "text": text}
+                final = stream.get_final_response()
+                _usage_attrs(sp, final)
+    except Exception as e:
+        log(project_id, f"LLM stream failed for num={num}: {e}", level="ERROR")
+        raise
+    prompt_builder.record_usage(project_id, getattr(final, "usage", None))
+
+    parsed = getattr(final, "output_parsed", None)
+    try:
+        data = (parsed if isinstance(parsed, LLMOutput) else LLMOutput.model_validate_json(final.output_text or "")).model_dump()
+    except ValidationError as e:
+        log(project_id, f"LLM stream output invalid for num={num}: {e}", level="ERROR")
+        raise ValueError("Salida del LLM incompleta o no válida") from e
+    yield "record", {"record": _apply(project_id, num, data, part, overwrite_texts, overwrite_prompts)}
@@ -0,0 +1,158 @@
+"""Per-row routing of the LLM cleanup in bulk runs, decided by a local pre-screen.
+
+Before a row goes to the model, `screen` looks at its text (no API call) and
+picks a route:
+
+- `skip`: nothing needs the model. Either the text only has mechanical noise
+  (soft hyphens, repeated spaces, line breaks, non-breaking spaces), which
+  `pdf_parser.normalize` fixes locally, and the run does not regenerate
+  entonaciones, or the run has nothing to write.
+- `small`: short rows with no noise that needs judgement. Trivial one-line
+  questions and clean text that only needs entonaciones go to
+  `LLM_MODEL_SMALL`.
+- `full`: broken words, replacement characters, misplaced punctuation, or
+  long rows go to `OPENAI_MODEL_LLM`.
+
+Without `LLM_MODEL_SMALL` the `small` route is folded into `full`. Routing
+applies to bulk runs (LLM start, pipeline, `process_all`) unless disabled
+(`LLM_ROUTING=0`, or `"routing": false` in the start body). Single-row requests
+always use the full model.
+
+`record` keeps per-project, per-route counts, latency and tokens (since the
+process started, like `prompt_builder.stats`); `report` returns them and
+`preview` predicts the routes of the current CSV.
+"""
+from __future__ import annotations
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from ..config import settings
+from . import csv_store
+from .pdf_parser import normalize
+
+ROUTES = ("skip", "small", "full")
+
+# noise normalize() removes without changing any word
+MECHANICAL = {
+    "soft_hyphen": re.compile("\u00ad"),
+    "double_space": re.compile(r"[ \t]{2,}"),
+    "line_break": re.compile(r"[\r\n\f]"),
+    "nbsp": re.compile("[\u00a0\u2007\u202f]"),
+}
+# noise that needs the model: fixing it means choosing words or punctuation
+SEMANTIC = {
+    # "pala- bra", "pala-\nbra": a word split at a line end
+    "broken_word": re.compile(r"[^\W\d_]-[ \t]*[\r\n]+[ \t]*[^\W\d_]|[a-záéíóúñü]- [a-záéíóúñü]"),
+    "replacement_char": re.compile("\ufffd"),
+    "space_before_punct": re.compile(r"[^\W_] +[,.;:!?)]"),
+    "ligature": re.compile("[\ufb00-\ufb06]"),
+    "repeated_punct": re.compile(r"([,;:])\1+|\.{4,}"),
+}
+
+
+@dataclass
+class Route:
+    name: str
+    model: Optional[str]
+    chars: int
+    noise: Dict[str, int] = field(default_factory=dict)
+
+
+def noise(text: str) -> Dict[str, int]:
+    """{kind: occurrences} of the noise patterns found in `text`."""
+    found = {}
+    for kind, pattern in {**MECHANICAL, **SEMANTIC}.items():
+        n = len(pattern.findall(text))
+        if n:
+            found[kind] = n
+    return found
+
+
+def small_model() -> Optional[str]:
+    return settings.LLM_MODEL_SMALL or None
+
+
+def screen(pregunta: str, respuesta: str, overwrite_texts: bool = True, overwrite_prompts: bool = True) -> Route:
+    """Route of one row (see the module docstring)."""
+    text = f"{pregunta}\n{respuesta}"
+    chars = len(pregunta) + len(respuesta)
+    found = noise(text)
+    semantic = overwrite_texts and any(kind in SEMANTIC for kind in found)
+    if not overwrite_prompts and not semantic:
+        return Route("skip", None, chars, found)
+    if not semantic and chars <= settings.LLM_SMALL_MAX_CHARS and small_model():
+        return Route("small", small_model(), chars, found)
+    return Route("full", settings.OPENAI_MODEL_LLM, chars, found)
+
+
+def local_output(pregunta: str, respuesta: str) -> dict:
+    """Output of a `skip` row in the shape of the model's (no entonaciones)."""
+    return {"pregunta_limpia": normalize(pregunta), "respuesta_limpia": normalize(respuesta)}
+
+
+class _RouteStats:
+    __slots__ = ("rows", "ms_total", "ms_max", "input_tokens", "output_tokens")
+
+    def __init__(self):
+        self.rows = 0
+        self.ms_total = 0.0
+        self.ms_max = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "avg_ms": round(self.ms_total / self.rows, 1) if self.rows else 0.0,
+            "max_ms": round(self.ms_max, 1),
+            "total_ms": round(self.ms_total, 1),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+        }
+
+
+_stats: Dict[str, Dict[str, _RouteStats]] = defaultdict(lambda: {r: _RouteStats() for r in ROUTES})
+_noise: Dict[str, Counter] = defaultdict(Counter)
+_lock = threading.Lock()
+
+
+def record(project_id: str, route: Route, ms: float, usage: Any = None) -> None:
+    """Account one routed row: its latency and, for model routes, the response's token usage."""
+    with _lock:
+        s = _stats[project_id][route.name]
+        s.rows += 1
+        s.ms_total += ms
+        s.ms_max = max(s.ms_max, ms)
+        if usage is not None:
+            s.input_tokens += getattr(usage, "input_tokens", 0) or 0
+            s.output_tokens += getattr(usage, "output_tokens", 0) or 0
+        _noise[project_id].update(route.noise)
+
+
+def report(project_id: str) -> dict:
+    """Rows, latency and tokens per route of the project's routed rows, and the noise seen."""
+    with _lock:
+        routes = {name: s.as_dict() for name, s in (_stats[project_id] if project_id in _stats else {r: _RouteStats() for r in ROUTES}).items()}
+        seen = dict(_noise.get(project_id) or {})
+    total = sum(r["rows"] for r in routes.values())
+    return {
+        "rows": total,
+        "routes": routes,
+        # rows that did not go to the full model
+        "saved_rate": round((routes["skip"]["rows"] + routes["small"]["rows"]) / total, 4) if total else 0.0,
+        "noise": seen,
+    }
+
+
+def preview(project_id: str, overwrite_texts: bool = True, overwrite_prompts: bool = True) -> dict:
+    """Routes the current CSV would take, without calling the model."""
+    counts = Counter()
+    seen = Counter()
+    for _, rec in csv_store.iter_records(project_id):
+        route = screen(rec.pregunta, rec.respuesta, overwrite_texts, overwrite_prompts)
+        counts[route.name] += 1
+        seen.update(route.noise)
+    return {"routes": {r: counts[r] for r in ROUTES}, "noise": dict(seen)}
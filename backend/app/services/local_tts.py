@@ -0,0 +1,226 @@
+"""Offline TTS on the local CPU, for drafts and proofreading.
+
+Renders run in a pool of worker processes (`LOCAL_TTS_WORKERS`) so synthesis
+does not hold the API's GIL. The pool is started with "spawn" (the API process
+has threads) on first use and kept warm: each worker loads its voices once,
+when it starts (`LOCAL_TTS_PRELOAD`, the default voices otherwise) or the first
+time a voice is asked for.
+
+Engines (`LOCAL_TTS_ENGINE`):
+
+- `piper`: neural voices (`pip install piper-tts`). A voice is the name of a
+  model in `LOCAL_TTS_VOICES_DIR`: `es_ES-davefx-medium` ->
+  `es_ES-davefx-medium.onnx` + `.onnx.json`.
+- `espeak`: the `espeak-ng` binary; a voice is an espeak voice (`es`, `es+m3`,
+  `es-419+f2`). Robotic, but tiny and instant.
+
+The PCM is encoded to mp3 with `lameenc` if installed, or `ffmpeg` otherwise,
+so drafts go through the same audio store / index as the provider's mp3s.
+`instructions` (entonaciones) are not supported by these engines and are ignored.
+"""
+from __future__ import annotations
+import multiprocessing
+import os
+import re
+import shutil
+import struct
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from ..config import settings
+
+try:
+    import lameenc
+except ImportError:  # optional dependency
+    lameenc = None
+
+ENGINES = ("piper", "espeak")
+DEFAULT_VOICES = {
+    "piper": ("es_ES-davefx-medium", "es_ES-sharvard-medium"),
+    "espeak": ("es+m3", "es+f3"),
+}
+_VOICE_NAME = re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_.+-]*$")
+
+
+class LocalTTSError(RuntimeError):
+    """The local engine or the mp3 encoder is missing or failed."""
+
+
+def engine() -> str:
+    name = (settings.LOCAL_TTS_ENGINE or "piper").lower()
+    if name not in ENGINES:
+        raise LocalTTSError(f"LOCAL_TTS_ENGINE desconocido: {name} (opciones: {', '.join(ENGINES)})")
+    return name
+
+
+def default_voice(role: str) -> str:
+    """Voice for "interviewer" / "interviewee" when the project does not set one."""
+    q, r = DEFAULT_VOICES[engine()]
+    if role == "interviewer":
+        return settings.LOCAL_TTS_VOICE_Q or q
+    return settings.LOCAL_TTS_VOICE_R or r
+
+
+def voices_dir() -> Path:
+    if settings.LOCAL_TTS_VOICES_DIR:
+        return Path(settings.LOCAL_TTS_VOICES_DIR)
+    return Path(__file__).resolve().parents[2] / "tts_models"
+
+
+def check_voice(voice: str) -> str:
+    """ValueError unless `voice` is a plausible voice name."""
+    # names become file names (piper) or command-line arguments (espeak)
+    if not voice or not _VOICE_NAME.match(voice) or ".." in voice:
+        raise ValueError(f"Voz local no válida: {voice!r}")
+    return voice
+
+
+# ---------------------------------------------------------------------------
+# worker process side
+
+
+_engine: str = ""
+_dir: Optional[Path] = None
+_loaded: Dict[str, object] = {}
+
+
+def _init_worker(engine_name: str, models_dir: str, preload: Tuple[str, ...]) -> None:
+    global _engine, _dir
+    _engine = engine_name
+    _dir = Path(models_dir)
+    for voice in preload:
+        try:
+            _voice(voice)
+        except Exception:
+            # a missing preload voice fails its own renders, not the whole pool
+            pass
+
+
+def _voice(name: str):
+    voice = _loaded.get(name)
+    if voice is None:
+        if _engine == "piper":
+            try:
+                from piper import PiperVoice
+            except ImportError as e:
+                raise LocalTTSError("piper-tts no está instalado (pip install piper-tts)") from e
+            model = _dir / f"{name}.onnx"
+            if not model.exists():
+                raise LocalTTSError(f"Modelo Piper no encontrado: {model}")
+            voice = PiperVoice.load(str(model))
+        else:
+            if shutil.which("espeak-ng") is None:
+                raise LocalTTSError("espeak-ng no está instalado")
+            voice = name
+        _loaded[name] = voice
+    return voice
+
+
+def _wav_pcm(wav: bytes) -> Tuple[bytes, int]:
+    """PCM s16le mono and sample rate of a WAV (espeak-ng streams it with a bogus data size)."""
+    if wav[:4] != b"RIFF" or wav[8:12] != b"WAVE":
+        raise LocalTTSError("espeak-ng no devolvió un WAV")
+    pos, rate = 12, 22050
+    while pos + 8 <= len(wav):
+        cid, size = wav[pos:pos + 4], struct.unpack("<I", wav[pos + 4:pos + 8])[0]
+        if cid == b"fmt ":
+            rate = struct.unpack("<I", wav[pos + 12:pos + 16])[0]
+        elif cid == b"data":
+            return wav[pos + 8:], rate
+        pos += 8 + size + (size & 1)
+    raise LocalTTSError("WAV sin datos")
+
+
+def _pcm(text: str, voice_name: str) -> Tuple[bytes, int]:
+    voice = _voice(voice_name)
+    if _engine == "piper":
+        rate = voice.config.sample_rate
+        if hasattr(voice, "synthesize_stream_raw"):  # piper-tts 1.2
+            return b"".join(voice.synthesize_stream_raw(text)), rate
+        return b"".join(chunk.audio_int16_bytes for chunk in voice.synthesize(text)), rate
+    proc = subprocess.run(
+        ["espeak-ng", "-v", voice, "-b", "1", "--stdin", "--stdout"],
+        input=text.encode("utf-8"), capture_output=True, timeout=300,
+    )
+    if proc.returncode != 0:
+        raise LocalTTSError(f"espeak-ng falló: {proc.stderr.decode(errors='replace')[:200]}")
+    return _wav_pcm(proc.stdout)
+
+
+def _mp3(pcm: bytes, rate: int) -> bytes:
+    kbps = settings.LOCAL_TTS_BITRATE
+    if lameenc is not None:
+        enc = lameenc.Encoder()
+        enc.set_bit_rate(kbps)
+        enc.set_in_sample_rate(rate)
+        enc.set_channels(1)
+        enc.set_quality(5)
+        return bytes(enc.encode(pcm) + enc.flush())
+    if shutil.which("ffmpeg") is None:
+        raise LocalTTSError("Para codificar mp3 hace falta lameenc (pip install lameenc) o ffmpeg")
+    proc = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "s16le", "-ar", str(rate), "-ac", "1",
+         "-i", "pipe:0", "-f", "mp3", "-b:a", f"{kbps}k", "pipe:1"],
+        input=pcm, capture_output=True, timeout=300,
+    )
+    if proc.returncode != 0:
+        raise LocalTTSError(f"ffmpeg falló: {proc.stderr.decode(errors='replace')[:200]}")
+    return proc.stdout
+
+
+def _render(text: str, voice: str) -> bytes:
+    pcm, rate = _pcm(text, voice)
+    return _mp3(pcm, rate)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+# ---------------------------------------------------------------------------
+# API process side
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            name = engine()
+            preload = tuple(v.strip() for v in settings.LOCAL_TTS_PRELOAD.split(",") if v.strip()) or (
+                default_voice("interviewer"), default_voice("interviewee"))
+            workers = max(1, settings.LOCAL_TTS_WORKERS)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(name, str(voices_dir()), preload),
+            )
+            # start every worker now (and load its voices) instead of on the first renders
+            for _ in range(workers):
+                _pool.submit(_ping)
+        return _pool
+
+
+def render(text: str, voice: str) -> bytes:
+    """mp3 of `text` with the local `voice`, rendered in the worker pool."""
+    global _pool
+    check_voice(voice)
+    pool = _get_pool()
+    try:
+        return pool.submit(_render, text, voice).result()
+    except BrokenProcessPool as e:
+        # a worker died (OOM, crash in the engine): start a fresh pool for the next render
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise LocalTTSError("El proceso de síntesis local terminó inesperadamente") from e
+
@@ -0,0 +1,98 @@
+"""Cross-process locks and atomic file replacement for project files.
+
+The backend can run with several uvicorn workers (`--workers N`) on the same
+voices volume, so in-process `threading` locks are not enough:
+
+- `project_lock(project_id, name)` serializes read-modify-write cycles on a
+  project's files across threads *and* processes. It combines a re-entrant
+  thread lock with an exclusive `flock` on `<project>/.<name>.lock`, and can be
+  nested within the same thread (e.g. `update_record` -> `write_csv`).
+- `atomic_path(path)` yields a temporary sibling path; on success it replaces
+  `path` with `os.replace`, so readers never see a half-written file.
+
+On platforms without `fcntl` (Windows) the lock is only in-process.
+"""
+from __future__ import annotations
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+from ..utils import BASE_VOICES_DIR
+from . import tracing
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+class _FileLock:
+    def __init__(self, path: Path):
+        self.path = path
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd: int | None = None
+
+    def acquire(self) -> None:
+        self._rlock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except BaseException:
+                    os.close(fd)
+                    raise
+            except BaseException:
+                self._rlock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._rlock.release()
+
+
+_locks: Dict[Tuple[str, str], _FileLock] = {}
+_locks_guard = threading.Lock()
+
+
+@contextmanager
+def project_lock(project_id: str, name: str = "csv") -> Iterator[None]:
+    """Exclusive lock `name` of a project, shared by all threads and workers."""
+    with _locks_guard:
+        lock = _locks.get((project_id, name))
+        if lock is None:
+            lock = _locks[(project_id, name)] = _FileLock(BASE_VOICES_DIR / project_id / f".{name}.lock")
+    with tracing.span("lock.wait", lock=name):
+        lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+@contextmanager
+def atomic_path(path: Path) -> Iterator[Path]:
+    """Yield a temp path next to `path`; replace `path` with it if the block succeeds."""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        try:
+            tmp.unlink()
+        except FileNotFoundError:
+            pass
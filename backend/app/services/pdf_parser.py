@@ -1,27 +1,234 @@
 from __future__ import annotations
 import re
-from typing import List, Tuple
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional, Tuple
 from app.services.project_logger import log
+from . import tracing
 
-PR_BLOCK_RE = re.compile(
-    r"Pregunta:\s*(.*?)\s*Respuesta:\s*(.*?)(?=(?:\n\s*Pregunta:)|\Z)",
-    re.DOTALL | re.IGNORECASE,
-)
+# Separador de páginas: el router de subida une el texto de cada página con un
+# salto de página (\f). `str.splitlines` lo trata como fin de línea, así que el
+# parser puede saber en qué página está sin una segunda pasada.
+PAGE_BREAK = "\f"
 
-def extract_pairs(text: str) -> List[Tuple[str, str]]:
-    """Extrae pares (pregunta, respuesta) del texto usando regex robusto.
-    - Captura hasta la siguiente 'Pregunta:' o fin del documento.
+# Etiquetas por defecto: rol -> lista de etiquetas que abren un turno de ese rol.
+# Un proyecto puede definir otras en su `.info` (clave `speaker_labels`), p.ej.
+# {"pregunta": ["P", "Entrevistador"], "respuesta": ["R", "Lacerta", "Ana"]}.
+DEFAULT_LABELS: Dict[str, List[str]] = {
+    "pregunta": ["Pregunta"],
+    "respuesta": ["Respuesta"],
+}
+
+# Las etiquetas cortas ("P:", "R:") solo se reconocen a principio de línea; en
+# medio de una frase darían demasiados falsos positivos.
+MIN_INLINE_LABEL_LEN = 3
+
+IDLE, QUESTION, ANSWER = "idle", "pregunta", "respuesta"
+
+
+@dataclass
+class Block:
+    pregunta: str
+    respuesta: str
+    page_start: int
+    page_end: int
+    offset: int
+    speakers: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ParseIssue:
+    kind: str  # orphan_text | missing_question | missing_answer | merged_turn
+    page: int
+    offset: int
+    detail: str = ""
+
+
+@dataclass
+class ParseResult:
+    blocks: List[Block] = field(default_factory=list)
+    issues: List[ParseIssue] = field(default_factory=list)
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        return [(b.pregunta, b.respuesta) for b in self.blocks]
+
+    def report(self) -> List[dict]:
+        return [asdict(i) for i in self.issues]
+
+
+class _Labels:
+    """Etiquetas compiladas una sola vez: regex de inicio de línea y regex en línea."""
+
+    def __init__(self, labels: Optional[Dict[str, List[str]]] = None):
+        labels = labels or DEFAULT_LABELS
+        self.role_of: Dict[str, str] = {}
+        for role in (QUESTION, ANSWER):
+            for name in labels.get(role) or []:
+                name = str(name).strip().rstrip(":").strip()
+                if name:
+                    self.role_of[name.lower()] = role
+        if not any(r == QUESTION for r in self.role_of.values()) or not any(r == ANSWER for r in self.role_of.values()):
+            raise ValueError("speaker_labels debe definir al menos una etiqueta para 'pregunta' y otra para 'respuesta'")
+        # las etiquetas más largas primero para que "Pregunta" gane a "P"
+        names = sorted(self.role_of, key=len, reverse=True)
+        alt = "|".join(re.escape(n) for n in names)
+        self.line_re = re.compile(rf"[^\S\n]*({alt})[^\S\n]*:", re.IGNORECASE)
+        inline = [n for n in names if len(n) >= MIN_INLINE_LABEL_LEN]
+        self.inline_re = (
+            re.compile(rf"(?<!\w)({'|'.join(re.escape(n) for n in inline)})[^\S\n]*:", re.IGNORECASE)
+            if inline
+            else None
+        )
+
+    def role(self, name: str) -> str:
+        return self.role_of[name.lower()]
+
+
+class _Parser:
+    """Máquina de estados IDLE -> QUESTION -> ANSWER -> QUESTION ... en una pasada."""
+
+    def __init__(self, labels: _Labels):
+        self.labels = labels
+        self.result = ParseResult()
+        self.state = IDLE
+        self.q: List[str] = []
+        self.r: List[str] = []
+        self.orphan: List[str] = []
+        self.speakers: List[str] = []
+        self.block_offset = 0
+        self.block_page = 1
+        self.last_speaker = ""
+
+    def _issue(self, kind: str, page: int, offset: int, detail: str = "") -> None:
+        self.result.issues.append(ParseIssue(kind, page, offset, detail))
+
+    def _append(self, text: str) -> None:
+        if self.state == QUESTION:
+            self.q.append(text)
+        elif self.state == ANSWER:
+            self.r.append(text)
+        else:
+            self.orphan.append(text)
+
+    def _close(self, page: int) -> None:
+        if self.state == IDLE:
+            return
+        q = normalize("".join(self.q))
+        r = normalize("".join(self.r))
+        if self.state == QUESTION:
+            self._issue("missing_answer", self.block_page, self.block_offset, q[:80])
+        if q or r:
+            self.result.blocks.append(Block(q, r, self.block_page, page, self.block_offset, self.speakers))
+        self.q, self.r, self.speakers = [], [], []
+        self.state = IDLE
+
+    def _label(self, name: str, page: int, offset: int) -> None:
+        role = self.labels.role(name)
+        if self.state == IDLE and self.orphan:
+            orphan = normalize("".join(self.orphan))
+            if orphan:
+                self._issue("orphan_text", page, offset, orphan[:80])
+            self.orphan = []
+        if role == QUESTION:
+            if self.state == QUESTION:
+                # pregunta seguida de otra pregunta: se unen si es otro interlocutor
+                if name.lower() == self.last_speaker.lower():
+                    self._close(page)
+                else:
+                    self._issue("merged_turn", page, offset, name)
+                    self.q.append(" ")
+                    self.speakers.append(name)
+                    self.last_speaker = name
+                    return
+            else:
+                self._close(page)
+            self.state = QUESTION
+            self.block_offset, self.block_page = offset, page
+        else:
+            if self.state == IDLE:
+                self._issue("missing_question", page, offset)
+                self.block_offset, self.block_page = offset, page
+            elif self.state == ANSWER:
+                # varios interlocutores responden al mismo bloque
+                self._issue("merged_turn", page, offset, name)
+                self.r.append(" ")
+            self.state = ANSWER
+        self.speakers.append(name)
+        self.last_speaker = name
+
+    def feed_line(self, line: str, page: int, offset: int) -> None:
+        m = self.labels.line_re.match(line)
+        pos = 0
+        if m:
+            self._label(m.group(1), page, offset + m.start(1))
+            pos = m.end()
+        # etiquetas en mitad de línea: solo las que hacen avanzar el bloque
+        # ("Pregunta: ... Respuesta: ..." en una sola línea)
+        inline_re = self.labels.inline_re
+        while inline_re is not None and self.state in (IDLE, QUESTION):
+            m = inline_re.search(line, pos)
+            if not m:
+                break
+            role = self.labels.role(m.group(1))
+            if (self.state == IDLE and role != QUESTION) or (self.state == QUESTION and role != ANSWER):
+                break
+            self._append(line[pos:m.start()])
+            self._label(m.group(1), page, offset + m.start(1))
+            pos = m.end()
+        self._append(line[pos:])
+
+    def finish(self, page: int) -> ParseResult:
+        self._close(page)
+        orphan = normalize("".join(self.orphan))
+        if orphan:
+            self._issue("orphan_text", page, -1, orphan[:80])
+        return self.result
+
+
+@tracing.traced("parse.transcript")
+def parse_transcript(text: str, labels: Optional[Dict[str, List[str]]] = None) -> ParseResult:
+    """Analiza una transcripción en una sola pasada (tiempo lineal).
+
+    - `labels`: rol -> etiquetas (ver `DEFAULT_LABELS`). Varias etiquetas por rol
+      permiten transcripciones con nombres de interlocutor o varios entrevistados.
+    - Los saltos de página (`PAGE_BREAK`) se usan para asignar página a cada bloque.
+    - Los bloques anómalos se conservan y se describen en `ParseResult.issues`.
+    """
+    parser = _Parser(_Labels(labels))
+    page = 1
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        parser.feed_line(line, page, offset)
+        offset += len(line)
+        if line.endswith(PAGE_BREAK):
+            page += 1
+    return parser.finish(page)
+
+
+def parse_pages(pages: List[str], labels: Optional[Dict[str, List[str]]] = None) -> ParseResult:
+    """Igual que `parse_transcript` pero recibe el texto ya separado por páginas."""
+    return parse_transcript(join_pages(pages), labels=labels)
+
+
+def extract_pages(source) -> List[str]:
+    """Texto de cada página de un PDF (ruta o fichero abierto), con pdfplumber."""
+    # pdfplumber se importa aquí: solo hace falta al subir PDFs y ralentiza el arranque
+    import pdfplumber
+
+    with pdfplumber.open(source) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
+
+
+def join_pages(pages: List[str]) -> str:
+    return ("\n" + PAGE_BREAK).join(p or "" for p in pages)
+
+
+def extract_pairs(text: str, labels: Optional[Dict[str, List[str]]] = None) -> List[Tuple[str, str]]:
+    """Extrae pares (pregunta, respuesta) del texto.
+    - Cada bloque llega hasta la siguiente etiqueta de pregunta o fin del documento.
     - Limpia espacios raros y saltos múltiples.
     """
-    pairs = []
-    for m in PR_BLOCK_RE.finditer(text):
-        q = normalize(m.group(1))
-        r = normalize(m.group(2))
-        if q or r:
-            pairs.append((q, r))
-    # try to log if possible: not all callers send project_id, so keep this passive
     # Callers can log the number of pairs after calling extract_pairs
-    return pairs
+    return parse_transcript(text, labels=labels).pairs()
 
 def normalize(s: str) -> str:
     s = s.replace("\u00ad", "")  # soft hyphen
@@ -0,0 +1,150 @@
+"""Overlapped LLM -> TTS pipeline for a whole project.
+
+Each row goes through `llm_processing.process_one` and, as soon as its cleaned
+text and entonaciones are saved, is queued for `tts_service.synthesize_block`.
+Both stages have their own worker pool; the queue between them is bounded so
+the LLM stage blocks (backpressure) when TTS falls behind instead of piling up
+work. Total time is roughly that of the slower stage rather than the sum.
+
+Progress is reported through the usual status CSV: a row is `processed` once
+its audio is written, and `failed` (error prefixed with the stage) otherwise.
+With a `run_control.Run`, both stages stop at their next checkpoint when the
+run is paused or cancelled; rows cut short by a cancel stay unprocessed.
+"""
+from __future__ import annotations
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ..config import settings
+from . import csv_store
+from . import dispatcher
+from . import llm_processing
+from . import project_info
+from . import tracing
+from . import run_control
+from .tts_service import synthesize_block, project_tts
+from app.services.project_logger import log
+
+_DONE = object()
+
+
+def run_pipeline(
+    project_id: str,
+    overwrite_texts: bool = True,
+    overwrite_prompts: bool = True,
+    project_prompt: str | None = None,
+    llm_workers: int | None = None,
+    tts_workers: int | None = None,
+    queue_size: int | None = None,
+    tts_provider: str | None = None,
+    run: run_control.Run | None = None,
+    routing: bool | None = None,
+) -> dict:
+    """Run LLM and TTS over every row with overlapped stages. Returns counters.
+
+    `tts_provider` overrides the project's TTS engine ("openai" | "local").
+    `routing` routes each row's LLM call by its text (see `llm_routing`); `LLM_ROUTING` when None.
+    `run` makes it pausable / cancellable; a resumed run skips the rows already processed.
+    """
+    llm_workers = max(1, llm_workers or settings.PIPELINE_LLM_WORKERS)
+    tts_workers = max(1, tts_workers or settings.PIPELINE_TTS_WORKERS)
+    queue_size = max(1, queue_size or settings.PIPELINE_QUEUE_SIZE)
+    routing = settings.LLM_ROUTING if routing is None else bool(routing)
+
+    nums = [num for num, _ in csv_store.iter_records(project_id)]
+    if run is not None and run.resumed:
+        done = csv_store.processed_nums(project_id)
+        nums = [num for num in nums if num not in done]
+    if project_prompt is None:
+        project_prompt = project_info.get_config(project_id).project_prompt
+    provider, voice_q, voice_r = project_tts(project_id, tts_provider)
+    log(project_id, f"run_pipeline: rows={len(nums)} llm_workers={llm_workers} tts_workers={tts_workers} queue_size={queue_size} tts_provider={provider.name} routing={routing}")
+
+    tts_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    counters = {"llm_done": 0, "llm_failed": 0, "tts_done": 0, "tts_failed": 0, "cancelled": 0}
+    counters_lock = threading.Lock()
+
+    def bump(key: str) -> None:
+        with counters_lock:
+            counters[key] += 1
+
+    def llm_stage(num: int) -> None:
+        try:
+            if run is not None:
+                run.checkpoint()
+            with dispatcher.context(dispatcher.BULK, project_id), tracing.span("pipeline.llm", num=num):
+                rec = llm_processing.process_one(
+                    project_id,
+                    num,
+                    overwrite_texts=overwrite_texts,
+                    overwrite_prompts=overwrite_prompts,
+                    project_prompt=project_prompt,
+                    run=run,
+                    routing=routing,
+                )
+        except run_control.RunCancelled:
+            bump("cancelled")
+            return
+        except Exception as e:
+            log(project_id, f"pipeline llm failed num={num}: {e}", level="ERROR")
+            csv_store.mark_status_failed(project_id, num, error=f"llm: {e}")
+            bump("llm_failed")
+            return
+        bump("llm_done")
+        log(project_id, f"pipeline llm processed num={num}")
+        # blocks while the TTS queue is full
+        with tracing.span("pipeline.queue_put", num=num):
+            tts_queue.put((num, rec))
+
+    def tts_stage() -> None:
+        while True:
+            item = tts_queue.get()
+            try:
+                if item is _DONE:
+                    return
+                num, rec = item
+                try:
+                    if run is not None:
+                        run.checkpoint()
+                    with dispatcher.context(dispatcher.BULK, project_id), tracing.span("pipeline.tts", num=num):
+                        synthesize_block(
+                            project_id,
+                            num,
+                            rec["pregunta"],
+                            rec["respuesta"],
+                            entonacion_p=rec.get("entonacion_p"),
+                            entonacion_r=rec.get("entonacion_r"),
+                            voice_q=voice_q,
+                            voice_r=voice_r,
+                            provider=provider,
+                            run=run,
+                        )
+                    csv_store.mark_status_processed(project_id, num)
+                    bump("tts_done")
+                except run_control.RunCancelled:
+                    # keep draining the queue: the rows left in it are skipped the same way
+                    bump("cancelled")
+                except Exception as e:
+                    log(project_id, f"pipeline tts failed num={num}: {e}", level="ERROR")
+                    csv_store.mark_status_failed(project_id, num, error=f"tts: {e}")
+                    bump("tts_failed")
+            finally:
+                tts_queue.task_done()
+
+    t0 = time.perf_counter()
+    tts_threads = [threading.Thread(target=tracing.propagate(tts_stage), name=f"pipeline-tts-{i}", daemon=True) for i in range(tts_workers)]
+    for t in tts_threads:
+        t.start()
+    try:
+        with ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="pipeline-llm") as ex:
+            list(ex.map(tracing.propagate(llm_stage), nums))
+    finally:
+        for _ in tts_threads:
+            tts_queue.put(_DONE)
+        for t in tts_threads:
+            t.join()
+    counters["elapsed_s"] = round(time.perf_counter() - t0, 3)
+    log(project_id, f"run_pipeline finished {counters}")
+    return counters
@@ -0,0 +1,372 @@
+"""On-demand sampling profiler for one request or one running background job.
+
+A profile samples the Python stacks of the threads working for its target
+(`sys._current_frames()`) until the target ends or the time is up. Samples are
+wall-clock: a thread waiting on the provider or a lock shows up in that call
+(socket reads, `wait`), not only where it burns CPU. Profiles are stored as
+collapsed stacks (flamegraph.pl / speedscope / inferno format) in
+`<project>/.profile/<id>.folded`, with a `<id>.json` summary next to it.
+
+Which threads work for a target comes from the traces (`services/tracing.py`):
+a thread counts while it is inside a span of the profiled trace, or runs a
+target wrapped with `tracing.propagate`. A job's own thread counts for the whole
+profile. A request profile also samples the event loop thread (routing,
+validation, JSON serialization); that thread is shared, so under load its
+samples include the async work of other requests.
+
+- requests: send `X-Profile: <seconds>` with the admin `X-Profile-Token`; the
+  response carries `X-Profile-Id` and the profile ends with the response body;
+- jobs: `POST /api/admin/profile/{project_id}?seconds=N` attaches to the
+  project's running TTS / LLM / pipeline job(s).
+
+Overhead is bounded: one sampler thread serves every active profile, samples at
+`PROFILE_HZ` at most and backs off so that it holds the interpreter less than
+`PROFILE_MAX_OVERHEAD_PCT` percent of the time. At most `PROFILE_MAX_SESSIONS`
+profiles run at once, for at most `PROFILE_MAX_SECONDS` each. Disabled unless
+`PROFILER_TOKEN` is set.
+"""
+from __future__ import annotations
+import datetime
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Iterable, Optional
+
+import orjson
+import ulid
+
+from ..config import settings
+from ..utils import BASE_VOICES_DIR
+from . import tracing
+
+PROFILE_DIR_NAME = ".profile"
+MAX_DEPTH = 128
+TOP_FRAMES = 25
+
+_lock = threading.Lock()
+_sessions: dict[str, "Session"] = {}
+_by_trace: dict[str, "Session"] = {}
+_sampler: Optional[threading.Thread] = None
+_labels: dict = {}
+_prefixes: list[str] = []
+
+
+class ProfilerError(Exception):
+    """A profile cannot be started (disabled, busy, nothing to attach to)."""
+
+
+def enabled() -> bool:
+    return bool(settings.PROFILER_TOKEN) and settings.TRACING
+
+
+def check_token(token: Optional[str]) -> bool:
+    return bool(settings.PROFILER_TOKEN) and hmac.compare_digest((token or "").encode(), settings.PROFILER_TOKEN.encode())
+
+
+class Session:
+    def __init__(self, project_id: str, target: str, label: str, trace_ids: Iterable[str], seconds: float,
+                 pinned: Iterable[int] = ()):
+        self.id = str(ulid.new()).lower()
+        self.project_id = project_id
+        self.target = target
+        self.label = label
+        self.trace_ids = list(trace_ids)
+        self.started = time.time()
+        self._t0 = time.monotonic()
+        self.deadline = self._t0 + seconds
+        self.pinned = set(pinned)
+        # thread ident -> number of spans of the target it is inside
+        self.threads: dict[int, int] = {}
+        self.thread_names: dict[int, str] = {t.ident: t.name for t in threading.enumerate() if t.ident in self.pinned}
+        # (thread name, code objects leaf-first) -> samples; labels are built when writing
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.ticks = 0
+        self.busy_s = 0.0
+        self.done = threading.Event()
+        self.meta: Optional[dict] = None
+
+    def idents(self) -> list[int]:
+        return list(self.pinned | self.threads.keys())
+
+
+# ---------------------------------------------------------------------------
+# thread tracking (tracing.span_hook)
+
+
+def _on_span(span: tracing.Span, entered: bool) -> None:
+    sess = _by_trace.get(span.trace.trace_id)
+    if sess is None:
+        return
+    ident = threading.get_ident()
+    with _lock:
+        n = sess.threads.get(ident, 0) + (1 if entered else -1)
+        if n > 0:
+            sess.threads[ident] = n
+            sess.thread_names[ident] = threading.current_thread().name
+        else:
+            # spans entered before the profile started also end here
+            sess.threads.pop(ident, None)
+
+
+# ---------------------------------------------------------------------------
+# sampling
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        if not _prefixes:
+            _prefixes.extend(sorted({p + os.sep for p in sys.path if p}, key=len, reverse=True))
+        path = code.co_filename
+        for prefix in _prefixes:
+            if path.startswith(prefix):
+                path = path[len(prefix):]
+                break
+        label = f"{getattr(code, 'co_qualname', code.co_name)} ({path}:{code.co_firstlineno})".replace(";", ":")
+        if len(_labels) < 50_000:
+            _labels[code] = label
+    return label
+
+
+def _codes(frame) -> tuple:
+    codes = []
+    while frame is not None and len(codes) < MAX_DEPTH:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    return tuple(codes)
+
+
+def _collapse(thread_name: str, codes: tuple) -> str:
+    """One collapsed-stack line (root first, `;`-separated) without the count."""
+    names = [re.sub(r"[-_]?\d+$", "", thread_name).replace(" ", "_") or "thread"]
+    names.extend(_label(c) for c in reversed(codes))
+    return ";".join(names)
+
+
+def _run() -> None:
+    global _sampler
+    interval = 1.0 / max(1, settings.PROFILE_HZ)
+    budget = max(0.001, settings.PROFILE_MAX_OVERHEAD_PCT / 100)
+    me = threading.get_ident()
+    while True:
+        t0 = time.perf_counter()
+        now = time.monotonic()
+        with _lock:
+            if not _sessions:
+                _sampler = None
+                return
+            sessions = list(_sessions.values())
+            targets = [(s, s.idents()) for s in sessions]
+        expired = [s for s in sessions if now >= s.deadline]
+        frames = sys._current_frames()
+        taken = []
+        for sess, idents in targets:
+            if sess in expired:
+                continue
+            keys = []
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None or ident == me:
+                    continue
+                keys.append((sess.thread_names.get(ident, "thread"), _codes(frame)))
+            taken.append((sess, keys))
+        del frames
+        cost = time.perf_counter() - t0
+        # stacks are walked above without the lock; counters change only under it, and not
+        # once `stop()` has removed the session (it copies them under the same lock)
+        with _lock:
+            for sess, keys in taken:
+                if _sessions.get(sess.id) is not sess:
+                    continue
+                sess.ticks += 1
+                for key in keys:
+                    sess.stacks[key] += 1
+                sess.samples += len(keys)
+            for sess, _ in targets:
+                if _sessions.get(sess.id) is sess:
+                    sess.busy_s += cost / len(targets)
+        for sess in expired:
+            stop(sess.id)
+        # keep the sampler's share of the interpreter under the budget
+        time.sleep(max(interval - cost, cost / budget - cost))
+
+
+def _start(sess: Session) -> Session:
+    global _sampler
+    with _lock:
+        if len(_sessions) >= settings.PROFILE_MAX_SESSIONS:
+            raise ProfilerError(f"ya hay {len(_sessions)} perfiles en curso (máximo {settings.PROFILE_MAX_SESSIONS})")
+        _sessions[sess.id] = sess
+        for trace_id in sess.trace_ids:
+            _by_trace[trace_id] = sess
+        tracing.span_hook = _on_span
+        if _sampler is None:
+            _sampler = threading.Thread(target=_run, name="profiler", daemon=True)
+            _sampler.start()
+    return sess
+
+
+def _seconds(seconds: Optional[float]) -> float:
+    return max(0.1, min(float(seconds or settings.PROFILE_MAX_SECONDS), settings.PROFILE_MAX_SECONDS))
+
+
+def start_request(project_id: Optional[str], seconds: Optional[float] = None) -> Session:
+    """Profile the current request (call inside its trace) until `stop()` or the time limit."""
+    root = tracing.current()
+    if root is None:
+        raise ProfilerError("las trazas están desactivadas (TRACING=0)")
+    # called from the middleware, i.e. on the event loop thread
+    sess = Session(project_id or "", "request", root.name, [root.trace.trace_id], _seconds(seconds),
+                   pinned=[threading.get_ident()])
+    return _start(sess)
+
+
+def start_job(project_id: str, seconds: Optional[float] = None, trace_id: Optional[str] = None) -> Session:
+    """Profile the running job(s) of the project (or the job `trace_id`) for `seconds`."""
+    jobs = tracing.active_jobs(project_id)
+    if trace_id:
+        jobs = {t: j for t, j in jobs.items() if t == trace_id}
+    if not jobs:
+        raise LookupError("No hay ningún job en curso en el proyecto")
+    label = ", ".join(sorted({j["name"] for j in jobs.values()}))
+    sess = Session(project_id, "job", label, jobs, _seconds(seconds), pinned=[j["thread"] for j in jobs.values()])
+    return _start(sess)
+
+
+def bind(sess: Session, project_id: str) -> None:
+    """Set the project of a request profile once the route is known."""
+    if not sess.project_id:
+        sess.project_id = project_id
+
+
+def stop(session_id: str) -> Optional[dict]:
+    """End a profile and write it out; returns its summary (None if unknown).
+
+    Writes files: call it from a worker thread, not the event loop.
+    """
+    with _lock:
+        sess = _sessions.pop(session_id, None)
+        if sess is None:
+            return None
+        for trace_id in sess.trace_ids:
+            if _by_trace.get(trace_id) is sess:
+                del _by_trace[trace_id]
+        if not _sessions:
+            tracing.span_hook = None
+        # the sampler writes only to registered sessions: after this copy nothing changes
+        counts = list(sess.stacks.items())
+    stacks: Counter = Counter()
+    for (name, codes), n in counts:
+        stacks[_collapse(name, codes)] += n
+    sess.meta = _write(sess, stacks)
+    sess.done.set()
+    return sess.meta
+
+
+def running(project_id: Optional[str] = None) -> list[dict]:
+    now = time.monotonic()
+    with _lock:
+        sessions = list(_sessions.values())
+    return [
+        {"id": s.id, "project_id": s.project_id, "target": s.target, "label": s.label,
+         "elapsed_s": round(now - s._t0, 3), "samples": s.samples, "running": True}
+        for s in sessions
+        if project_id is None or s.project_id == project_id
+    ]
+
+
+# ---------------------------------------------------------------------------
+# output
+
+
+def _profile_dir(project_id: str):
+    return BASE_VOICES_DIR / project_id / PROFILE_DIR_NAME
+
+
+def _top(stacks: Counter, total: int) -> dict:
+    self_counts: Counter = Counter()
+    incl_counts: Counter = Counter()
+    for stack, n in stacks.items():
+        frames = stack.split(";")[1:]
+        if frames:
+            self_counts[frames[-1]] += n
+        for f in set(frames):
+            incl_counts[f] += n
+
+    def rows(c: Counter) -> list[dict]:
+        return [{"frame": f, "samples": n, "pct": round(100 * n / total, 2)} for f, n in c.most_common(TOP_FRAMES)]
+
+    return {"self": rows(self_counts), "inclusive": rows(incl_counts)} if total else {"self": [], "inclusive": []}
+
+
+def _write(sess: Session, stacks: Counter) -> dict:
+    wall = time.monotonic() - sess._t0
+    meta = {
+        "id": sess.id,
+        "project_id": sess.project_id,
+        "target": sess.target,
+        "label": sess.label,
+        "trace_ids": sess.trace_ids,
+        "started": round(sess.started, 3),
+        "duration_s": round(wall, 3),
+        "samples": sess.samples,
+        "ticks": sess.ticks,
+        "hz": round(sess.ticks / wall, 1) if wall > 0 else 0.0,
+        "overhead_pct": round(100 * sess.busy_s / wall, 3) if wall > 0 else 0.0,
+        "running": False,
+        "top": _top(stacks, sess.samples),
+    }
+    project_dir = BASE_VOICES_DIR / sess.project_id if sess.project_id else None
+    # never (re)create a project folder
+    if project_dir is None or not project_dir.is_dir():
+        return meta
+    d = _profile_dir(sess.project_id)
+    d.mkdir(exist_ok=True)
+    folded = "".join(f"{stack} {n}\n" for stack, n in sorted(stacks.items()))
+    (d / f"{sess.id}.folded").write_text(folded, encoding="utf-8")
+    (d / f"{sess.id}.json").write_bytes(orjson.dumps(meta, option=orjson.OPT_INDENT_2))
+    return meta
+
+
+def list_profiles(project_id: str) -> list[dict]:
+    """Running and stored profiles of the project, most recent first (without the `top` tables)."""
+    out = running(project_id)
+    d = _profile_dir(project_id)
+    if d.is_dir():
+        for p in sorted(d.glob("*.json"), reverse=True):
+            try:
+                meta = orjson.loads(p.read_bytes())
+            except (OSError, orjson.JSONDecodeError):
+                continue
+            meta.pop("top", None)
+            meta["started_at"] = datetime.datetime.fromtimestamp(meta["started"], datetime.timezone.utc).isoformat()
+            out.append(meta)
+    return out
+
+
+def _valid_id(profile_id: str) -> bool:
+    return profile_id.isalnum()
+
+
+def read_meta(project_id: str, profile_id: str) -> Optional[dict]:
+    if not _valid_id(profile_id):
+        return None
+    for r in running(project_id):
+        if r["id"] == profile_id:
+            return r
+    try:
+        return orjson.loads((_profile_dir(project_id) / f"{profile_id}.json").read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+
+def folded_path(project_id: str, profile_id: str):
+    if not _valid_id(profile_id):
+        return None
+    p = _profile_dir(project_id) / f"{profile_id}.folded"
+    return p if p.exists() else None
@@ -0,0 +1,308 @@
+"""Streaming export / import of a whole project as a tar archive.
+
+Layout (in this order):
+
+- `manifest.json`: format, version, source project id, title and counts;
+- `project.info`: the raw `.info`;
+- `records.csv`: the project's records (same columns as `entrevista.csv`);
+- `audio/<num>/<p|r><num>.mp3`: every mp3 in the audio store.
+
+Each entry carries the sha256 of its content in a PAX header
+(`entona.sha256`), so the importer can check it and, for audio, decide to skip
+an entry before reading its data.
+
+Export builds the tar on the fly: one file is open at a time and it is hashed
+and then sent from the same descriptor, so memory does not grow with the
+project. Import reads the archive as a stream (`tarfile` mode `r|*`, so
+`.tar.gz` works too). Audio whose content hash matches the mp3 already in the
+target is skipped. Everything else is first staged to a temporary folder
+(`<VOICES_DIR>/.import/`), and nothing in the target changes until the whole
+stream has been read and every checksum matched. Only then are the staged
+mp3s, the records and the `.info` applied. On a failed import the staged
+files are deleted, and so is the project folder if the import created it.
+"""
+from __future__ import annotations
+import hashlib
+import io
+import json
+import re
+import shutil
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from ..utils import BASE_VOICES_DIR, get_csv_path, get_info_path
+from . import audio_meta
+from . import audio_store
+from . import csv_store
+from . import locks
+from . import project_catalog
+from . import project_info
+from . import record_store
+from . import run_control
+from . import tracing
+from app.services.project_logger import log
+
+FORMAT = "entona-project"
+VERSION = 1
+MANIFEST = "manifest.json"
+INFO = "project.info"
+RECORDS = "records.csv"
+SHA_KEY = "entona.sha256"
+CHUNK_SIZE = 256 * 1024
+# records are spooled to disk above this size while they are hashed
+SPOOL_MAX = 4 * 1024 * 1024
+STAGING_DIR = ".import"
+
+_AUDIO_NAME = re.compile(r"^audio/(\d+)/([pr])(\d+)\.mp3$")
+_PROJECT_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class ArchiveError(ValueError):
+    """The archive is malformed or a checksum does not match."""
+
+
+# ------------------------------------------------------------------ export
+
+
+def _sha256(fh: BinaryIO) -> tuple[str, int]:
+    h = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+        h.update(chunk)
+        size += len(chunk)
+    fh.seek(0)
+    return h.hexdigest(), size
+
+
+def _member(name: str, fh: BinaryIO, mtime: float) -> Iterator[bytes]:
+    """One tar entry: PAX header with the content hash, the data and the block padding."""
+    digest, size = _sha256(fh)
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    info.pax_headers = {SHA_KEY: digest}
+    yield info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+    sent = 0
+    for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+        # a file that grew since it was hashed must not overrun its header
+        chunk = chunk[: size - sent]
+        sent += len(chunk)
+        yield chunk
+        if sent >= size:
+            break
+    if sent < size:
+        raise ArchiveError(f"{name} cambió durante la exportación")
+    if size % tarfile.BLOCKSIZE:
+        yield tarfile.NUL * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE)
+
+
+def _open_blob(store: audio_store.AudioStore, key: str) -> BinaryIO:
+    if isinstance(store, audio_store.LocalAudioStore):
+        # hashed and then sent from the same descriptor: a re-render swapping the file in between is not seen
+        return store.path(key).open("rb")
+    return io.BytesIO(store.read(key))
+
+
+def _records_snapshot(project_id: str) -> BinaryIO:
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+    csv_path = get_csv_path(project_id)
+    with locks.project_lock(project_id):
+        if csv_path.exists():
+            with csv_path.open("rb") as src:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def export_archive(project_id: str) -> Iterator[bytes]:
+    """The project as a tar stream (see the module docstring). The project must exist."""
+    size = 0
+    for chunk in _entries(project_id):
+        size += len(chunk)
+        yield chunk
+    # end of archive: two zero blocks, then padding to a whole tar record
+    size += 2 * tarfile.BLOCKSIZE
+    yield tarfile.NUL * (2 * tarfile.BLOCKSIZE + (-size) % tarfile.RECORDSIZE)
+
+
+def _entries(project_id: str) -> Iterator[bytes]:
+    log(project_id, "export_archive started")
+    now = time.time()
+    store = audio_store.get_store()
+    blobs = store.list_project(project_id)
+    audio = sorted(blobs, key=lambda rel: (int(rel.split("/", 1)[0]), rel))
+    cfg = project_info.get_config(project_id)
+    manifest = {
+        "format": FORMAT,
+        "version": VERSION,
+        "project_id": project_id,
+        "title": cfg.info.get("title") or "",
+        "exported_at": now,
+        "records": len(csv_store.read_records(project_id)),
+        "audio": len(audio),
+    }
+    yield from _member(MANIFEST, io.BytesIO(json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")), now)
+    info_path = get_info_path(project_id)
+    info = info_path.read_bytes() if info_path.exists() else b"{}"
+    yield from _member(INFO, io.BytesIO(info), now)
+    with _records_snapshot(project_id) as records:
+        yield from _member(RECORDS, records, now)
+    sent = 0
+    for rel in audio:
+        try:
+            fh = _open_blob(store, f"{project_id}/{rel}")
+        except (FileNotFoundError, KeyError):
+            # deleted since the listing
+            continue
+        with fh:
+            yield from _member(f"audio/{rel}", fh, now)
+        sent += 1
+    log(project_id, f"export_archive finished records={manifest['records']} audio={sent}")
+
+
+# ------------------------------------------------------------------ import
+
+
+def _read_verified(tar: tarfile.TarFile, member: tarfile.TarInfo, sink: BinaryIO) -> None:
+    """Copy a member's data to `sink`, checking it against its PAX sha256."""
+    expected = member.pax_headers.get(SHA_KEY)
+    if not expected:
+        raise ArchiveError(f"{member.name}: falta el checksum")
+    h = hashlib.sha256()
+    src = tar.extractfile(member)
+    for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+        h.update(chunk)
+        sink.write(chunk)
+    if h.hexdigest() != expected:
+        raise ArchiveError(f"{member.name}: checksum incorrecto")
+
+
+def _target_id(manifest: dict, project_id: Optional[str]) -> str:
+    if manifest.get("format") != FORMAT:
+        raise ArchiveError("No es un archivo de proyecto de Entona")
+    if int(manifest.get("version") or 0) > VERSION:
+        raise ArchiveError(f"Versión de archivo no soportada: {manifest.get('version')}")
+    target = project_id or manifest.get("project_id") or ""
+    if not _PROJECT_ID.match(target):
+        raise ArchiveError(f"Id de proyecto no válido: {target!r}")
+    return target
+
+
+@tracing.traced("archive.import")
+def import_archive(fileobj: BinaryIO, project_id: Optional[str] = None) -> dict:
+    """Import a project archive read from `fileobj` (a stream).
+
+    The project keeps the id of the archive unless `project_id` is given; an
+    existing project is updated in place: records and `.info` are replaced,
+    audio identical to the archive's is kept, the rest is overwritten.
+    Nothing is changed unless the whole archive is valid.
+    Raises ArchiveError (malformed archive, checksum mismatch) and
+    run_control.RunConflict (a bulk run is in progress on the target).
+    """
+    counts = {"audio_written": 0, "audio_skipped": 0, "bytes_written": 0, "ignored": 0}
+    store = audio_store.get_store()
+    try:
+        tar = tarfile.open(fileobj=fileobj, mode="r|*")
+    except tarfile.TarError as e:
+        raise ArchiveError(f"Archivo no válido: {e}") from e
+    with tar:
+        first = tar.next()
+        if first is None or first.name != MANIFEST:
+            raise ArchiveError(f"El archivo debe empezar por {MANIFEST}")
+        buf = io.BytesIO()
+        _read_verified(tar, first, buf)
+        try:
+            manifest = json.loads(buf.getvalue())
+        except ValueError as e:
+            raise ArchiveError(f"{MANIFEST} no es JSON válido") from e
+        target = _target_id(manifest, project_id)
+        existed = (BASE_VOICES_DIR / target).is_dir()
+        state = run_control.status(target) if existed else None
+        if state is not None and state["state"] in run_control.ACTIVE:
+            raise run_control.RunConflict(f"Ya hay una ejecución {state['kind']} en curso ({state['state']})")
+
+        # same file system as the project, away from the project folders the catalog lists
+        (BASE_VOICES_DIR / STAGING_DIR).mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=BASE_VOICES_DIR / STAGING_DIR, prefix=f"{target}."))
+        info: Optional[dict] = None
+        records: Optional[Path] = None
+        audio: list[tuple[str, Path]] = []
+        applying = False
+        try:
+            # not `for member in tar`: that starts again with the members already read (the manifest)
+            while (member := tar.next()) is not None:
+                if not member.isfile():
+                    continue
+                if member.name == INFO:
+                    buf = io.BytesIO()
+                    _read_verified(tar, member, buf)
+                    try:
+                        info = json.loads(buf.getvalue() or b"{}")
+                    except ValueError as e:
+                        raise ArchiveError(f"{INFO} no es JSON válido") from e
+                    continue
+                if member.name == RECORDS:
+                    records = staging / RECORDS
+                    with records.open("wb") as fh:
+                        _read_verified(tar, member, fh)
+                    continue
+                m = _AUDIO_NAME.match(member.name)
+                if m is None or m.group(1) != m.group(3):
+                    counts["ignored"] += 1
+                    continue
+                num, prefix = int(m.group(1)), m.group(2)
+                key = f"{target}/{num}/{prefix}{num}.mp3"
+                expected = member.pax_headers.get(SHA_KEY)
+                st = store.stat(key) if existed else None
+                if expected and st is not None and st[0] == member.size and audio_meta.content_hash(key) == expected:
+                    # same content already there: the data is skipped unread by the stream
+                    counts["audio_skipped"] += 1
+                    continue
+                path = staging / f"{prefix}{num}.mp3"
+                with path.open("wb") as fh:
+                    _read_verified(tar, member, fh)
+                audio.append((key, path))
+                counts["bytes_written"] += member.size
+
+            # the whole archive is valid: apply it
+            applying = True
+            log(target, f"import_archive applying source={manifest.get('project_id')} existed={existed} ignored={counts['ignored']}")
+            metas = []
+            for key, path in audio:
+                data = path.read_bytes()
+                with store.writer(key) as blob:
+                    blob.write(data)
+                metas.append((key, data, blob.version))
+                counts["audio_written"] += 1
+            audio_meta.update_many(target, metas)
+            if records is not None:
+                table = record_store.read_table(records)
+                csv_store.write_records(table, target)
+                counts["records"] = len(table)
+            if info is not None:
+                project_info.replace_raw(target, info)
+        except tarfile.TarError as e:
+            _discard(target, existed, applying)
+            raise ArchiveError(f"Archivo truncado o no válido: {e}") from e
+        except BaseException:
+            _discard(target, existed, applying)
+            raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+    project_catalog.mark_dirty(target)
+    log(target, f"import_archive finished {counts}")
+    return {"project_id": target, "created": not existed, **counts}
+
+
+def _discard(project_id: str, existed: bool, applying: bool) -> None:
+    """Undo a failed import into a new project: its audio (if any was applied) and its folder."""
+    if existed:
+        return
+    if applying:
+        audio_store.get_store().delete_project(project_id)
+    shutil.rmtree(BASE_VOICES_DIR / project_id, ignore_errors=True)
@@ -0,0 +1,233 @@
+"""Persistent project catalog used by `/api/projects`.
+
+Keeps one row per project (title, description, row count, audio coverage,
+last modification and size on disk) in a small SQLite database stored next to
+the projects, so listing thousands of projects does not open every `.info`.
+
+- `refresh_project` recomputes a project's row (create, `.info` writes, uploads).
+- `mark_dirty` is a cheap flag for frequent writes (record edits, audio); dirty
+  rows are recomputed the next time the catalog is listed.
+- `remove_project` drops a deleted project.
+- `rebuild` rescans the whole volume (for folders edited out-of-band):
+
+    python -m app.services.project_catalog rebuild
+"""
+from __future__ import annotations
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from ..utils import BASE_VOICES_DIR
+from . import audio_store
+from . import tracing
+
+INDEX_DIR_NAME = ".index"
+CATALOG_FILE = "catalog.sqlite"
+
+SORT_FIELDS = ("title", "updated_at", "rows", "audio_coverage", "size_bytes", "id")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    desc TEXT NOT NULL DEFAULT '',
+    rows INTEGER NOT NULL DEFAULT 0,
+    audio_files INTEGER NOT NULL DEFAULT 0,
+    audio_coverage REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL DEFAULT 0,
+    size_bytes INTEGER NOT NULL DEFAULT 0,
+    dirty INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def catalog_path() -> Path:
+    d = BASE_VOICES_DIR / INDEX_DIR_NAME
+    d.mkdir(parents=True, exist_ok=True)
+    return d / CATALOG_FILE
+
+
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    # one short-lived connection per call: safe across the threadpool and workers
+    conn = sqlite3.connect(str(catalog_path()), timeout=30)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _is_project_dir(p: Path) -> bool:
+    return p.is_dir() and not p.name.startswith(".")
+
+
+def scan_project(project_id: str) -> Optional[dict]:
+    """Compute the catalog entry for a project from its folder (None if missing)."""
+    d = BASE_VOICES_DIR / project_id
+    if not d.is_dir():
+        return None
+    title, desc = project_id, ""
+    info_path = d / f"{project_id}.info"
+    if info_path.exists():
+        try:
+            with info_path.open("r", encoding="utf-8") as fh:
+                data = json.load(fh) or {}
+            title = data.get("title") or project_id
+            desc = data.get("desc") or data.get("description") or ""
+        except Exception:
+            pass
+    rows = 0
+    csv_path = d / "entrevista.csv"
+    if csv_path.exists():
+        try:
+            with csv_path.open("r", encoding="utf-8", newline="") as fh:
+                rows = max(sum(1 for _ in csv.reader(fh)) - 1, 0)
+        except Exception:
+            rows = 0
+    audio_files = 0
+    size_bytes = 0
+    updated_at = 0.0
+    # snapshot objects are hardlinks of the mp3s: count each inode once
+    seen = set()
+    for root, dirs, files in os.walk(d):
+        top = os.path.relpath(root, d).split(os.sep)[0]
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            if name.endswith(".mp3"):
+                audio_files += 1
+            if top not in (".log", ".trace", ".profile", ".snapshots"):
+                updated_at = max(updated_at, st.st_mtime)
+            if st.st_nlink > 1:
+                if (st.st_dev, st.st_ino) in seen:
+                    continue
+                seen.add((st.st_dev, st.st_ino))
+            size_bytes += st.st_size
+    store = audio_store.get_store()
+    if store.name != "local":
+        # audio lives in the object store, not in the folder
+        blobs = store.list_project(project_id)
+        audio_files += len(blobs)
+        size_bytes += sum(size for size, _ in blobs.values())
+    return {
+        "id": project_id,
+        "title": title,
+        "desc": desc,
+        "rows": rows,
+        "audio_files": audio_files,
+        "audio_coverage": round(audio_files / (2 * rows), 4) if rows else 0.0,
+        "updated_at": updated_at,
+        "size_bytes": size_bytes,
+    }
+
+
+def _upsert(conn: sqlite3.Connection, entry: dict) -> None:
+    conn.execute(
+        "INSERT INTO projects (id, title, desc, rows, audio_files, audio_coverage, updated_at, size_bytes, dirty) "
+        "VALUES (:id, :title, :desc, :rows, :audio_files, :audio_coverage, :updated_at, :size_bytes, 0) "
+        "ON CONFLICT(id) DO UPDATE SET title=excluded.title, desc=excluded.desc, rows=excluded.rows, "
+        "audio_files=excluded.audio_files, audio_coverage=excluded.audio_coverage, "
+        "updated_at=excluded.updated_at, size_bytes=excluded.size_bytes, dirty=0",
+        entry,
+    )
+
+
+@tracing.traced("catalog.refresh")
+def refresh_project(project_id: str) -> Optional[dict]:
+    entry = scan_project(project_id)
+    with _connect() as conn:
+        if entry is None:
+            conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+        else:
+            _upsert(conn, entry)
+    return entry
+
+
+@tracing.traced("catalog.mark_dirty")
+def mark_dirty(project_id: str) -> None:
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO projects (id, updated_at, dirty) VALUES (?, ?, 1) "
+            "ON CONFLICT(id) DO UPDATE SET dirty=1, updated_at=excluded.updated_at",
+            (project_id, time.time()),
+        )
+
+
+def remove_project(project_id: str) -> None:
+    with _connect() as conn:
+        conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+
+
+def _sync(conn: sqlite3.Connection) -> None:
+    """Pick up added/removed folders and recompute dirty rows.
+
+    Only directory names are listed here; `.info`/CSV files are opened just for
+    new or dirty projects.
+    """
+    on_disk = {p.name for p in BASE_VOICES_DIR.iterdir() if _is_project_dir(p)}
+    known = {r["id"]: r["dirty"] for r in conn.execute("SELECT id, dirty FROM projects")}
+    for pid in set(known) - on_disk:
+        conn.execute("DELETE FROM projects WHERE id = ?", (pid,))
+    for pid in on_disk:
+        if pid not in known or known[pid]:
+            entry = scan_project(pid)
+            if entry is not None:
+                _upsert(conn, entry)
+
+
+def list_projects(
+    q: str | None = None,
+    sort: str = "title",
+    order: str = "asc",
+    offset: int = 0,
+    limit: int | None = None,
+) -> tuple[list[dict], int]:
+    """Return (page of projects, total matching) with optional substring search."""
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"sort debe ser uno de {', '.join(SORT_FIELDS)}")
+    direction = "DESC" if str(order).lower() == "desc" else "ASC"
+    where, params = "", []
+    if q:
+        where = "WHERE instr(lower(title), lower(?)) > 0 OR instr(lower(desc), lower(?)) > 0 OR instr(lower(id), lower(?)) > 0"
+        params = [q, q, q]
+    with _connect() as conn:
+        _sync(conn)
+        total = conn.execute(f"SELECT COUNT(*) FROM projects {where}", params).fetchone()[0]
+        sql = f"SELECT * FROM projects {where} ORDER BY {sort} COLLATE NOCASE {direction}, id ASC LIMIT ? OFFSET ?"
+        rows = conn.execute(sql, params + [limit if limit is not None else -1, max(offset, 0)]).fetchall()
+    return [{k: r[k] for k in r.keys() if k != "dirty"} for r in rows], total
+
+
+def rebuild() -> int:
+    """Recompute the whole catalog from disk. Returns the number of projects."""
+    with _connect() as conn:
+        conn.execute("DELETE FROM projects")
+        n = 0
+        for p in BASE_VOICES_DIR.iterdir():
+            if _is_project_dir(p):
+                entry = scan_project(p.name)
+                if entry is not None:
+                    _upsert(conn, entry)
+                    n += 1
+    return n
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("uso: python -m app.services.project_catalog rebuild")
+        sys.exit(2)
+    t0 = time.perf_counter()
+    n = rebuild()
+    print(f"catalog rebuilt: {n} projects in {time.perf_counter() - t0:.2f}s ({catalog_path()})")
@@ -1,68 +1,193 @@
 from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
+import copy
 import json
+import threading
+from ..config import settings
 from ..utils import get_info_path
+from . import locks
+from . import project_catalog
 from app.services.project_logger import log
 
 DEFAULT = {
-    "interviewer": {"language": "es", "accent": "es-ES", "voice": "alloy"},
-    "interviewee": {"language": "es", "accent": "es-ES", "voice": "ash"},
+    # sin voz en el .info se usan las de DEFAULT_VOICE_Q / DEFAULT_VOICE_R
+    "interviewer": {"language": "es", "accent": "es-ES", "voice": settings.DEFAULT_VOICE_Q},
+    "interviewee": {"language": "es", "accent": "es-ES", "voice": settings.DEFAULT_VOICE_R},
     # metadata
     "title": "",
     "description": "",
 }
 
 
-def read_info(project_id: str) -> dict:
+class ProjectConfig:
+    """Immutable snapshot of a project's `.info`, as returned by `get_config`.
+
+    `info` is the normalized config (same shape as `read_info`), `raw` the JSON
+    stored on disk and `proj_ctx` the LLM context string derived from `info`.
+    Nested dicts are read-only mappings; use `read_info` for a mutable copy.
+    """
+
+    __slots__ = ("project_id", "version", "info", "raw", "proj_ctx")
+
+    def __init__(self, project_id: str, version: int, info: dict, raw: dict, proj_ctx: str):
+        object.__setattr__(self, "project_id", project_id)
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "info", _freeze(info))
+        object.__setattr__(self, "raw", _freeze(raw))
+        object.__setattr__(self, "proj_ctx", proj_ctx)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ProjectConfig is immutable")
+
+    @property
+    def project_prompt(self) -> str | None:
+        return self.info.get("project_prompt")
+
+
+# project_id -> ((ino, mtime_ns, size) | None, ProjectConfig). Validated with a stat()
+# per lookup so edits made by other processes or by hand are picked up.
+_cache: Dict[str, Tuple[Optional[Tuple[int, int, int]], ProjectConfig]] = {}
+_versions: Dict[str, int] = {}
+_cache_lock = threading.Lock()
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+def _stat_key(p: Path) -> Optional[Tuple[int, int, int]]:
+    # writes replace the file, so the inode changes even within one mtime tick
+    # (e.g. another worker process saving the config)
+    try:
+        st = p.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def build_llm_context(info: Mapping) -> str:
+    """Context sentence (language, accent and voices) sent to the LLM with every row."""
+    try:
+        interviewer = info.get("interviewer", {})
+        interviewee = info.get("interviewee", {})
+        lang = interviewer.get("language") or interviewee.get("language") or "es"
+        acc = interviewer.get("accent") or interviewee.get("accent") or ""
+        v_int = interviewer.get("voice", "")
+        v_intv = interviewee.get("voice", "")
+        return (
+            f"idioma={lang}, acento={acc}. "
+            f"Voz entrevistador={v_int}, voz entrevistada={v_intv}. "
+            "Ten en cuenta este contexto (idioma, acento y voces) al proponer entonaciones y adaptar la pronunciación."
+        )
+    except Exception:
+        return ""
+
+
+def normalize_info(data: dict) -> dict:
+    """Normalize the raw `.info` JSON into the per-role structure used by the app."""
+    # Support legacy format where language/accent are top-level
+    out = copy.deepcopy(DEFAULT)
+    # If legacy keys exist, apply to both roles
+    if "language" in data or "accent" in data:
+        lang = data.get("language", "es")
+        acc = data.get("accent", "es-ES")
+        out = {
+            "interviewer": {"language": lang, "accent": acc, "voice": out["interviewer"]["voice"]},
+            "interviewee": {"language": lang, "accent": acc, "voice": out["interviewee"]["voice"]},
+        }
+    # New format: per-role objects
+    if "interviewer" in data and isinstance(data["interviewer"], dict):
+        out["interviewer"] = {**out.get("interviewer", {}), **data["interviewer"]}
+    if "interviewee" in data and isinstance(data["interviewee"], dict):
+        out["interviewee"] = {**out.get("interviewee", {}), **data["interviewee"]}
+    # Backwards compat: also accept voices:{ interviewer, interviewee }
+    if "voices" in data and isinstance(data["voices"], dict):
+        if "interviewer" in data["voices"]:
+            out["interviewer"]["voice"] = data["voices"]["interviewer"]
+        if "interviewee" in data["voices"]:
+            out["interviewee"]["voice"] = data["voices"]["interviewee"]
+    # project-level prompt (new)
+    if "project_prompt" in data:
+        out["project_prompt"] = data.get("project_prompt") or ""
+    # title/description (allow desc/name backwards compat)
+    if "title" in data or "name" in data:
+        out["title"] = data.get("title") or data.get("name") or ""
+    if "description" in data or "desc" in data:
+        # prefer full 'description' but accept 'desc'
+        out["description"] = data.get("description") or data.get("desc") or ""
+    return out
+
+
+def get_config(project_id: str) -> ProjectConfig:
+    """Return the cached config snapshot, reloading it only when the `.info` changed."""
     p = get_info_path(project_id)
+    key = _stat_key(p)
+    with _cache_lock:
+        hit = _cache.get(project_id)
+        if hit is not None and hit[0] == key:
+            return hit[1]
+    raw = {}
     try:
-        log(project_id, "read_info called")
-        if not p.exists():
+        if key is not None:
+            with p.open("r", encoding="utf-8") as fh:
+                raw = json.load(fh) or {}
+            info = normalize_info(raw)
+            log(project_id, f"read_info: loaded info for project, interviewer={info.get('interviewer')}, interviewee={info.get('interviewee')}")
+        else:
+            info = copy.deepcopy(DEFAULT)
             log(project_id, "read_info: info file not found, returning DEFAULT")
-            return DEFAULT.copy()
-        with p.open("r", encoding="utf-8") as fh:
-            data = json.load(fh) or {}
-            # Support legacy format where language/accent are top-level
-            out = DEFAULT.copy()
-            # If legacy keys exist, apply to both roles
-            if "language" in data or "accent" in data:
-                lang = data.get("language", "es")
-                acc = data.get("accent", "es-ES")
-                out = {
-                    "interviewer": {"language": lang, "accent": acc, "voice": out["interviewer"]["voice"]},
-                    "interviewee": {"language": lang, "accent": acc, "voice": out["interviewee"]["voice"]},
-                }
-            # New format: per-role objects
-            if "interviewer" in data and isinstance(data["interviewer"], dict):
-                out["interviewer"] = {**out.get("interviewer", {}), **data["interviewer"]}
-            if "interviewee" in data and isinstance(data["interviewee"], dict):
-                out["interviewee"] = {**out.get("interviewee", {}), **data["interviewee"]}
-            # Backwards compat: also accept voices:{ interviewer, interviewee }
-            if "voices" in data and isinstance(data["voices"], dict):
-                if "interviewer" in data["voices"]:
-                    out["interviewer"]["voice"] = data["voices"]["interviewer"]
-                if "interviewee" in data["voices"]:
-                    out["interviewee"]["voice"] = data["voices"]["interviewee"]
-            # project-level prompt (new)
-            if "project_prompt" in data:
-                out["project_prompt"] = data.get("project_prompt") or ""
-            # title/description (allow desc/name backwards compat)
-            if "title" in data or "name" in data:
-                out["title"] = data.get("title") or data.get("name") or ""
-            if "description" in data or "desc" in data:
-                # prefer full 'description' but accept 'desc'
-                out["description"] = data.get("description") or data.get("desc") or ""
-            log(project_id, f"read_info: loaded info for project, interviewer={out.get('interviewer')}, interviewee={out.get('interviewee')}")
-            return out
     except Exception:
         log(project_id, "read_info: failed to read info, returning DEFAULT", level="ERROR")
-        return DEFAULT.copy()
+        raw, info = {}, copy.deepcopy(DEFAULT)
+    with _cache_lock:
+        version = _versions.get(project_id, 0) + 1
+        _versions[project_id] = version
+        cfg = ProjectConfig(project_id, version, info, raw if isinstance(raw, dict) else {}, build_llm_context(info))
+        _cache[project_id] = (key, cfg)
+    return cfg
+
+
+def invalidate(project_id: str) -> None:
+    """Drop the cached snapshot so the next `get_config` reloads from disk."""
+    with _cache_lock:
+        _cache.pop(project_id, None)
+
+
+def read_info(project_id: str) -> dict:
+    """Return a mutable copy of the normalized project config (served from the cache)."""
+    return _thaw(get_config(project_id).info)
 
 
 def write_info(project_id: str, data: dict) -> None:
     log(project_id, "write_info called")
+    # read-merge-write under the project's "info" lock so concurrent saves
+    # (from any worker process) do not drop each other's keys
+    with locks.project_lock(project_id, "info"):
+        final = _write_info(project_id, data)
+    invalidate(project_id)
+    project_catalog.refresh_project(project_id)
+
+    log(project_id, "Información del proyecto actualizada")
+    # Return the final merged object for callers that want to confirm what was saved
+    return final
+
+
+def _write_info(project_id: str, data: dict) -> dict:
     p = get_info_path(project_id)
     p.parent.mkdir(parents=True, exist_ok=True)
-    tmp = p.with_suffix(".tmp")
 
     # Read existing raw content (preserve unrelated keys)
     existing_raw = {}
@@ -132,15 +257,23 @@ def write_info(project_id: str, data: dict) -> None:
     # Final is existing merged with the normalized updates (deep-merge)
     final = merge_info(existing_raw if isinstance(existing_raw, dict) else {}, normalized_updates)
 
-    with tmp.open("w", encoding="utf-8") as fh:
-        json.dump(final, fh, ensure_ascii=False, indent=2)
-    tmp.replace(p)
-
-    log(project_id, "Información del proyecto actualizada")
-    # Return the final merged object for callers that want to confirm what was saved
+    with locks.atomic_path(p) as tmp:
+        with tmp.open("w", encoding="utf-8") as fh:
+            json.dump(final, fh, ensure_ascii=False, indent=2)
     return final
 
 
+def replace_raw(project_id: str, data: dict) -> None:
+    """Replace the whole `.info` with `data` as is (project import); `write_info` merges instead."""
+    with locks.project_lock(project_id, "info"):
+        with locks.atomic_path(get_info_path(project_id)) as tmp:
+            with tmp.open("w", encoding="utf-8") as fh:
+                json.dump(data, fh, ensure_ascii=False, indent=2)
+    invalidate(project_id)
+    project_catalog.refresh_project(project_id)
+    log(project_id, "Información del proyecto reemplazada")
+
+
 def read_raw(project_id: str) -> dict:
     """Return the raw JSON object stored in the project's .info file (or {})."""
     p = get_info_path(project_id)
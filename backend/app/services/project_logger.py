@@ -1,7 +1,7 @@
 from pathlib import Path
 import datetime
-import threading
-from typing import Optional, Dict
+import os
+from typing import Optional
 
 from ..utils import get_project_dir
 
@@ -20,21 +20,13 @@ Usage:
     # or quick call
     log(project_id, "mensaje rapido")
 
-This implementation keeps a per-project threading.Lock to avoid interleaved writes.
+Each line is written with a single `write()` on a file opened with O_APPEND, so
+lines from concurrent threads and worker processes never interleave and no lock
+is needed.
 """
 
 LOG_DIR_NAME = ".log"
 
-# Per-project locks to ensure atomic append writes
-_locks: Dict[str, threading.Lock] = {}
-
-
-def _get_lock(project_id: str) -> threading.Lock:
-    # Use setdefault to initialise a lock per project
-    if project_id not in _locks:
-        _locks[project_id] = threading.Lock()
-    return _locks[project_id]
-
 
 class ProjectLogger:
     def __init__(self, project_id: str):
@@ -55,11 +47,12 @@ class ProjectLogger:
         ts = now.replace(microsecond=0).isoformat() + "Z"
         line = f"{ts} [{level}] {message}\n"
         path = self._daily_path(now)
-        lock = _get_lock(self.project_id)
-        with lock:
-            # Open in append mode so concurrent processes can still append (OS will serialize)
-            with path.open("a", encoding="utf-8") as fh:
-                fh.write(line)
+        # one O_APPEND write per line: the OS serializes appends across processes
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
 
     def read(self, date: Optional[datetime.date] = None) -> str:
         """Return the contents of a day's log. If date is None, read today's log."""
@@ -0,0 +1,178 @@
+"""Prompt assembly for the LLM cleanup calls, laid out for provider-side prefix caching.
+
+Providers cache the longest previously seen *prefix* of a prompt, so every
+request of a project is built as:
+
+1. system message  -> `system` template
+2. user message    -> `context` template: output schema + project prompt +
+                      project context (language, accent, voices)
+3. user message    -> `row` template: the PREGUNTA / RESPUESTA of the row
+
+Messages 1-2 are rendered once per project config and are byte-identical for
+every row; only message 3 changes. Templates are dedented and stripped, so no
+source indentation is sent (or billed).
+
+Templates can be overridden per project in the `.info` under
+`prompt_templates: {system, context, row}` (`string.Template` syntax:
+`$project_prompt`, `$proj_ctx` in `context`; `$pregunta`, `$respuesta` in `row`).
+
+`record_usage` accumulates `input_tokens` / `cached_tokens` from responses per
+project, to check the prefix-cache hit rate of bulk runs (`stats()`).
+"""
+from __future__ import annotations
+import hashlib
+import json
+import textwrap
+import threading
+from collections import defaultdict
+from string import Template
+from typing import Any, Dict, Optional, Tuple
+
+from .project_info import get_config
+from app.services.project_logger import log
+
+SYSTEM_PROMPT = (
+    "Eres un asistente que corrige y normaliza texto y sugiere pautas de entonación para TTS. "
+    "Para cada par pregunta/respuesta, devuelve versiones limpiadas y naturales del texto y una sugerencia de entonación orientada a TTS. "
+    "Las sugerencias deben ser concisas, indicar ritmo, pausas, tono y cualquier marca relevante para la voz TTS. "
+    "Mantén el idioma y las variantes del texto original a menos que el contexto del proyecto indique lo contrario. "
+    "Usa el contexto si se proporciona para darle más precisión a las sugerencias."
+)
+
+DEFAULT_TEMPLATES = {
+    "system": SYSTEM_PROMPT,
+    "context": """
+        Devuelve JSON con las claves:
+        {"pregunta_limpia": string, "respuesta_limpia": string, "entonacion_p": string, "entonacion_r": string}
+
+        CONTEXTO (puede estar vacío):
+        $project_prompt
+        $proj_ctx
+    """,
+    "row": """
+        TEXTO ORIGINAL:
+        PREGUNTA: $pregunta
+        RESPUESTA: $respuesta
+    """,
+}
+
+# placeholders each template must keep to be usable
+REQUIRED_FIELDS = {"system": (), "context": (), "row": ("pregunta", "respuesta")}
+
+
+def _clean(text: str) -> str:
+    lines = textwrap.dedent(text).strip().splitlines()
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def project_templates(raw: Any) -> Dict[str, str]:
+    """Effective templates: per-project overrides from `.info` on top of the defaults."""
+    overrides = raw.get("prompt_templates") if hasattr(raw, "get") else None
+    out = {}
+    for name, default in DEFAULT_TEMPLATES.items():
+        text = overrides.get(name) if hasattr(overrides, "get") else None
+        if isinstance(text, str) and text.strip():
+            missing = [f for f in REQUIRED_FIELDS[name] if f not in Template(text).get_identifiers()]
+            if not missing:
+                out[name] = _clean(text)
+                continue
+        out[name] = _clean(default)
+    return out
+
+
+class PromptBuilder:
+    """Rendered byte-stable prefix of a project plus the row template."""
+
+    __slots__ = ("prefix", "prefix_hash", "_row")
+
+    def __init__(self, templates: Dict[str, str], project_prompt: str, proj_ctx: str):
+        context = Template(templates["context"]).safe_substitute(project_prompt=project_prompt, proj_ctx=proj_ctx)
+        self.prefix: Tuple[dict, ...] = (
+            {"role": "system", "content": templates["system"]},
+            # el contexto del proyecto va como role:"user", no como system
+            {"role": "user", "content": _clean(context)},
+        )
+        raw = json.dumps(self.prefix, ensure_ascii=False, sort_keys=True)
+        self.prefix_hash = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        self._row = Template(templates["row"])
+
+    @property
+    def cache_key(self) -> str:
+        """`prompt_cache_key` for the provider: same prefix -> same cache routing."""
+        return f"entona-{self.prefix_hash[:24]}"
+
+    def messages(self, pregunta: str, respuesta: str) -> list[dict]:
+        row = self._row.safe_substitute(pregunta=pregunta or "", respuesta=respuesta or "")
+        return [*self.prefix, {"role": "user", "content": row}]
+
+
+_builders: Dict[Tuple[str, int, str], PromptBuilder] = {}
+_builders_lock = threading.Lock()
+
+
+def get_builder(project_id: str, project_prompt: Optional[str] = None) -> PromptBuilder:
+    """Builder for the current `.info` of the project (rebuilt only when the config changes)."""
+    cfg = get_config(project_id)
+    project_prompt = project_prompt or ""
+    key = (project_id, cfg.version, project_prompt)
+    with _builders_lock:
+        builder = _builders.get(key)
+    if builder is None:
+        builder = PromptBuilder(project_templates(cfg.raw), project_prompt, cfg.proj_ctx)
+        with _builders_lock:
+            # drop builders of older config versions of this project
+            for k in [k for k in _builders if k[0] == project_id and k[1] != cfg.version]:
+                del _builders[k]
+            _builders[key] = builder
+    return builder
+
+
+class _Usage:
+    __slots__ = ("calls", "input_tokens", "cached_tokens", "output_tokens")
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_hit_rate": round(self.cached_tokens / self.input_tokens, 4) if self.input_tokens else 0.0,
+        }
+
+
+_usage: Dict[str, _Usage] = defaultdict(_Usage)
+_usage_lock = threading.Lock()
+
+
+def record_usage(project_id: str, usage: Any) -> Optional[dict]:
+    """Accumulate the token usage of one response (SDK `ResponseUsage`); returns the call's numbers."""
+    if usage is None:
+        return None
+    details = getattr(usage, "input_tokens_details", None)
+    call = {
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+    }
+    with _usage_lock:
+        u = _usage[project_id]
+        u.calls += 1
+        u.input_tokens += call["input_tokens"]
+        u.cached_tokens += call["cached_tokens"]
+        u.output_tokens += call["output_tokens"]
+    log(project_id, f"LLM usage input_tokens={call['input_tokens']} cached_tokens={call['cached_tokens']} output_tokens={call['output_tokens']}")
+    return call
+
+
+def stats(project_id: Optional[str] = None) -> dict:
+    """Token usage and prefix-cache hit rate per project (since the process started)."""
+    with _usage_lock:
+        if project_id is not None:
+            return (_usage[project_id] if project_id in _usage else _Usage()).as_dict()
+        return {pid: u.as_dict() for pid, u in _usage.items()}
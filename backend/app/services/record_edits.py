@@ -0,0 +1,132 @@
+"""Batched record edits: many row updates plus an optional find/replace, one write.
+
+`apply_batch` validates every requested change against the current CSV, runs
+the server-side find/replace over the resulting texts and writes the whole
+batch with a single locked, atomic `csv_store.modify_records`. Each touched
+row gets a result (`ok`, changed `fields` or `error`).
+
+With `all_or_nothing` a single invalid row aborts the batch and nothing is
+written; otherwise the valid rows are applied and the invalid ones reported.
+"""
+from __future__ import annotations
+import re
+from typing import Iterable, Optional
+
+from . import csv_store
+from .record_store import RecordTable, TEXT_COLUMNS
+from app.services.project_logger import log
+
+FIND_REPLACE_COLUMNS = ("pregunta", "respuesta", "entonacion_p", "entonacion_r")
+REQUIRED_COLUMNS = ("pregunta", "respuesta")
+
+
+def compile_find(find: str, regex: bool = False, case_sensitive: bool = True) -> re.Pattern:
+    """Pattern for a find/replace request. Raises ValueError on an invalid regex."""
+    flags = 0 if case_sensitive else re.IGNORECASE
+    try:
+        return re.compile(find if regex else re.escape(find), flags)
+    except re.error as e:
+        raise ValueError(f"Expresión regular no válida: {e}") from e
+
+
+def apply_batch(
+    project_id: str,
+    updates: Iterable[tuple[int, dict]] = (),
+    find_replace: Optional[dict] = None,
+    all_or_nothing: bool = True,
+    dry_run: bool = False,
+) -> dict:
+    """Apply `updates` ([(num, {column: value})]) and `find_replace` in one write.
+
+    find_replace: {find, replace, columns, regex, case_sensitive, nums}.
+    Returns {ok, written, updated, results, records, find_replace}.
+    Raises ValueError for request-level errors (bad regex/columns, no CSV).
+    """
+    updates = [(int(num), {k: v for k, v in fields.items() if v is not None}) for num, fields in updates]
+    pattern = None
+    fr_columns: tuple[str, ...] = ()
+    fr_nums = None
+    if find_replace:
+        fr_columns = tuple(find_replace.get("columns") or FIND_REPLACE_COLUMNS)
+        bad = [c for c in fr_columns if c not in FIND_REPLACE_COLUMNS]
+        if bad:
+            raise ValueError(f"Columnas no válidas para buscar/reemplazar: {', '.join(bad)}")
+        pattern = compile_find(find_replace["find"], find_replace.get("regex", False), find_replace.get("case_sensitive", True))
+        replacement = find_replace.get("replace", "")
+        if not find_replace.get("regex", False):
+            # literal replacement: no backreferences / escapes
+            literal = replacement
+            replacement = lambda _m: literal
+        if find_replace.get("nums") is not None:
+            fr_nums = {int(n) for n in find_replace["nums"]}
+    log(project_id, f"apply_batch called updates={len(updates)} find_replace={bool(pattern)} all_or_nothing={all_or_nothing} dry_run={dry_run}")
+
+    out: dict = {}
+
+    def run(table: RecordTable) -> bool:
+        # 1) explicit updates -> pending new values per row (nothing mutated yet)
+        pending: dict[int, dict] = {}
+        errors: dict[int, str] = {}
+        for num, fields in updates:
+            rec = table.get(num)
+            if rec is None:
+                errors[num] = f"Registro num={num} no encontrado"
+            elif not fields:
+                errors[num] = "Sin campos a actualizar"
+            elif num in pending:
+                errors[num] = "Registro repetido en el lote"
+            else:
+                pending[num] = {k: str(v) for k, v in fields.items() if k in TEXT_COLUMNS}
+
+        # 2) find/replace over the texts as they will be after the updates
+        replacements = 0
+        fr_rows: set[int] = set()
+        if pattern is not None:
+            for rec in table:
+                if (fr_nums is not None and rec.num not in fr_nums) or rec.num in errors:
+                    continue
+                row = pending.get(rec.num, {})
+                for col in fr_columns:
+                    new, n = pattern.subn(replacement, row.get(col, rec[col]))
+                    if n:
+                        replacements += n
+                        row[col] = new
+                        fr_rows.add(rec.num)
+                if row:
+                    pending[rec.num] = row
+
+        # 3) per-row validation of the final values; drop no-op fields
+        for num, row in list(pending.items()):
+            rec = table.get(num)
+            for col in REQUIRED_COLUMNS:
+                if col in row and not row[col].strip():
+                    errors[num] = f"'{col}' no puede quedar vacío"
+            if num in errors:
+                del pending[num]
+                continue
+            for col in [c for c, v in row.items() if v == rec[c]]:
+                del row[col]
+
+        results = [{"num": num, "ok": False, "error": err} for num, err in errors.items()]
+        results += [{"num": num, "ok": True, "fields": sorted(row)} for num, row in pending.items()]
+        results.sort(key=lambda r: r["num"])
+        changed = {num: row for num, row in pending.items() if row}
+        aborted = bool(errors) and all_or_nothing
+        write = bool(changed) and not aborted and not dry_run
+        if write or (dry_run and not aborted):
+            for num, row in changed.items():
+                table.get(num).update(**row)
+        out.update(
+            ok=not errors,
+            written=write,
+            updated=0 if aborted else len(changed),
+            results=results,
+            records=[] if aborted else [table.get(num).to_dict() for num in sorted(changed)],
+        )
+        if pattern is not None:
+            out["find_replace"] = {"rows": len(fr_rows & set(changed)), "replacements": replacements}
+        return write
+
+    csv_store.modify_records(project_id, run)
+    log(project_id, f"apply_batch finished ok={out['ok']} written={out['written']} updated={out['updated']}")
+    return out
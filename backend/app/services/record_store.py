@@ -0,0 +1,132 @@
+"""Pandas-free representation of the interview records and a streaming CSV codec.
+
+The request hot path (listing records, reading or updating a single row,
+bulk iteration) only needs plain rows keyed by `num`, so it works on:
+
+- `Record`: one row of `entrevista.csv` (slotted dataclass). Supports
+  `rec["pregunta"]` / `rec.get("notas")` so callers written against pandas rows
+  keep working.
+- `RecordTable`: the rows of a project in file order plus a num -> row index.
+
+`iter_rows` / `write_rows` read and write the CSV row by row with the `csv`
+module, in the same format pandas produced (header, QUOTE_MINIMAL, "\\n").
+pandas is only imported by the code paths that really want a DataFrame
+(`csv_store.read_csv`).
+"""
+from __future__ import annotations
+import csv
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+COLUMNS = ["num", "pregunta", "respuesta", "entonacion_p", "entonacion_r", "notas"]
+TEXT_COLUMNS = COLUMNS[1:]
+
+
+@dataclass(slots=True)
+class Record:
+    num: int
+    pregunta: str = ""
+    respuesta: str = ""
+    entonacion_p: str = ""
+    entonacion_r: str = ""
+    notas: str = ""
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in COLUMNS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in COLUMNS else default
+
+    def update(self, **values: Any) -> None:
+        """Set the given columns; unknown keys and None values are ignored."""
+        for k, v in values.items():
+            if v is not None and k in TEXT_COLUMNS:
+                setattr(self, k, str(v))
+
+    def to_dict(self) -> dict:
+        return {c: getattr(self, c) for c in COLUMNS}
+
+    def values(self) -> list:
+        return [getattr(self, c) for c in COLUMNS]
+
+
+class RecordTable:
+    """Records of a project in file order, indexed by `num`."""
+
+    __slots__ = ("records", "_index")
+
+    def __init__(self, records: Iterable[Record] = ()):
+        self.records: List[Record] = list(records)
+        self._index: Dict[int, Record] = {r.num: r for r in self.records}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[Record]:
+        return iter(self.records)
+
+    @property
+    def empty(self) -> bool:
+        return not self.records
+
+    def get(self, num: int) -> Optional[Record]:
+        return self._index.get(int(num))
+
+    def to_dicts(self) -> list[dict]:
+        return [r.to_dict() for r in self.records]
+
+
+def iter_dicts(path: Path) -> Iterator[dict]:
+    """Stream the rows of a CSV file as {header: value} dicts (all values are strings)."""
+    with Path(path).open("r", encoding="utf-8", newline="") as fh:
+        reader = csv.reader(fh)
+        header = next(reader, None)
+        if not header:
+            return
+        for row in reader:
+            if row:
+                yield dict(zip(header, row))
+
+
+def write_dicts(path: Path, columns: Sequence[str], rows: Iterable[dict]) -> None:
+    """Write rows (dicts) as CSV with the given columns; missing keys are written empty."""
+    with Path(path).open("w", encoding="utf-8", newline="") as fh:
+        w = csv.writer(fh, lineterminator="\n")
+        w.writerow(columns)
+        for row in rows:
+            w.writerow([row.get(c, "") for c in columns])
+
+
+def _record(row: dict) -> Record:
+    # older CSVs may lack `notas`; extra columns are ignored
+    return Record(int(row["num"]), *(row.get(c) or "" for c in TEXT_COLUMNS))
+
+
+def iter_rows(path: Path) -> Iterator[Record]:
+    """Stream the records of an `entrevista.csv` without loading the whole file."""
+    for row in iter_dicts(path):
+        yield _record(row)
+
+
+def read_table(path: Path) -> RecordTable:
+    return RecordTable(iter_rows(path))
+
+
+def find(path: Path, num: int) -> Optional[Record]:
+    """Return the record `num`, stopping the scan at the first match."""
+    num = int(num)
+    for row in iter_dicts(path):
+        if int(row["num"]) == num:
+            return _record(row)
+    return None
+
+
+def write_rows(path: Path, records: Iterable[Record]) -> None:
+    with Path(path).open("w", encoding="utf-8", newline="") as fh:
+        w = csv.writer(fh, lineterminator="\n")
+        w.writerow(COLUMNS)
+        for r in records:
+            w.writerow(r.values())
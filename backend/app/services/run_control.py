@@ -0,0 +1,233 @@
+"""Cancel, pause and resume for a project's bulk runs (TTS, LLM, pipeline).
+
+A project has at most one bulk run at a time (they share the status CSV). Its
+state lives in `<project>/.run.json`, so any uvicorn worker can change it and
+the worker running it sees the change at its next check:
+
+- `Run.checkpoint()`, called between rows and between the two parts of a TTS
+  block, waits while the run is paused and raises `RunCancelled` once it is
+  cancelled;
+- `Run.cancelled()` is passed down to the provider calls in flight
+  (`tts_service.synthesize(cancelled=...)`, the streamed LLM call), which close
+  the connection and keep the previous output.
+
+Rows finished before a cancel keep their outputs and stay `processed` in the
+status CSV; a resumed run (`begin(..., resume=True)`) skips them and starts at
+the first unfinished row. A run whose worker process died (server restart) is
+treated as cancelled, so it can be resumed.
+
+States: running -> paused -> running ... -> cancelling -> cancelled | done.
+"""
+from __future__ import annotations
+import json
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import ulid
+
+from ..utils import BASE_VOICES_DIR
+from . import locks
+from app.services.project_logger import log
+
+KINDS = ("tts", "llm", "pipeline")
+ACTIVE = ("running", "paused", "cancelling")
+# how often a paused run looks at its state again (seconds)
+PAUSE_POLL_S = 0.5
+
+
+class RunCancelled(Exception):
+    """The run was cancelled; raised at a checkpoint or by an aborted provider call."""
+
+
+class RunConflict(Exception):
+    """The project already has a bulk run in progress."""
+
+
+class RunStateError(Exception):
+    """The action is not valid in the run's current state."""
+
+
+def _path(project_id: str) -> Path:
+    # not `get_project_dir`: reading the state of a missing project must not create it
+    return BASE_VOICES_DIR / project_id / ".run.json"
+
+
+def _read(project_id: str) -> Optional[dict]:
+    try:
+        with _path(project_id).open("r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write(project_id: str, state: dict) -> None:
+    state["updated_at"] = time.time()
+    with locks.atomic_path(_path(project_id)) as tmp:
+        with tmp.open("w", encoding="utf-8") as fh:
+            json.dump(state, fh, ensure_ascii=False)
+
+
+def _alive(state: dict) -> bool:
+    """Whether the worker process of an active run still exists (same host only)."""
+    if state.get("host") != socket.gethostname():
+        return True
+    try:
+        os.kill(int(state.get("pid") or 0), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+def _current(project_id: str) -> Optional[dict]:
+    """The run's state, with an active run whose worker died reported as cancelled."""
+    state = _read(project_id)
+    if state is not None and state.get("state") in ACTIVE and not _alive(state):
+        state["state"] = "cancelled"
+        state["error"] = "worker terminated"
+    return state
+
+
+class Run:
+    """Handle of a run for the worker executing it."""
+
+    def __init__(self, project_id: str, run_id: str, kind: str, resumed: bool = False):
+        self.project_id = project_id
+        self.id = run_id
+        self.kind = kind
+        # continues a cancelled run: rows already processed are skipped
+        self.resumed = resumed
+        # (mtime_ns, size) of the state file -> its last parsed "state"
+        self._seen: Tuple[Optional[Tuple[int, int]], str] = (None, "running")
+        self._seen_lock = threading.Lock()
+
+    def state(self) -> str:
+        """Current state ("running" | "paused" | "cancelling"), re-read only when the file changed."""
+        try:
+            st = _path(self.project_id).stat()
+            key = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            # project deleted under the run
+            return "cancelling"
+        with self._seen_lock:
+            if self._seen[0] == key:
+                return self._seen[1]
+        data = _read(self.project_id) or {}
+        value = data.get("state", "cancelling") if data.get("id") == self.id else "cancelling"
+        with self._seen_lock:
+            self._seen = (key, value)
+        return value
+
+    def cancelled(self) -> bool:
+        return self.state() == "cancelling"
+
+    def checkpoint(self) -> None:
+        """Wait while paused; raise `RunCancelled` if cancelled."""
+        state = self.state()
+        if state == "paused":
+            log(self.project_id, f"run {self.id} paused")
+            while state == "paused":
+                time.sleep(PAUSE_POLL_S)
+                state = self.state()
+            log(self.project_id, f"run {self.id} {'resumed' if state == 'running' else state}")
+        if state == "cancelling":
+            raise RunCancelled(self.id)
+
+    def finish(self, cancelled: bool = False, error: str | None = None) -> None:
+        """Record the end of the run (the worker calls it once, from a `finally`)."""
+        with locks.project_lock(self.project_id, "run"):
+            state = _read(self.project_id)
+            if state is None or state.get("id") != self.id:
+                return
+            state["state"] = "cancelled" if cancelled or state["state"] == "cancelling" else "done"
+            state["finished_at"] = time.time()
+            if error:
+                state["error"] = error[:1000]
+            _write(self.project_id, state)
+        log(self.project_id, f"run {self.id} {state['state']}")
+
+
+def begin(project_id: str, kind: str, params: dict | None = None, resume: bool = False) -> Run:
+    """Register a new run of `kind` for the project; RunConflict if one is in progress.
+
+    `params` (the start request body) are kept so a cancelled run can be resumed with them.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {KINDS}")
+    with locks.project_lock(project_id, "run"):
+        current = _current(project_id)
+        if current is not None and current["state"] in ACTIVE:
+            raise RunConflict(f"Ya hay una ejecución {current['kind']} en curso ({current['state']})")
+        state = {
+            "id": str(ulid.new()).lower(),
+            "kind": kind,
+            "state": "running",
+            "params": params or {},
+            "resumed": resume,
+            "started_at": time.time(),
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+        }
+        _write(project_id, state)
+    log(project_id, f"run {state['id']} started kind={kind} resume={resume}")
+    return Run(project_id, state["id"], kind, resume)
+
+
+def status(project_id: str) -> Optional[dict]:
+    """State of the project's current or last run (None if it never had one)."""
+    state = _current(project_id)
+    if state is not None:
+        state.pop("host", None)
+        state.pop("pid", None)
+    return state
+
+
+def pause(project_id: str) -> dict:
+    return _transition(project_id, "pause", ("running",), "paused")
+
+
+def cancel(project_id: str) -> dict:
+    return _transition(project_id, "cancel", ("running", "paused"), "cancelling")
+
+
+def resume(project_id: str) -> Tuple[dict, bool]:
+    """Resume a paused run in place, or prepare a restart of a cancelled one.
+
+    Returns (state, restart): with restart=True the caller starts a new run with
+    `begin(..., resume=True)` and the stored `params`.
+    """
+    if not _path(project_id).exists():
+        # checked before taking the lock, which would create the project folder
+        raise RunStateError("El proyecto no tiene ninguna ejecución")
+    with locks.project_lock(project_id, "run"):
+        state = _current(project_id)
+        if state is None:
+            raise RunStateError("El proyecto no tiene ninguna ejecución")
+        if state["state"] == "paused":
+            state["state"] = "running"
+            _write(project_id, state)
+            log(project_id, f"run {state['id']} resume requested")
+            return state, False
+        if state["state"] == "cancelled":
+            return state, True
+        raise RunStateError(f"No se puede reanudar una ejecución en estado {state['state']}")
+
+
+def _transition(project_id: str, action: str, allowed: tuple, target: str) -> dict:
+    if not _path(project_id).exists():
+        raise RunStateError("El proyecto no tiene ninguna ejecución")
+    with locks.project_lock(project_id, "run"):
+        state = _current(project_id)
+        if state is None:
+            raise RunStateError("El proyecto no tiene ninguna ejecución")
+        if state["state"] not in allowed:
+            raise RunStateError(f"No se puede {'pausar' if action == 'pause' else 'cancelar'} una ejecución en estado {state['state']}")
+        state["state"] = target
+        _write(project_id, state)
+    log(project_id, f"run {state['id']} {action} requested")
+    return state
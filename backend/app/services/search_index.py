@@ -0,0 +1,320 @@
+"""Full-text search over the records of every project (SQLite FTS5).
+
+One index for the whole volume in `.index/search.sqlite`, next to the project
+catalog:
+
+- `blocks`: FTS5 table over `pregunta`, `respuesta`, `entonacion_p`,
+  `entonacion_r` and `notas` (unicode61, accents folded: "entonacion" finds
+  "entonación");
+- `docs`: (project_id, num) -> rowid of the block, so a row is replaced
+  without scanning the FTS table;
+- `projects`: size/mtime of each project's CSV when it was last indexed.
+
+`csv_store` keeps it current while it holds the project lock: single-row
+writes (`update_record`, LLM cleanup) reindex only that row, batch edits only
+the rows that changed, uploads the whole project. CSVs changed by other means
+(older projects, hand edits, a failed index write) no longer match their
+stored size/mtime and are reindexed on the next search; deleted projects are
+dropped. From scratch:
+
+    python -m app.services.search_index rebuild
+"""
+from __future__ import annotations
+import os
+import re
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from ..utils import BASE_VOICES_DIR, get_csv_path
+from . import record_store
+from . import tracing
+from .record_store import TEXT_COLUMNS, Record
+from app.services.project_logger import log
+
+INDEX_DIR_NAME = ".index"
+SEARCH_FILE = "search.sqlite"
+
+FIELDS = tuple(TEXT_COLUMNS)  # pregunta, respuesta, entonacion_p, entonacion_r, notas
+# bm25 weight per column (same order as FIELDS): the texts rank above prompts and notes
+WEIGHTS = (1.0, 1.0, 0.5, 0.5, 0.5)
+SNIPPET_TOKENS = 16
+MAX_LIMIT = 100
+# above this many matches results are not ranked (see `search`)
+RANK_MAX = 10000
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS docs (
+        id INTEGER PRIMARY KEY,
+        project_id TEXT NOT NULL,
+        num INTEGER NOT NULL,
+        UNIQUE (project_id, num)
+    )
+    """,
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS blocks USING fts5(
+        {", ".join(FIELDS)},
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS projects (
+        id TEXT PRIMARY KEY,
+        csv_mtime_ns INTEGER NOT NULL,
+        csv_size INTEGER NOT NULL
+    )
+    """,
+)
+
+_TERM_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def index_path() -> Path:
+    d = BASE_VOICES_DIR / INDEX_DIR_NAME
+    d.mkdir(parents=True, exist_ok=True)
+    return d / SEARCH_FILE
+
+
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    # one short-lived connection per call, as in project_catalog
+    conn = sqlite3.connect(str(index_path()), timeout=30)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in _SCHEMA:
+            conn.execute(stmt)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _csv_stat(project_id: str) -> Optional[tuple[int, int]]:
+    try:
+        st = os.stat(BASE_VOICES_DIR / project_id / "entrevista.csv")
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _mark(conn: sqlite3.Connection, project_id: str, stat: Optional[tuple[int, int]]) -> None:
+    if stat is None:
+        conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+    else:
+        conn.execute(
+            "INSERT INTO projects (id, csv_mtime_ns, csv_size) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET csv_mtime_ns=excluded.csv_mtime_ns, csv_size=excluded.csv_size",
+            (project_id, *stat),
+        )
+
+
+_INSERT_BLOCK = f"INSERT INTO blocks (rowid, {', '.join(FIELDS)}) VALUES (?{', ?' * len(FIELDS)})"
+
+
+def _put(conn: sqlite3.Connection, project_id: str, rec: Record) -> None:
+    row = conn.execute(
+        "INSERT INTO docs (project_id, num) VALUES (?, ?) "
+        "ON CONFLICT(project_id, num) DO UPDATE SET num=excluded.num RETURNING id",
+        (project_id, rec.num),
+    ).fetchone()
+    conn.execute("DELETE FROM blocks WHERE rowid = ?", (row[0],))
+    conn.execute(_INSERT_BLOCK, (row[0], *(rec[c] or "" for c in FIELDS)))
+
+
+def _drop(conn: sqlite3.Connection, project_id: str) -> None:
+    conn.execute("DELETE FROM blocks WHERE rowid IN (SELECT id FROM docs WHERE project_id = ?)", (project_id,))
+    conn.execute("DELETE FROM docs WHERE project_id = ?", (project_id,))
+    conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+
+
+def _reindex(conn: sqlite3.Connection, project_id: str, records: Optional[Iterable[Record]] = None) -> int:
+    # stat before reading: a write in between leaves a mismatch and is picked up next time
+    stat = _csv_stat(project_id)
+    if records is None:
+        records = record_store.read_table(get_csv_path(project_id)) if stat is not None else ()
+    _drop(conn, project_id)
+    records = list(records)
+    # fresh rowids above the highest one: plain bulk inserts, no per-row upsert
+    start = conn.execute("SELECT COALESCE(MAX(id), 0) FROM docs").fetchone()[0] + 1
+    conn.executemany("INSERT INTO docs (id, project_id, num) VALUES (?, ?, ?)", ((start + i, project_id, rec.num) for i, rec in enumerate(records)))
+    conn.executemany(_INSERT_BLOCK, ((start + i, *(rec[c] or "" for c in FIELDS)) for i, rec in enumerate(records)))
+    _mark(conn, project_id, stat)
+    return len(records)
+
+
+@tracing.traced("search.index")
+def index_records(project_id: str, records: Iterable[Record], nums: Optional[Iterable[int]] = None) -> None:
+    """Index the CSV just written by csv_store (called with the project lock held).
+
+    nums: the rows that changed (None -> the whole project is reindexed).
+    Never raises: on failure the project is left stale and reindexed on the next search.
+    """
+    try:
+        with _connect() as conn:
+            if nums is None:
+                n = _reindex(conn, project_id, records)
+                log(project_id, f"search index: {n} rows indexed")
+            else:
+                by_num = {rec.num: rec for rec in records}
+                for num in nums:
+                    if num in by_num:
+                        _put(conn, project_id, by_num[num])
+                _mark(conn, project_id, _csv_stat(project_id))
+    except Exception as e:
+        log(project_id, f"search index update failed: {e}", level="ERROR")
+        try:
+            with _connect() as conn:
+                conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+        except Exception:
+            pass
+
+
+def remove_project(project_id: str) -> None:
+    with _connect() as conn:
+        _drop(conn, project_id)
+
+
+def _is_project_dir(p: Path) -> bool:
+    return p.is_dir() and not p.name.startswith(".")
+
+
+def _sync(conn: sqlite3.Connection) -> None:
+    """Drop deleted projects and reindex those whose CSV changed behind our back (one stat per project)."""
+    on_disk = {p.name for p in BASE_VOICES_DIR.iterdir() if _is_project_dir(p)}
+    known = {r["id"]: (r["csv_mtime_ns"], r["csv_size"]) for r in conn.execute("SELECT * FROM projects")}
+    for pid in set(known) - on_disk:
+        _drop(conn, pid)
+    for pid in on_disk:
+        stat = _csv_stat(pid)
+        if stat is None:
+            if pid in known:
+                _drop(conn, pid)
+        elif known.get(pid) != stat:
+            n = _reindex(conn, pid)
+            log(pid, f"search index: stale CSV, {n} rows reindexed")
+
+
+def build_query(q: str, fields: Optional[Iterable[str]] = None, raw: bool = False) -> str:
+    """FTS5 expression for a search box query.
+
+    Words are prefix matches ("entona" finds "entonación"), "quoted text" is an
+    exact phrase, all terms must match. `raw` passes FTS5 syntax through
+    (OR, NOT, NEAR, column filters). Raises ValueError for unknown fields or an
+    empty query.
+    """
+    fields = list(fields or ())
+    bad = [f for f in fields if f not in FIELDS]
+    if bad:
+        raise ValueError(f"Campos no válidos: {', '.join(bad)}")
+    if raw:
+        expr = q.strip()
+    else:
+        terms = []
+        for phrase, word in _TERM_RE.findall(q):
+            text = (phrase or word).strip()
+            if text:
+                escaped = text.replace('"', '""')
+                terms.append(f'"{escaped}"' if phrase else f'"{escaped}"*')
+        expr = " AND ".join(terms)
+    if not expr:
+        raise ValueError("La búsqueda está vacía")
+    if fields:
+        expr = f"{{{' '.join(fields)}}} : ({expr})"
+    return expr
+
+
+def _segments(snippet: str) -> list[str]:
+    # even items are plain text, odd items are the matched terms
+    return re.split("\x02(.*?)\x03", snippet)
+
+
+@tracing.traced("search.query")
+def search(
+    q: str,
+    projects: Optional[Iterable[str]] = None,
+    fields: Optional[Iterable[str]] = None,
+    raw: bool = False,
+    limit: int = 20,
+    offset: int = 0,
+) -> dict:
+    """Ranked blocks matching `q`, with highlighted snippets and matches per project.
+
+    Returns {total, ranked, projects: {project_id: matches}, results: [{project_id,
+    num, score, snippets: {field: [text, match, text, ...]}}]}; `ranked` is False
+    when more than RANK_MAX blocks match. Raises ValueError for an invalid query.
+    """
+    expr = build_query(q, fields, raw)
+    fields = [f for f in FIELDS if not fields or f in fields]
+    projects = list(projects or ())
+    scope, scope_params = "", []
+    if projects:
+        scope = f" AND d.project_id IN ({', '.join('?' * len(projects))})"
+        scope_params = projects
+    # CROSS JOIN keeps FTS5 as the outer loop (a `rowid IN (...)` filter makes
+    # SQLite probe the FTS index once per row of the project)
+    source = "blocks CROSS JOIN docs d ON d.id = blocks.rowid WHERE blocks MATCH ?"
+    bm25 = f"bm25(blocks, {', '.join(str(w) for w in WEIGHTS)})"
+    snippets = ", ".join(
+        f"snippet(blocks, {FIELDS.index(f)}, char(2), char(3), '…', {SNIPPET_TOKENS}) AS s_{f}" for f in fields
+    )
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    try:
+        with _connect() as conn:
+            _sync(conn)
+            counts = {
+                r[0]: r[1]
+                for r in conn.execute(
+                    f"SELECT d.project_id, COUNT(*) FROM {source}{scope} GROUP BY d.project_id",
+                    [expr, *scope_params],
+                )
+            }
+            total = sum(counts.values())
+            # bm25 costs a few µs per match: terms found in nearly every block are
+            # listed in project/num order instead of ranked
+            ranked = total <= RANK_MAX
+            order = "score, blocks.rowid" if ranked else "blocks.rowid"
+            # snippets are only built for the rows kept by ORDER BY ... LIMIT
+            rows = conn.execute(
+                f"SELECT d.project_id, d.num, {bm25 if ranked else '0.0'} AS score, {snippets} FROM {source}{scope} "
+                f"ORDER BY {order} LIMIT ? OFFSET ?",
+                [expr, *scope_params, limit, max(int(offset), 0)],
+            ).fetchall()
+    except sqlite3.OperationalError as e:
+        # bad FTS5 syntax ("fts5: syntax error near ...", "unterminated string") is the caller's fault
+        if raw or "fts5" in str(e) or "no such column" in str(e):
+            raise ValueError(f"Búsqueda no válida: {e}") from e
+        raise
+    results = []
+    for r in rows:
+        matched = {f: _segments(r[f"s_{f}"]) for f in fields if "\x02" in (r[f"s_{f}"] or "")}
+        # bm25 is lower-is-better; expose higher-is-better
+        results.append({"project_id": r["project_id"], "num": r["num"], "score": round(-r["score"], 4), "snippets": matched})
+    return {"total": total, "ranked": ranked, "projects": counts, "results": results}
+
+
+def rebuild() -> int:
+    """Reindex every project from its CSV. Returns the number of rows indexed."""
+    with _connect() as conn:
+        conn.execute("DELETE FROM blocks")
+        conn.execute("DELETE FROM docs")
+        conn.execute("DELETE FROM projects")
+        n = 0
+        for p in BASE_VOICES_DIR.iterdir():
+            if _is_project_dir(p):
+                n += _reindex(conn, p.name)
+    return n
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("uso: python -m app.services.search_index rebuild")
+        sys.exit(2)
+    t0 = time.perf_counter()
+    n = rebuild()
+    print(f"search index rebuilt: {n} rows in {time.perf_counter() - t0:.2f}s ({index_path()})")
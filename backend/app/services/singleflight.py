@@ -0,0 +1,86 @@
+"""Single-flight coalescing of identical provider requests.
+
+Double clicks, several open tabs or retrying clients can fire the same
+`tts_one` / `llm_process_one` at once. `SingleFlight.do(key, fn)` runs `fn`
+once per key at a time: callers arriving while a call with the same key is in
+flight wait for it and receive its result (or its exception) instead of
+hitting the provider and racing to write the same file or CSV row.
+
+Keys are request fingerprints built with `fingerprint(...)`.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable hash of the request inputs (project, num, part, texts, voice...)."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.requests = 0
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run `fn` unless an identical call is in flight. Returns (result, shared)."""
+        with self._lock:
+            self.requests += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
+
+
+tts_calls = SingleFlight("tts")
+llm_calls = SingleFlight("llm")
+
+
+def stats() -> dict:
+    return {g.name: g.stats() for g in (tts_calls, llm_calls)}
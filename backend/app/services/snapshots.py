@@ -0,0 +1,372 @@
+"""Named, immutable snapshots of a project, with content-addressed storage.
+
+A snapshot records the project's records (`entrevista.csv`), `.info` and the
+sha256 of every mp3. The content itself goes to a content-addressed object
+store shared by all the snapshots of the project:
+
+    <project>/.snapshots/<snapshot_id>.json         manifest
+    <project>/.snapshots/objects/<sha[:2]>/<sha>    csv / .info / mp3 content
+
+Content already stored (unchanged since an earlier snapshot, or identical in
+another block) is not written again. With the local audio store an mp3 is
+hardlinked into the object store instead of copied. The audio store only ever
+replaces files (temp file + rename), never rewrites them in place, so the
+linked inode keeps the snapshotted bytes. Hashes come from the audio index
+(`audio_meta.content_hashes`), so a snapshot only reads the files that
+changed since they were last indexed: snapshotting a large project takes
+milliseconds and almost no disk. With S3 the mp3s are downloaded once per
+new content.
+
+`restore` puts records, `.info` and audio back as they were, rewriting only
+the mp3s whose content differs and deleting the ones the snapshot did not
+have. By default it first takes a snapshot of the current state.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import ulid
+
+from ..utils import BASE_VOICES_DIR, get_csv_path, get_info_path
+from . import audio_meta
+from . import audio_store
+from . import csv_store
+from . import locks
+from . import project_catalog
+from . import project_info
+from . import record_store
+from . import run_control
+from . import tracing
+from app.services.project_logger import log
+
+DIR_NAME = ".snapshots"
+CHUNK_SIZE = 256 * 1024
+_SNAPSHOT_ID = re.compile(r"^[0-9a-z]{26}$")
+
+
+class SnapshotNotFound(LookupError):
+    """The project has no snapshot with that id."""
+
+
+def _dir(project_id: str) -> Path:
+    # not `get_project_dir`: listing the snapshots of a missing project must not create it
+    return BASE_VOICES_DIR / project_id / DIR_NAME
+
+
+def _object(project_id: str, sha: str) -> Path:
+    return _dir(project_id) / "objects" / sha[:2] / sha
+
+
+def _hash_file(path: Path) -> Optional[str]:
+    try:
+        fh = path.open("rb")
+    except FileNotFoundError:
+        return None
+    h = hashlib.sha256()
+    with fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _tmp(project_id: str) -> Path:
+    d = _dir(project_id) / "objects"
+    d.mkdir(parents=True, exist_ok=True)
+    return d / f".{ulid.new()}.tmp"
+
+
+def _commit(project_id: str, tmp: Path, sha: Optional[str] = None) -> str:
+    """Move a temp file into the object store under its hash; drop it if the content is already there."""
+    sha = sha or _hash_file(tmp)
+    obj = _object(project_id, sha)
+    if obj.exists():
+        tmp.unlink()
+    else:
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, obj)
+    return sha
+
+
+def _put_file(project_id: str, path: Path) -> Optional[str]:
+    """Copy a small project file (csv, .info) into the object store; None if it does not exist."""
+    tmp = _tmp(project_id)
+    h = hashlib.sha256()
+    try:
+        with path.open("rb") as src, tmp.open("wb") as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+                dst.write(chunk)
+    except FileNotFoundError:
+        tmp.unlink(missing_ok=True)
+        return None
+    return _commit(project_id, tmp, h.hexdigest())
+
+
+def _put_audio(project_id: str, store: audio_store.AudioStore, rel: str, sha: str, st: audio_store.Stat) -> str:
+    """Store the mp3 `rel` (content `sha` when it had stat `st`); returns the hash actually stored."""
+    if _object(project_id, sha).exists():
+        return sha
+    key = f"{project_id}/{rel}"
+    tmp = _tmp(project_id)
+    if isinstance(store, audio_store.LocalAudioStore):
+        try:
+            os.link(store.path(key), tmp)
+        except OSError:
+            # another filesystem, or links not allowed: copy
+            shutil.copyfile(store.path(key), tmp)
+        s = tmp.stat()
+        if (s.st_size, str(s.st_mtime_ns)) != st:
+            # replaced (or copied) after it was hashed: hash what was actually taken
+            sha = None
+    else:
+        data = store.read(key)
+        tmp.write_bytes(data)
+        sha = hashlib.sha256(data).hexdigest()
+    return _commit(project_id, tmp, sha)
+
+
+def _manifest_path(project_id: str, snapshot_id: str) -> Path:
+    if not _SNAPSHOT_ID.match(snapshot_id or ""):
+        raise SnapshotNotFound(snapshot_id)
+    return _dir(project_id) / f"{snapshot_id}.json"
+
+
+def _summary(manifest: dict) -> dict:
+    return {k: v for k, v in manifest.items() if k != "audio"}
+
+
+def get(project_id: str, snapshot_id: str) -> dict:
+    """Full manifest of a snapshot (SnapshotNotFound if missing)."""
+    try:
+        with _manifest_path(project_id, snapshot_id).open("r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        raise SnapshotNotFound(snapshot_id) from None
+
+
+def _manifests(project_id: str) -> Iterator[dict]:
+    d = _dir(project_id)
+    if not d.is_dir():
+        return
+    for p in d.glob("*.json"):
+        try:
+            with p.open("r", encoding="utf-8") as fh:
+                yield json.load(fh)
+        except (OSError, ValueError):
+            continue
+
+
+def list_snapshots(project_id: str) -> list[dict]:
+    """Snapshots of the project, newest first, without their audio lists."""
+    return sorted((_summary(m) for m in _manifests(project_id)), key=lambda m: m["created_at"], reverse=True)
+
+
+@tracing.traced("snapshots.create")
+def create(project_id: str, name: Optional[str] = None) -> dict:
+    """Take a snapshot of the project as it is now. The project must exist."""
+    t0 = time.perf_counter()
+    store = audio_store.get_store()
+    with locks.project_lock(project_id, "snapshots"):
+        # records and .info are copied under their own locks, so a concurrent write is either fully in or out
+        with locks.project_lock(project_id):
+            records = _put_file(project_id, get_csv_path(project_id))
+        with locks.project_lock(project_id, "info"):
+            info = _put_file(project_id, get_info_path(project_id))
+        audio: Dict[str, dict] = {}
+        new_bytes = 0
+        for rel, (sha, st) in sorted(audio_meta.content_hashes(project_id).items()):
+            existed = _object(project_id, sha).exists()
+            try:
+                sha = _put_audio(project_id, store, rel, sha, st)
+            except FileNotFoundError:
+                # deleted since it was listed
+                continue
+            if not existed:
+                new_bytes += st[0]
+            audio[rel] = {"sha256": sha, "bytes": st[0]}
+        snapshot_id = str(ulid.new()).lower()
+        manifest = {
+            "id": snapshot_id,
+            "name": name or time.strftime("%Y-%m-%d %H:%M:%S"),
+            "created_at": time.time(),
+            "records": records,
+            "info": info,
+            "rows": len(csv_store.read_records(project_id)) if records else 0,
+            "audio_files": len(audio),
+            "audio_bytes": sum(a["bytes"] for a in audio.values()),
+            # audio content this snapshot added to the object store (the rest is shared)
+            "new_audio_bytes": new_bytes,
+            "audio": audio,
+        }
+        with locks.atomic_path(_manifest_path(project_id, snapshot_id)) as tmp:
+            with tmp.open("w", encoding="utf-8") as fh:
+                json.dump(manifest, fh, ensure_ascii=False, separators=(",", ":"))
+    took_ms = round((time.perf_counter() - t0) * 1000, 1)
+    log(project_id, f"snapshot {snapshot_id} created name={manifest['name']!r} audio={len(audio)} new_bytes={new_bytes} took_ms={took_ms}")
+    return {**_summary(manifest), "took_ms": took_ms}
+
+
+def delete(project_id: str, snapshot_id: str) -> int:
+    """Delete a snapshot and the objects no other snapshot uses; returns the bytes freed."""
+    path = _manifest_path(project_id, snapshot_id)
+    if not path.exists():
+        raise SnapshotNotFound(snapshot_id)
+    with locks.project_lock(project_id, "snapshots"):
+        path.unlink(missing_ok=True)
+        used = set()
+        for m in _manifests(project_id):
+            used.update(sha for sha in (m.get("records"), m.get("info")) if sha)
+            used.update(a["sha256"] for a in (m.get("audio") or {}).values())
+        freed = 0
+        for obj in (_dir(project_id) / "objects").glob("*/*"):
+            if obj.name not in used and not obj.name.startswith("."):
+                st = obj.stat()
+                # a hardlink shared with a live mp3 frees nothing
+                if st.st_nlink == 1:
+                    freed += st.st_size
+                obj.unlink()
+    log(project_id, f"snapshot {snapshot_id} deleted, freed {freed} bytes")
+    return freed
+
+
+# ------------------------------------------------------------------ diff
+
+
+def _current(project_id: str) -> dict:
+    """The project's live state in the shape of a manifest."""
+    with locks.project_lock(project_id):
+        records = _hash_file(get_csv_path(project_id))
+    return {
+        "id": None,
+        "records": records,
+        "info": _hash_file(get_info_path(project_id)),
+        "audio": {rel: {"sha256": sha, "bytes": st[0]} for rel, (sha, st) in audio_meta.content_hashes(project_id).items()},
+    }
+
+
+def _records(project_id: str, manifest: dict) -> record_store.RecordTable:
+    if manifest["id"] is None:
+        return csv_store.read_records(project_id)
+    if not manifest.get("records"):
+        return record_store.RecordTable()
+    return record_store.read_table(_object(project_id, manifest["records"]))
+
+
+def _info(project_id: str, manifest: dict) -> dict:
+    if manifest["id"] is None:
+        return project_info.read_raw(project_id)
+    if not manifest.get("info"):
+        return {}
+    with _object(project_id, manifest["info"]).open("r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+@tracing.traced("snapshots.diff")
+def diff(project_id: str, snapshot_id: str, against: Optional[str] = None) -> dict:
+    """Changes from snapshot `snapshot_id` to snapshot `against` (the current state when None).
+
+    Records: nums added / removed and, for changed rows, {column: [before, after]}.
+    Audio: parts ("<num>/<p|r><num>.mp3") added / removed / changed.
+    `.info`: top-level keys whose value changed.
+    """
+    old = get(project_id, snapshot_id)
+    new = get(project_id, against) if against else _current(project_id)
+    out: dict = {"from": snapshot_id, "to": against or "current"}
+
+    records = {"added": [], "removed": [], "changed": []}
+    if old.get("records") != new.get("records"):
+        a, b = _records(project_id, old), _records(project_id, new)
+        records["removed"] = [r.num for r in a if b.get(r.num) is None]
+        for r in b:
+            prev = a.get(r.num)
+            if prev is None:
+                records["added"].append(r.num)
+                continue
+            fields = {c: [prev[c], r[c]] for c in record_store.TEXT_COLUMNS if prev[c] != r[c]}
+            if fields:
+                records["changed"].append({"num": r.num, "fields": fields})
+    out["records"] = records
+
+    a, b = old.get("audio") or {}, new.get("audio") or {}
+    out["audio"] = {
+        "added": sorted(rel for rel in b if rel not in a),
+        "removed": sorted(rel for rel in a if rel not in b),
+        "changed": sorted(rel for rel in b if rel in a and a[rel]["sha256"] != b[rel]["sha256"]),
+        "unchanged": sum(1 for rel in b if rel in a and a[rel]["sha256"] == b[rel]["sha256"]),
+    }
+
+    info_keys: list[str] = []
+    if old.get("info") != new.get("info"):
+        ia, ib = _info(project_id, old), _info(project_id, new)
+        info_keys = sorted(k for k in set(ia) | set(ib) if ia.get(k) != ib.get(k))
+    out["info"] = info_keys
+    return out
+
+
+# ------------------------------------------------------------------ restore
+
+
+def _restore_audio(project_id: str, store: audio_store.AudioStore, rel: str, sha: str) -> None:
+    key = f"{project_id}/{rel}"
+    obj = _object(project_id, sha)
+    if isinstance(store, audio_store.LocalAudioStore):
+        path = store.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # link the object back in place (temp name + rename, like the store's own writes)
+        try:
+            with locks.atomic_path(path) as tmp:
+                os.link(obj, tmp)
+            return
+        except OSError:
+            pass
+    data = obj.read_bytes()
+    with store.writer(key) as blob:
+        blob.write(data)
+    audio_meta.update(key, data, blob.version)
+
+
+@tracing.traced("snapshots.restore")
+def restore(project_id: str, snapshot_id: str, backup: bool = True) -> dict:
+    """Bring records, `.info` and audio back to the snapshot.
+
+    With `backup`, the current state is snapshotted first (its id is returned in
+    `backup`). Raises run_control.RunConflict if a bulk run is in progress.
+    """
+    manifest = get(project_id, snapshot_id)
+    state = run_control.status(project_id)
+    if state is not None and state["state"] in run_control.ACTIVE:
+        raise run_control.RunConflict(f"Ya hay una ejecución {state['kind']} en curso ({state['state']})")
+    out: dict = {"snapshot": snapshot_id, "backup": None}
+    if backup:
+        out["backup"] = create(project_id, f"Antes de restaurar «{manifest['name']}»")["id"]
+    current = _current(project_id)
+    store = audio_store.get_store()
+    with locks.project_lock(project_id, "snapshots"):
+        out["records"] = manifest.get("records") != current["records"]
+        if out["records"]:
+            csv_store.write_records(_records(project_id, manifest), project_id)
+        out["info"] = manifest.get("info") != current["info"]
+        if out["info"]:
+            project_info.replace_raw(project_id, _info(project_id, manifest))
+
+        wanted = manifest.get("audio") or {}
+        live = current["audio"]
+        written = removed = 0
+        for rel, a in wanted.items():
+            if live.get(rel, {}).get("sha256") == a["sha256"]:
+                continue
+            _restore_audio(project_id, store, rel, a["sha256"])
+            written += 1
+        for rel in live:
+            if rel not in wanted:
+                removed += store.delete(f"{project_id}/{rel}")
+    out.update(audio_written=written, audio_removed=removed, audio_unchanged=len(wanted) - written)
+    project_catalog.mark_dirty(project_id)
+    log(project_id, f"snapshot {snapshot_id} restored {out}")
+    return out
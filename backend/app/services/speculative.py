@@ -0,0 +1,233 @@
+"""Speculative TTS pre-synthesis after record edits (opt-in per project).
+
+When `pregunta` / `respuesta` / `entonacion_*` of a row change (PATCH, LLM
+cleanup, batch edits), the existing mp3 of that part is stale. `schedule()`
+queues a re-render of the affected part so the audio is usually ready by the
+time the reviewer presses play:
+
+- debounced: the render starts `debounce_ms` after the *last* edit of that
+  (project, num, part), so typing in a field costs one render, not one per save;
+- low priority: renders run in the dispatcher's SPECULATIVE class, behind
+  interactive requests and bulk runs;
+- budgeted: at most `budget` renders per project per rolling hour;
+- superseded renders are cancelled: each edit bumps a generation counter, so a
+  queued render of an older text is dropped and an in-flight one is discarded
+  before its file is swapped in (`tts_service.synthesize(cancelled=...)`). An
+  explicit `tts_one` of the part also cancels it (`cancel()`).
+
+Only parts that already have audio are re-rendered. Enabled in the `.info`:
+
+    "speculative_tts": true
+    "speculative_tts": {"enabled": true, "budget": 30, "debounce_ms": 2000}
+
+Queue and budget are per process (each uvicorn worker has its own).
+"""
+from __future__ import annotations
+import heapq
+import itertools
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+
+from ..config import settings
+from ..utils import get_project_dir
+from . import audio_store
+from . import csv_store
+from . import dispatcher
+from . import project_catalog
+from . import singleflight
+from . import tracing
+from .project_info import get_config
+from .tts_service import synthesize, project_tts, SynthesisCancelled
+from app.services.project_logger import log
+
+# part -> (text column, entonación column, audio file prefix)
+PARTS = {"pregunta": ("pregunta", "entonacion_p", "p"), "respuesta": ("respuesta", "entonacion_r", "r")}
+
+Key = Tuple[str, int, str]
+
+
+def options(project_id: str) -> Optional[dict]:
+    """Speculative settings of the project ({budget, debounce_ms}) or None if disabled."""
+    raw = get_config(project_id).raw.get("speculative_tts")
+    if isinstance(raw, Mapping):
+        if not raw.get("enabled", True):
+            return None
+    elif not raw:
+        return None
+    else:
+        raw = {}
+    return {
+        "budget": int(raw.get("budget") or settings.SPECULATIVE_TTS_BUDGET),
+        "debounce_ms": int(raw.get("debounce_ms") or settings.SPECULATIVE_TTS_DEBOUNCE_MS),
+    }
+
+
+def enabled(project_id: str) -> bool:
+    return options(project_id) is not None
+
+
+def affected_parts(fields: Iterable[str]) -> list[str]:
+    """Audio parts made stale by a change of `fields`."""
+    fields = set(fields)
+    return [part for part, (text_col, ent_col, _) in PARTS.items() if fields & {text_col, ent_col}]
+
+
+def changed_fields(before: Any, after: Mapping) -> list[str]:
+    """Columns whose value differs between two versions of a record."""
+    return [c for c in after if c != "num" and before.get(c) != after.get(c)]
+
+
+class SpeculativeQueue:
+    def __init__(self, workers: int):
+        self._workers = max(1, workers)
+        self._cond = threading.Condition()
+        self._heap: list[tuple[float, int, Key, int]] = []  # (due, seq, key, generation)
+        self._seq = itertools.count()
+        self._gen: Dict[Key, int] = defaultdict(int)
+        # fingerprint of the last speculative render of each part
+        self._rendered: Dict[Key, str] = {}
+        self._spent: Dict[str, deque] = defaultdict(deque)
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._timer: Optional[threading.Thread] = None
+
+    def schedule(self, project_id: str, num: int, fields: Iterable[str]) -> list[str]:
+        """Queue re-renders of the parts affected by `fields`; returns those parts."""
+        opts = options(project_id)
+        parts = affected_parts(fields) if opts else []
+        if not parts:
+            return []
+        due = time.monotonic() + opts["debounce_ms"] / 1000
+        with self._cond:
+            for part in parts:
+                key = (project_id, int(num), part)
+                # older queued/in-flight renders of this part are now superseded
+                self._gen[key] += 1
+                heapq.heappush(self._heap, (due, next(self._seq), key, self._gen[key]))
+                self._counters["scheduled"] += 1
+            self._start()
+            self._cond.notify()
+        log(project_id, f"speculative scheduled num={num} parts={parts}")
+        return parts
+
+    def cancel(self, project_id: str, num: int, part: str) -> None:
+        """Drop any queued or in-flight speculative render of this part."""
+        with self._cond:
+            key = (project_id, int(num), part)
+            if key in self._gen:
+                self._gen[key] += 1
+
+    def _current(self, key: Key, gen: int) -> bool:
+        with self._cond:
+            return self._gen[key] == gen
+
+    def _start(self) -> None:
+        # called with the condition held
+        if self._timer is None:
+            self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="speculative-tts")
+            self._timer = threading.Thread(target=self._run_timer, name="speculative-timer", daemon=True)
+            self._timer.start()
+
+    def _run_timer(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(None if not self._heap else self._heap[0][0] - time.monotonic())
+                _, _, key, gen = heapq.heappop(self._heap)
+                if self._gen[key] != gen:
+                    self._counters["superseded"] += 1
+                    continue
+            self._pool.submit(self._render, key, gen)
+
+    def _take_budget(self, project_id: str, budget: int) -> bool:
+        now = time.monotonic()
+        with self._cond:
+            spent = self._spent[project_id]
+            while spent and now - spent[0] > 3600:
+                spent.popleft()
+            if len(spent) >= budget:
+                return False
+            spent.append(now)
+            return True
+
+    def _skip(self, key: Key, reason: str) -> None:
+        with self._cond:
+            self._counters[reason] += 1
+        log(key[0], f"speculative skipped num={key[1]} part={key[2]} reason={reason}")
+
+    def _render(self, key: Key, gen: int) -> None:
+        project_id, num, part = key
+        with tracing.job("tts.speculative", project_id, num=num, part=part):
+            self._render_one(key, gen)
+
+    def _render_one(self, key: Key, gen: int) -> None:
+        project_id, num, part = key
+        try:
+            opts = options(project_id)
+            if opts is None:
+                return self._skip(key, "disabled")
+            text_col, ent_col, prefix = PARTS[part]
+            out_file = get_project_dir(project_id) / str(num) / f"{prefix}{num}.mp3"
+            if not audio_store.get_store().exists(audio_store.audio_key(project_id, num, part)):
+                return self._skip(key, "no_audio")
+            rec = csv_store.get_record(project_id, num)
+            if rec is None:
+                return self._skip(key, "no_record")
+            # same voice / instructions as the bulk run
+            provider, voice_q, voice_r = project_tts(project_id)
+            if part == "pregunta":
+                voice = voice_q or provider.default_voice("interviewer")
+            else:
+                voice = voice_r or provider.default_voice("interviewee")
+            text, guidance = rec[text_col], rec[ent_col] or None
+            fp = singleflight.fingerprint("tts", project_id, num, part, text, voice, guidance, provider.model)
+            if self._rendered.get(key) == fp:
+                return self._skip(key, "unchanged")
+            if not self._current(key, gen):
+                return self._skip(key, "superseded")
+            if not self._take_budget(project_id, opts["budget"]):
+                return self._skip(key, "budget")
+            log(project_id, f"speculative render num={num} part={part} voice={voice}")
+            with dispatcher.context(dispatcher.SPECULATIVE, project_id):
+                synthesize(text, out_file, voice, instructions=guidance, cancelled=lambda: not self._current(key, gen),
+                           provider=provider)
+            with self._cond:
+                self._rendered[key] = fp
+                self._counters["rendered"] += 1
+            project_catalog.mark_dirty(project_id)
+            log(project_id, f"speculative rendered num={num} part={part} file={out_file}")
+        except SynthesisCancelled:
+            self._skip(key, "superseded")
+        except Exception as e:
+            with self._cond:
+                self._counters["failed"] += 1
+            log(project_id, f"speculative render failed num={num} part={part}: {e}", level="ERROR")
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._cond:
+            counts = {k: 0 for k in ("scheduled", "rendered", "superseded", "budget", "unchanged", "no_audio", "failed")}
+            counts.update(self._counters)
+            return {
+                "queued": len(self._heap),
+                **counts,
+                "spent_last_hour": {pid: sum(1 for t in d if now - t <= 3600) for pid, d in self._spent.items()},
+            }
+
+
+_queue = SpeculativeQueue(settings.SPECULATIVE_TTS_WORKERS)
+
+
+def schedule(project_id: str, num: int, fields: Iterable[str]) -> list[str]:
+    return _queue.schedule(project_id, num, fields)
+
+
+def cancel(project_id: str, num: int, part: str) -> None:
+    _queue.cancel(project_id, num, part)
+
+
+def stats() -> dict:
+    return _queue.stats()
@@ -0,0 +1,219 @@
+"""Incremental JSON encoding and compression for large exports.
+
+Rows are pulled one at a time from storage, encoded with orjson, grouped into
+~64 KB chunks and, if the client accepts it, compressed on the fly (brotli or
+gzip). Nothing holds more than one chunk, so memory stays flat regardless of
+the project size.
+
+- `ndjson(rows)` / `json_array(rows)` -> iterator of bytes chunks
+- `negotiate_encoding(accept_encoding)` -> "br" | "gzip" | None
+- `compress(chunks, encoding)` -> iterator of compressed chunks
+- `sse(event, data)` -> one Server-Sent Events message
+- `in_thread(events)` -> runs a blocking event iterator in its own thread (async iterator)
+- `BodyReader(chunks, loop)` -> blocking file object over a request body stream
+
+brotli is optional: without the `brotli` package only gzip is offered.
+"""
+from __future__ import annotations
+import asyncio
+import io
+import queue
+import threading
+import zlib
+from typing import AsyncIterator, Callable, Iterable, Iterator, Optional
+
+import orjson
+
+from . import tracing
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _chunked(pieces: Iterable[bytes]) -> Iterator[bytes]:
+    buf: list[bytes] = []
+    size = 0
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield b"".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield b"".join(buf)
+
+
+def ndjson(rows: Iterable[dict]) -> Iterator[bytes]:
+    """One JSON object per line (application/x-ndjson)."""
+    return _chunked(orjson.dumps(row) + b"\n" for row in rows)
+
+
+def json_array(rows: Iterable[dict]) -> Iterator[bytes]:
+    """A regular JSON array, written element by element."""
+
+    def pieces() -> Iterator[bytes]:
+        yield b"["
+        sep = b""
+        for row in rows:
+            yield sep + orjson.dumps(row)
+            sep = b","
+        yield b"]"
+
+    return _chunked(pieces())
+
+
+def available_encodings() -> tuple[str, ...]:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported content-coding from an Accept-Encoding header."""
+    if not accept_encoding:
+        return None
+    supported = available_encodings()
+    best, best_q = None, 0.0
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for p in params.split(";"):
+            k, _, v = p.strip().partition("=")
+            if k == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        candidates = supported if name == "*" else (name,) if name in supported else ()
+        for enc in candidates:
+            # on equal q keep the first supported one (br before gzip)
+            if q > best_q or (q == best_q and best is not None and supported.index(enc) < supported.index(best)):
+                best, best_q = enc, q
+    return best
+
+
+def compress(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    """Compress a stream of chunks with `encoding` ("br" | "gzip"); None passes through."""
+    if encoding is None:
+        yield from chunks
+        return
+    if encoding == "br":
+        c = brotli.Compressor(quality=5)
+        for chunk in chunks:
+            out = c.process(chunk)
+            if out:
+                yield out
+        yield c.finish()
+        return
+    if encoding == "gzip":
+        z = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            out = z.compress(chunk)
+            if out:
+                yield out
+        yield z.flush()
+        return
+    raise ValueError(f"unsupported encoding: {encoding}")
+
+
+def sse(event: str, data: dict) -> bytes:
+    """One `text/event-stream` message (orjson never emits raw newlines)."""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+_END = object()
+# items buffered between the producer thread and the response; the producer waits when it is full
+QUEUE_SIZE = 64
+
+
+async def in_thread(events: Callable[[threading.Event], Iterable], name: str = "stream") -> AsyncIterator:
+    """Iterate `events(stop)` in a dedicated thread and yield its items here.
+
+    Thread/context-bound state (`dispatcher.context`, locks, open streams) lives
+    in that one thread; the current trace span is carried over. Exceptions are
+    re-raised in the consumer. This is an async generator so that a client
+    disconnect, which cancels the response, runs its `finally` right away: it
+    sets `stop`, which `events` should check between items to wind down (the
+    producer also stops at its next item). At most `QUEUE_SIZE` items are
+    buffered; the producer waits for the consumer beyond that.
+    """
+    q: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run() -> None:
+        it = iter(events(stop))
+        try:
+            for item in it:
+                if not put((True, item)):
+                    return
+        except BaseException as e:  # re-raised below
+            put((False, e))
+            return
+        finally:
+            close = getattr(it, "close", None)
+            if close is not None:
+                close()
+        put((True, _END))
+
+    threading.Thread(target=tracing.propagate(run), name=name, daemon=True).start()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            # a cancelled wait leaves q.get() running in the executor: the sentinel below ends it
+            ok, item = await loop.run_in_executor(None, q.get)
+            if not ok:
+                raise item
+            if item is _END:
+                return
+            yield item
+    finally:
+        stop.set()
+        try:
+            q.put_nowait((True, _END))
+        except queue.Full:
+            pass
+
+
+class BodyReader(io.RawIOBase):
+    """Read-only file object over an async stream of bytes (`request.stream()`).
+
+    Used from a worker thread (e.g. `tarfile` in stream mode): every read pulls
+    the next chunk from the event loop, so the body is consumed only as fast as
+    it is processed and never held in memory as a whole.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop):
+        self._chunks = chunks.__aiter__()
+        self._loop = loop
+        self._buf = memoryview(b"")
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            if self._eof:
+                return 0
+            try:
+                chunk = asyncio.run_coroutine_threadsafe(self._chunks.__anext__(), self._loop).result()
+            except StopAsyncIteration:
+                self._eof = True
+                return 0
+            self._buf = memoryview(chunk)
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
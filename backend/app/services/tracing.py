@@ -0,0 +1,490 @@
+"""Lightweight tracing: timed spans for requests, background jobs and the work inside them.
+
+The daily `.log` says *what* happened; a trace says *where the time went*
+(`read_csv` vs the dispatcher wait vs the provider call vs writing the mp3).
+
+- A trace starts at an HTTP request (middleware in `main.py`) or at a
+  background job (`job(...)`); a job started from a request records the
+  request's trace id in its `link` attribute.
+- `span(name, **attrs)` / `@traced(name)` time a block as a child of the
+  current span (contextvar). Outside a trace they only cost a contextvar lookup.
+- FastAPI copies the context into threadpool endpoints; threads and executors
+  started by services must wrap their target with `propagate(fn)`.
+- Finished spans are exported once the trace's project is known:
+  - one JSON line per span in `<project>/.trace/YYYY-MM-DD.jsonl`, written with
+    a single O_APPEND write like the project log;
+  - optionally OTLP/HTTP (JSON) to a local collector (`TRACE_OTLP_ENDPOINT`,
+    e.g. `http://localhost:4318/v1/traces`), batched in a background thread.
+- `list_traces()` / `waterfall()` read them back for `/api/traces`.
+
+Span line:
+
+    {"trace_id", "span_id", "parent_id", "name", "start" (epoch s),
+     "duration_ms", "thread", "attrs", "error"}
+
+Disabled with `TRACING=0`.
+"""
+from __future__ import annotations
+import datetime
+import functools
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional
+
+import orjson
+
+from ..config import settings
+from ..utils import BASE_VOICES_DIR
+
+TRACE_DIR_NAME = ".trace"
+# days of files read back when looking for a trace
+LOOKBACK_DAYS = 7
+
+logger = logging.getLogger(__name__)
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class _Trace:
+    """Spans of one trace; buffered until the project they belong to is known."""
+
+    __slots__ = ("trace_id", "project_id", "pending", "lock")
+
+    def __init__(self, project_id: Optional[str] = None):
+        self.trace_id = _new_id(16)
+        self.project_id = project_id
+        self.pending: list[dict] = []
+        self.lock = threading.Lock()
+
+    def emit(self, rec: dict) -> None:
+        with self.lock:
+            if self.project_id is None:
+                self.pending.append(rec)
+                return
+            project_id = self.project_id
+        _export(project_id, rec)
+
+    def bind(self, project_id: str) -> None:
+        with self.lock:
+            if self.project_id is not None:
+                return
+            self.project_id = project_id
+            pending, self.pending = self.pending, []
+        for rec in pending:
+            _export(project_id, rec)
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attrs", "start", "_t0", "error")
+
+    def __init__(self, trace: _Trace, parent_id: Optional[str], name: str, attrs: dict):
+        self.trace = trace
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.error: Optional[str] = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._t0) * 1000, 3)
+
+    def _finish(self) -> None:
+        self.trace.emit({
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": self.elapsed_ms(),
+            "thread": threading.current_thread().name,
+            "attrs": self.attrs,
+            "error": self.error,
+        })
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+# set by services/profiler.py while a profile is running: called as hook(span, entered)
+# when a thread enters / leaves a span, so the sampler knows which threads work for a trace
+span_hook: Optional[Callable[[Span, bool], None]] = None
+
+# running background jobs: trace_id -> {name, project_id, start, thread}
+_jobs: dict[str, dict] = {}
+_jobs_lock = threading.Lock()
+
+
+def current() -> Optional[Span]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    s = _current.get()
+    return s.trace.trace_id if s is not None else None
+
+
+@contextmanager
+def _activate(s: Span, watch: bool = True) -> Iterator[Span]:
+    token = _current.set(s)
+    hook = span_hook if watch else None
+    if hook is not None:
+        hook(s, True)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        _current.reset(token)
+        if hook is not None:
+            hook(s, False)
+        s._finish()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+    """Time the enclosed block as a child of the current span (no-op outside a trace)."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    with _activate(Span(parent.trace, parent.span_id, name, attrs)) as s:
+        yield s
+
+
+def traced(name: str) -> Callable:
+    """Decorator form of `span(name)`."""
+
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return deco
+
+
+@contextmanager
+def trace(name: str, project_id: Optional[str] = None, kind: str = "request", **attrs: Any) -> Iterator[Optional[Span]]:
+    """Start a new trace whose root span is `name`.
+
+    If another trace is active (a job started from a request), its id is kept in
+    the `link` attribute so the request's waterfall can point to the job.
+    """
+    if not settings.TRACING:
+        yield None
+        return
+    outer = _current.get()
+    root_attrs = {"kind": kind, **attrs}
+    if outer is not None:
+        root_attrs["link"] = outer.trace.trace_id
+    root = Span(_Trace(project_id), None, name, root_attrs)
+    if kind != "job":
+        # the event loop thread interleaves many requests: only their child spans mark threads
+        with _activate(root, watch=False) as s:
+            yield s
+        return
+    with _jobs_lock:
+        _jobs[root.trace.trace_id] = {"name": name, "project_id": project_id, "start": root.start, "thread": threading.get_ident()}
+    try:
+        with _activate(root) as s:
+            yield s
+    finally:
+        with _jobs_lock:
+            _jobs.pop(root.trace.trace_id, None)
+
+
+def job(name: str, project_id: str, **attrs: Any):
+    """Root span of a background job (bulk TTS, LLM, pipeline, speculative render)."""
+    return trace(name, project_id, kind="job", **attrs)
+
+
+def active_jobs(project_id: Optional[str] = None) -> dict[str, dict]:
+    """Running job traces (of `project_id` if given): trace_id -> {name, project_id, start, thread}."""
+    with _jobs_lock:
+        return {t: dict(j) for t, j in _jobs.items() if project_id is None or j["project_id"] == project_id}
+
+
+def bind_project(project_id: str) -> None:
+    """Attach the current trace to `project_id` (spans are exported to its folder from now on)."""
+    s = _current.get()
+    if s is not None:
+        s.trace.bind(project_id)
+
+
+def propagate(fn: Callable) -> Callable:
+    """Wrap a thread/executor target so it runs inside the caller's current span."""
+    parent = _current.get()
+    if parent is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        token = _current.set(parent)
+        hook = span_hook
+        if hook is not None:
+            hook(parent, True)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if hook is not None:
+                hook(parent, False)
+            _current.reset(token)
+
+    return run
+
+
+# ---------------------------------------------------------------------------
+# exporters
+
+
+def _trace_dir(project_id: str):
+    return BASE_VOICES_DIR / project_id / TRACE_DIR_NAME
+
+
+def _export(project_id: str, rec: dict) -> None:
+    if _otlp is not None:
+        _otlp.put(project_id, rec)
+    day = datetime.datetime.fromtimestamp(rec["start"], datetime.timezone.utc).strftime("%Y-%m-%d")
+    d = _trace_dir(project_id)
+    try:
+        try:
+            fd = os.open(d / f"{day}.jsonl", os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        except FileNotFoundError:
+            # never (re)create a project folder: unknown ids and just-deleted projects are dropped
+            if not d.parent.is_dir():
+                return
+            d.mkdir(exist_ok=True)
+            fd = os.open(d / f"{day}.jsonl", os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, orjson.dumps(rec, default=str) + b"\n")
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def _otlp_value(v: Any) -> dict:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def to_otlp(spans: list[tuple[str, dict]]) -> dict:
+    """OTLP/HTTP JSON body (ExportTraceServiceRequest) for (project_id, span) pairs."""
+    out = []
+    for project_id, rec in spans:
+        start_ns = int(rec["start"] * 1e9)
+        attrs = {"project.id": project_id, "thread.name": rec["thread"], **rec["attrs"]}
+        span = {
+            "traceId": rec["trace_id"],
+            "spanId": rec["span_id"],
+            "parentSpanId": rec["parent_id"] or "",
+            "name": rec["name"],
+            # SERVER for requests, INTERNAL otherwise
+            "kind": 2 if rec["attrs"].get("kind") == "request" else 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(rec["duration_ms"] * 1e6)),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items() if v is not None],
+            "status": {"code": 2, "message": rec["error"]} if rec["error"] else {"code": 0},
+        }
+        out.append(span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "entona-backend"}}]},
+            "scopeSpans": [{"scope": {"name": "app.services.tracing"}, "spans": out}],
+        }]
+    }
+
+
+class _OtlpExporter:
+    """Batches spans and POSTs them to a collector; drops them if the queue fills up."""
+
+    BATCH = 512
+    INTERVAL = 1.0
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self._q: queue.Queue = queue.Queue(maxsize=10_000)
+        self.dropped = 0
+        threading.Thread(target=self._run, name="trace-otlp", daemon=True).start()
+
+    def put(self, project_id: str, rec: dict) -> None:
+        try:
+            self._q.put_nowait((project_id, rec))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        import httpx
+
+        with httpx.Client(timeout=5.0) as client:
+            while True:
+                batch = [self._q.get()]
+                deadline = time.monotonic() + self.INTERVAL
+                while len(batch) < self.BATCH:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(self._q.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                try:
+                    client.post(self.endpoint, content=orjson.dumps(to_otlp(batch), default=str),
+                                headers={"Content-Type": "application/json"})
+                except Exception as e:
+                    self.dropped += len(batch)
+                    logger.warning("OTLP export failed (%d spans dropped): %s", len(batch), e)
+
+
+_otlp = _OtlpExporter(settings.TRACE_OTLP_ENDPOINT) if settings.TRACING and settings.TRACE_OTLP_ENDPOINT else None
+
+
+# ---------------------------------------------------------------------------
+# reading traces back
+
+
+def _files(project_id: str, date: Optional[datetime.date] = None, days: int = LOOKBACK_DAYS) -> list:
+    """Trace files of the project, most recent first (only `date` if given)."""
+    d = _trace_dir(project_id)
+    if not d.is_dir():
+        return []
+    if date is not None:
+        p = d / f"{date.isoformat()}.jsonl"
+        return [p] if p.exists() else []
+    return sorted((p for p in d.iterdir() if p.suffix == ".jsonl"), reverse=True)[:days]
+
+
+def _lines(path, needle: Optional[bytes] = None) -> Iterator[dict]:
+    try:
+        with open(path, "rb") as fh:
+            for line in fh:
+                if needle is not None and needle not in line:
+                    continue
+                try:
+                    yield orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue  # a line cut by a crash
+    except OSError:
+        return
+
+
+def list_traces(project_id: str, limit: int = 50, date: Optional[datetime.date] = None,
+                kind: Optional[str] = None, min_ms: float = 0.0) -> list[dict]:
+    """Root spans (requests and jobs) of the project, most recent first."""
+    roots: list[dict] = []
+    for path in _files(project_id, date):
+        for rec in _lines(path, b'"parent_id":null'):
+            if kind and rec["attrs"].get("kind") != kind:
+                continue
+            if rec["duration_ms"] < min_ms:
+                continue
+            roots.append(rec)
+        if len(roots) >= limit and date is None:
+            break
+    roots.sort(key=lambda r: r["start"], reverse=True)
+    return [
+        {
+            "trace_id": r["trace_id"],
+            "name": r["name"],
+            "kind": r["attrs"].get("kind"),
+            "start": r["start"],
+            "duration_ms": r["duration_ms"],
+            "status": r["attrs"].get("status"),
+            "link": r["attrs"].get("link"),
+            "error": r["error"],
+        }
+        for r in roots[:limit]
+    ]
+
+
+def waterfall(project_id: str, trace_id: str, min_ms: float = 0.0) -> Optional[dict]:
+    """All spans of a trace laid out for a waterfall view, or None if not found.
+
+    - `spans`: in start order with `depth` and `offset_ms` from the root;
+      spans shorter than `min_ms` are left out (their time still counts in the summary).
+    - `summary`: count / total / max per span name, slowest first.
+    - `linked`: root spans of jobs started from this trace.
+    """
+    needle = trace_id.encode()
+    spans: list[dict] = []
+    linked: list[dict] = []
+    for path in _files(project_id):
+        for rec in _lines(path, needle):
+            if rec["trace_id"] == trace_id:
+                spans.append(rec)
+            elif rec["parent_id"] is None and rec["attrs"].get("link") == trace_id:
+                linked.append(rec)
+    if not spans:
+        return None
+    spans.sort(key=lambda r: r["start"])
+    by_id = {r["span_id"]: r for r in spans}
+    root = next((r for r in spans if r["parent_id"] is None), spans[0])
+    t0 = root["start"]
+
+    def depth(rec: dict) -> int:
+        n = 0
+        while rec["parent_id"] in by_id and n < 64:
+            rec = by_id[rec["parent_id"]]
+            n += 1
+        return n
+
+    summary: dict = defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+    for r in spans:
+        s = summary[r["name"]]
+        s["count"] += 1
+        s["total_ms"] += r["duration_ms"]
+        s["max_ms"] = max(s["max_ms"], r["duration_ms"])
+    return {
+        "trace_id": trace_id,
+        "name": root["name"],
+        "start": t0,
+        "duration_ms": root["duration_ms"],
+        "link": root["attrs"].get("link"),
+        "span_count": len(spans),
+        "spans": [
+            {
+                "span_id": r["span_id"],
+                "parent_id": r["parent_id"],
+                "name": r["name"],
+                "depth": depth(r),
+                "offset_ms": round((r["start"] - t0) * 1000, 3),
+                "duration_ms": r["duration_ms"],
+                "thread": r["thread"],
+                "attrs": r["attrs"],
+                "error": r["error"],
+            }
+            for r in spans
+            if r is root or r["duration_ms"] >= min_ms
+        ],
+        "summary": sorted(
+            ({"name": k, **{f: round(v, 3) if isinstance(v, float) else v for f, v in s.items()}} for k, s in summary.items()),
+            key=lambda s: s["total_ms"],
+            reverse=True,
+        ),
+        "linked": [
+            {"trace_id": r["trace_id"], "name": r["name"], "start": r["start"], "duration_ms": r["duration_ms"]}
+            for r in sorted(linked, key=lambda r: r["start"])
+        ],
+    }
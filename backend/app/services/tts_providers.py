@@ -0,0 +1,122 @@
+"""TTS providers behind `tts_service.synthesize`.
+
+A provider turns (text, voice, instructions) into a stream of mp3 chunks:
+
+- `openai`: the `audio.speech` API (`OPENAI_MODEL_TTS`), streamed as it arrives.
+- `local`: offline CPU synthesis in a warm process pool (see `local_tts`), for
+  drafts and proofreading without API cost.
+
+The provider is chosen per project in the `.info` (`"voices": {"provider": "local"}`)
+or per request (`provider` in the body), falling back to `TTS_PROVIDER`.
+Each provider has its own dispatcher pool (`slot`), so local drafts do not
+queue behind API calls and vice versa.
+"""
+from __future__ import annotations
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from openai import OpenAI
+
+from ..config import settings
+from . import local_tts
+from . import tracing
+
+PROVIDERS = ("openai", "local")
+
+
+class TTSProvider:
+    name = ""
+    # dispatcher pool the provider's calls are queued in
+    slot = "tts"
+
+    @property
+    def model(self) -> str:
+        """Model identifier, part of the singleflight fingerprint of a render."""
+        raise NotImplementedError
+
+    def default_voice(self, role: str) -> str:
+        """Voice for "interviewer" / "interviewee" when none is configured."""
+        raise NotImplementedError
+
+    def check_voice(self, voice: str) -> None:
+        """ValueError if `voice` cannot be used with this provider."""
+
+    @contextmanager
+    def stream(self, text: str, voice: str, instructions: str | None = None) -> Iterator[Iterator[bytes]]:
+        """Start a render; yields an iterator over the mp3 chunks."""
+        raise NotImplementedError
+        yield
+
+
+class OpenAIProvider(TTSProvider):
+    name = "openai"
+    slot = "tts"
+
+    def __init__(self) -> None:
+        self._client: OpenAI | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> str:
+        return settings.OPENAI_MODEL_TTS
+
+    def default_voice(self, role: str) -> str:
+        return settings.DEFAULT_VOICE_Q if role == "interviewer" else settings.DEFAULT_VOICE_R
+
+    def client(self) -> OpenAI:
+        # one client (and its connection pool) for the process: building it costs ~40 ms
+        if self._client is None:
+            with self._lock, tracing.span("tts.client"):
+                if self._client is None:
+                    if settings.OPENAI_API_BASE:
+                        self._client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_API_BASE)
+                    else:
+                        self._client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        return self._client
+
+    @contextmanager
+    def stream(self, text: str, voice: str, instructions: str | None = None) -> Iterator[Iterator[bytes]]:
+        # Construir kwargs para evitar pasar instructions cuando sea None
+        kwargs = {
+            "model": self.model,
+            "voice": voice,
+            "input": text,
+            "response_format": "mp3",
+        }
+        # Incluir la clave `instructions` incluso si es una cadena vacía.
+        if instructions is not None:
+            kwargs["instructions"] = instructions
+        with self.client().audio.speech.with_streaming_response.create(**kwargs) as resp:
+            yield resp.iter_bytes()
+
+
+class LocalProvider(TTSProvider):
+    name = "local"
+    slot = "tts_local"
+
+    @property
+    def model(self) -> str:
+        return f"local:{local_tts.engine()}"
+
+    def default_voice(self, role: str) -> str:
+        return local_tts.default_voice(role)
+
+    def check_voice(self, voice: str) -> None:
+        local_tts.check_voice(voice)
+
+    @contextmanager
+    def stream(self, text: str, voice: str, instructions: str | None = None) -> Iterator[Iterator[bytes]]:
+        # the local engines have no style prompt: `instructions` is ignored
+        yield iter((local_tts.render(text, voice),))
+
+
+_providers: Dict[str, TTSProvider] = {"openai": OpenAIProvider(), "local": LocalProvider()}
+
+
+def get(name: str | None = None) -> TTSProvider:
+    """Provider by name (`TTS_PROVIDER` when None); ValueError if unknown."""
+    key = (name or settings.TTS_PROVIDER or "openai").lower()
+    if key not in _providers:
+        raise ValueError(f"Proveedor TTS desconocido: {name} (opciones: {', '.join(PROVIDERS)})")
+    return _providers[key]
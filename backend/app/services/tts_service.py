@@ -1,54 +1,94 @@
 from __future__ import annotations
 
 from pathlib import Path
+from typing import Callable, Mapping
 from openai import OpenAI
 import logging
 from ..config import settings
 from ..utils import get_project_dir
+from . import project_catalog
+from . import project_info
+from . import dispatcher
+from . import audio_meta
+from . import audio_store
+from . import tracing
+from . import run_control
+from . import tts_providers
+from .tts_providers import TTSProvider
 from app.services.project_logger import log
 
 MALE_DEFAULT = lambda: settings.DEFAULT_VOICE_Q  # onyx
 FEMALE_DEFAULT = lambda: settings.DEFAULT_VOICE_R  # sage
 
 def get_client() -> OpenAI:
-    if settings.OPENAI_API_BASE:
-        return OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_API_BASE)
-    return OpenAI(api_key=settings.OPENAI_API_KEY)
+    return tts_providers.get("openai").client()
 
-def synthesize(input_text: str, out_path: Path, voice: str, instructions: str | None = None) -> Path:
+class SynthesisCancelled(Exception):
+    """A render was superseded before its file was written (see `synthesize(cancelled=...)`)."""
+
+
+def synthesize(input_text: str, out_path: Path, voice: str, instructions: str | None = None,
+               cancelled: Callable[[], bool] | None = None, provider: TTSProvider | None = None) -> Path:
     """Synthesize speech.
 
     - input_text: el texto que se envía como `input` al SDK.
-    - instructions: si se proporciona, se envía como `instructions` separado.
+    - out_path: ruta bajo `BASE_VOICES_DIR`; el mp3 se guarda en el audio store
+      configurado con esa misma clave (`<project>/<num>/<p|r><num>.mp3`).
+    - instructions: si se proporciona, se envía como `instructions` separado
+      (el motor local lo ignora).
+    - cancelled: si se proporciona, se comprueba al obtener el slot del proveedor,
+      mientras llega el audio y antes de sustituir el fichero; si devuelve True
+      no se escribe nada y se lanza `SynthesisCancelled`.
+    - provider: motor TTS (`tts_providers`); por defecto `TTS_PROVIDER`.
     """
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    client = get_client()
+    provider = provider or tts_providers.get()
 
-    # Construir kwargs para evitar pasar instructions cuando sea None
-    kwargs = {
-        "model": settings.OPENAI_MODEL_TTS,
-        "voice": voice,
-        "input": input_text,
-        "response_format": "mp3",
-    }
-    # Incluir la clave `instructions` incluso si es una cadena vacía.
-    if instructions is not None:
-        kwargs["instructions"] = instructions
+    # streamed into the audio store (temp file + rename on disk, multipart upload
+    # in S3): a player (or another worker) never reads a truncated mp3 while it
+    # is being rewritten, and a cancelled render leaves the previous one in place
+    key = audio_store.key_for(out_path)
+    data = bytearray()
+    with dispatcher.slot(provider.slot):
+        if cancelled is not None and cancelled():
+            raise SynthesisCancelled(str(out_path))
+        with tracing.span("tts.provider", provider=provider.name, voice=voice, chars=len(input_text or "")) as sp:
+            with provider.stream(input_text, voice, instructions) as chunks:
+                if sp is not None:
+                    # time to the first bytes (response headers, or the whole render locally)
+                    sp.set(ttfb_ms=sp.elapsed_ms())
+                with audio_store.get_store().writer(key) as blob:
+                    for chunk in chunks:
+                        if cancelled is not None and cancelled():
+                            raise SynthesisCancelled(str(out_path))
+                        blob.write(chunk)
+                        data += chunk
+                    if cancelled is not None and cancelled():
+                        raise SynthesisCancelled(str(out_path))
+            if sp is not None:
+                sp.set(bytes=len(data))
 
-    # Loggear los kwargs que vamos a pasar al cliente OpenAI para debugging.
-    # Note: synthesize may be called outside a project context; callers should log with project_id when available.
-    try:
-        # truncar el campo 'input' para no loggear textos enormes
-        safe_kwargs = {k: (v if k != "input" else (v[:200] + "...") if v and len(v) > 200 else v) for k, v in kwargs.items()}
-    except Exception:
-        safe_kwargs = {k: type(v).__name__ for k, v in kwargs.items()}
+    # duration / size / peaks for the project's audio index (read from the frame headers)
+    audio_meta.update(key, bytes(data), blob.version, provider=provider.name)
+    return out_path
 
-    # OpenAI Audio TTS – MP3
-    # The actual network call is left as-is; callers can capture start/end via project_logger
-    with client.audio.speech.with_streaming_response.create(**kwargs) as resp:
-        resp.stream_to_file(str(out_path))
+def project_tts(project_id: str, provider: str | None = None) -> tuple[TTSProvider, str | None, str | None]:
+    """Provider and voices (interviewer, interviewee) for a project's renders.
 
-    return out_path
+    `provider` (per request) wins over the project's `.info`
+    (`"voices": {"provider": "local", "local": {"interviewer": ..., "interviewee": ...}}`),
+    which wins over `TTS_PROVIDER`. OpenAI voices are the per-role `voice` of the
+    normalized `.info` (`"interviewer": {"voice": ...}`, or legacy `"voices": {"interviewer": ...}`).
+    Raises ValueError for an unknown provider.
+    """
+    cfg = project_info.get_config(project_id)
+    voices = cfg.raw.get("voices") if isinstance(cfg.raw.get("voices"), Mapping) else {}
+    tts = tts_providers.get(provider or voices.get("provider"))
+    if tts.name == "openai":
+        voice_q, voice_r = cfg.info["interviewer"].get("voice"), cfg.info["interviewee"].get("voice")
+    else:
+        own = voices.get(tts.name) if isinstance(voices.get(tts.name), Mapping) else {}
+        voice_q, voice_r = own.get("interviewer"), own.get("interviewee")
+    return tts, voice_q, voice_r
 
 def synthesize_block(
     project_id: str,
@@ -59,23 +99,38 @@ def synthesize_block(
     entonacion_r: str | None = None,
     voice_q: str | None = None,
     voice_r: str | None = None,
+    provider: TTSProvider | None = None,
+    run: run_control.Run | None = None,
 ) -> dict:
     """Sintetiza pregunta y respuesta por separado, pasando las entonaciones como `instructions`.
 
     entonacion_p / entonacion_r: se usan como `instructions` si están presentes.
+    provider: motor TTS (ver `project_tts`); sin voces se usan las del motor.
+    run: ejecución masiva en curso; si se cancela se aborta la parte en vuelo
+    (conservando el audio anterior) y se lanza `run_control.RunCancelled`.
     """
-    voice_q = voice_q or MALE_DEFAULT()
-    voice_r = voice_r or FEMALE_DEFAULT()
+    provider = provider or tts_providers.get()
+    voice_q = voice_q or provider.default_voice("interviewer")
+    voice_r = voice_r or provider.default_voice("interviewee")
 
-    log(project_id, f"synthesize_block called num={num} voice_q={voice_q} voice_r={voice_r}")
+    log(project_id, f"synthesize_block called num={num} provider={provider.name} voice_q={voice_q} voice_r={voice_r}")
     d = get_project_dir(project_id) / str(num)
     p_out = d / f"p{num}.mp3"
     r_out = d / f"r{num}.mp3"
 
+    cancelled = run.cancelled if run is not None else None
     try:
-        synthesize(pregunta, p_out, voice_q, instructions=(entonacion_p or None))
-        synthesize(respuesta, r_out, voice_r, instructions=(entonacion_r or None))
+        synthesize(pregunta, p_out, voice_q, instructions=(entonacion_p or None), cancelled=cancelled, provider=provider)
+        if run is not None:
+            # between the two parts: a pause waits here, a cancel keeps the new pregunta
+            run.checkpoint()
+        synthesize(respuesta, r_out, voice_r, instructions=(entonacion_r or None), cancelled=cancelled, provider=provider)
         log(project_id, f"synthesize_block completed for num={num} outputs p={p_out} r={r_out}")
+        project_catalog.mark_dirty(project_id)
+    except (SynthesisCancelled, run_control.RunCancelled) as e:
+        log(project_id, f"synthesize_block cancelled for num={num}")
+        project_catalog.mark_dirty(project_id)
+        raise run_control.RunCancelled(run.id) from e
     except Exception as e:
         log(project_id, f"synthesize_block failed for num={num}: {e}", level="ERROR")
         raise
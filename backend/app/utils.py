@@ -1,9 +1,11 @@
 
 from pathlib import Path
+import os
 import ulid
 import json
 
-BASE_VOICES_DIR = Path(__file__).parent / "static" / "voices"
+# VOICES_DIR permite apuntar a otro volumen (p.ej. un directorio temporal en benchmarks)
+BASE_VOICES_DIR = Path(os.getenv("VOICES_DIR") or Path(__file__).parent / "static" / "voices")
 BASE_VOICES_DIR.mkdir(parents=True, exist_ok=True)
 
 def get_project_dir(project_id: str) -> Path:
@@ -23,13 +25,28 @@ def create_project(project_id: str = None) -> str:
 	d = get_project_dir(project_id)
 	info_path = get_info_path(project_id)
 	# If no .info exists, create a minimal one. Do not overwrite existing.
+	# Written to a temp file and hard-linked into place: the link fails if
+	# another worker created the .info meanwhile, and readers never see it half written.
 	if not info_path.exists():
+		tmp = info_path.with_name(f".info.{os.getpid()}.{ulid.new()}.tmp")
 		try:
-			with open(info_path, "w", encoding="utf-8") as f:
+			with open(tmp, "w", encoding="utf-8") as f:
 				json.dump({"title": "", "desc": ""}, f, ensure_ascii=False, indent=2)
+			os.link(tmp, info_path)
 		except Exception:
-			# best-effort; ignore write failures here
+			# best-effort; ignore write failures here (incl. FileExistsError)
 			pass
+		finally:
+			try:
+				os.unlink(tmp)
+			except OSError:
+				pass
+	# keep the project catalog in sync (best-effort)
+	try:
+		from app.services import project_catalog
+		project_catalog.refresh_project(project_id)
+	except Exception:
+		pass
 	# log creation attempt in project logger
 	try:
 		from app.services.project_logger import log
@@ -38,20 +55,8 @@ def create_project(project_id: str = None) -> str:
 		pass
 	return project_id
 
-def list_projects():
-	projects = []
-	for p in BASE_VOICES_DIR.iterdir():
-		if p.is_dir():
-			info_path = p / f"{p.name}.info"
-			title = p.name
-			desc = ""
-			if info_path.exists():
-				try:
-					with open(info_path) as f:
-						data = json.load(f)
-						title = data.get("title") or p.name
-						desc = data.get("desc") or ""
-				except Exception:
-					pass
-			projects.append({"id": p.name, "title": title, "desc": desc})
+def list_projects(**kwargs):
+	"""Return the projects from the catalog index (see services.project_catalog)."""
+	from app.services import project_catalog
+	projects, _total = project_catalog.list_projects(**kwargs)
 	return projects
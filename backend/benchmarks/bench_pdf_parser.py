@@ -0,0 +1,103 @@
+"""Benchmark del parser de transcripciones sobre textos sintéticos de varios MB.
+
+Uso (desde `backend/`):
+
+    python -m benchmarks.bench_pdf_parser --sizes 1 2 4 8
+
+Imprime, para cada tamaño, el tiempo del parser de una pasada y el del regex
+anterior (`PR_BLOCK_RE`) como referencia. Con escalado lineal la columna
+`us/KB` se mantiene estable al duplicar el tamaño.
+
+Con `--malformed-every 1` (ninguna pregunta tiene respuesta) el regex anterior
+vuelve a recorrer el resto del documento en cada bloque y crece de forma
+cuadrática; el parser nuevo se mantiene lineal.
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import re
+import time
+
+from app.services import pdf_parser
+
+# Regex usado antes de la máquina de estados, solo para comparar.
+LEGACY_RE = re.compile(
+    r"Pregunta:\s*(.*?)\s*Respuesta:\s*(.*?)(?=(?:\n\s*Pregunta:)|\Z)",
+    re.DOTALL | re.IGNORECASE,
+)
+
+WORDS = (
+    "el la de que y en un una por con para como pero su sus lo al más esto planeta especie "
+    "verdad tiempo años nosotros ustedes respuesta pregunta historia ciencia bajo tierra"
+).split()
+
+
+def synthetic_transcript(size_mb: float, seed: int = 0, malformed_every: int = 50) -> str:
+    """Genera ~size_mb MB de bloques Pregunta/Respuesta con saltos de página y ruido."""
+    rnd = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    parts: list[str] = []
+    n = 0
+    total = 0
+    while total < target:
+        n += 1
+        q = " ".join(rnd.choices(WORDS, k=rnd.randint(5, 30)))
+        r = "\n".join(" ".join(rnd.choices(WORDS, k=rnd.randint(8, 16))) for _ in range(rnd.randint(1, 12)))
+        chunk = f"Pregunta: {q}?\nRespuesta: {r}.\n"
+        if n % malformed_every == 0:
+            chunk = f"Pregunta: {q}?\n"  # bloque sin respuesta
+        if n % 7 == 0:
+            chunk += pdf_parser.PAGE_BREAK
+        parts.append(chunk)
+        total += len(chunk)
+    return "".join(parts)
+
+
+def legacy_pairs(text: str) -> int:
+    return sum(1 for _ in LEGACY_RE.finditer(text))
+
+
+def timed(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=float, nargs="+", default=[1, 2, 4, 8], help="tamaños en MB")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--malformed-every", type=int, default=50, help="un bloque sin respuesta cada N (1 = todos)")
+    ap.add_argument("--no-legacy", action="store_true", help="no medir el regex anterior")
+    ap.add_argument("--json", action="store_true", help="salida JSON (una línea por tamaño)")
+    args = ap.parse_args()
+
+    if not args.json:
+        print(f"{'MB':>6} {'blocks':>8} {'issues':>7} {'parser s':>9} {'us/KB':>7} {'legacy s':>9}")
+    for mb in args.sizes:
+        text = synthetic_transcript(mb, malformed_every=args.malformed_every)
+        result = pdf_parser.parse_transcript(text)
+        t_new = timed(pdf_parser.parse_transcript, text, repeat=args.repeat)
+        t_old = None if args.no_legacy else timed(legacy_pairs, text, repeat=args.repeat)
+        kb = len(text) / 1024
+        row = {
+            "mb": mb,
+            "blocks": len(result.blocks),
+            "issues": len(result.issues),
+            "parser_s": round(t_new, 4),
+            "us_per_kb": round(t_new / kb * 1e6, 2),
+            "legacy_s": None if t_old is None else round(t_old, 4),
+        }
+        if args.json:
+            print(json.dumps(row))
+        else:
+            legacy = "-" if t_old is None else f"{t_old:9.3f}"
+            print(f"{mb:6.2f} {row['blocks']:8d} {row['issues']:7d} {t_new:9.3f} {row['us_per_kb']:7.1f} {legacy:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""Local stand-in for the OpenAI endpoints used by the backend.
+
+Implements just enough of the API for `client.audio.speech` and
+`client.responses.parse`, with configurable latency, jitter, injected
+429/500 errors and payload sizes, so throughput can be measured without
+spending API credits:
+
+    python -m benchmarks.fake_openai --port 8999 --latency-ms 80 --jitter-ms 40 --error-429 0.02
+
+and point the backend at it with `OPENAI_API_BASE=http://127.0.0.1:8999/v1`.
+
+- `POST /v1/audio/speech` returns `--audio-kb` KB of valid (silent) MP3 frames.
+- `POST /v1/responses` returns a structured output echoing the PREGUNTA/RESPUESTA
+  of the request, so records keep meaningful text after a bulk run.
+  Generation takes `--token-ms` per `--stream-chunk-chars` characters of output
+  on top of the base latency (time to first token). With `"stream": true` the
+  output is sent as Responses API SSE events, one `response.output_text.delta`
+  per chunk as it is "generated".
+- `GET /_stats` returns request/error counters and input/cached token totals as JSON.
+
+`/v1/responses` also simulates the provider prompt cache: the longest prefix of
+the input already seen (in 128-token blocks, ~4 chars per token) is reported as
+`usage.input_tokens_details.cached_tokens`, from `--cache-min-tokens` on
+(`--cache-min-tokens 0` disables it).
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, mono, no padding: 417 bytes / 26.1 ms
+MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0xC4]) + bytes(413)
+
+_ROW_RE = re.compile(r"PREGUNTA:\s*(.*?)\s*RESPUESTA:\s*(.*)", re.DOTALL)
+
+CHARS_PER_TOKEN = 4
+CACHE_BLOCK_TOKENS = 128
+
+
+class FakeConfig:
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 0, error_429: float = 0.0, error_500: float = 0.0,
+                 audio_kb: float = 32, llm_extra_chars: int = 0, cache_min_tokens: int = 1024,
+                 token_ms: float = 0, stream_chunk_chars: int = 8, seed: int | None = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_429 = error_429
+        self.error_500 = error_500
+        self.audio_kb = audio_kb
+        self.llm_extra_chars = llm_extra_chars
+        self.cache_min_tokens = cache_min_tokens
+        self.token_ms = token_ms
+        self.stream_chunk_chars = max(1, stream_chunk_chars)
+        self.prefixes: set[str] = set()
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"speech": 0, "responses": 0, "429": 0, "500": 0, "input_tokens": 0, "cached_tokens": 0}
+
+    def bump(self, key: str) -> None:
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def cached_tokens(self, text: str) -> int:
+        """Tokens of the longest already-seen prefix of `text` (whole blocks), then remember it."""
+        if not self.cache_min_tokens:
+            return 0
+        block = CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+        h = hashlib.sha256()
+        digests = []
+        for i in range(len(text) // block):
+            h.update(text[i * block:(i + 1) * block].encode("utf-8"))
+            digests.append(h.hexdigest())
+        with self.lock:
+            hits = 0
+            for d in digests:
+                if d not in self.prefixes:
+                    break
+                hits += 1
+            self.prefixes.update(digests)
+        cached = hits * CACHE_BLOCK_TOKENS
+        return cached if cached >= self.cache_min_tokens else 0
+
+    def count_usage(self, input_tokens: int, cached_tokens: int) -> None:
+        with self.lock:
+            self.stats["input_tokens"] += input_tokens
+            self.stats["cached_tokens"] += cached_tokens
+
+    def draw(self) -> tuple[float, str | None]:
+        """Return (delay seconds, injected error or None) for one request."""
+        with self.lock:
+            delay = max(0.0, self.latency_ms + self.rnd.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            x = self.rnd.random()
+        if x < self.error_429:
+            return delay, "429"
+        if x < self.error_429 + self.error_500:
+            return delay, "500"
+        return delay, None
+
+
+def _user_text(body: dict, roles: bool = False) -> str:
+    items = body.get("input")
+    if isinstance(items, str):
+        return items
+    parts = []
+    for item in items or []:
+        if roles:
+            parts.append(f"<{item.get('role', '')}>")
+        content = item.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(c.get("text", "") for c in content if isinstance(c, dict))
+    return "\n".join(parts)
+
+
+def _llm_output(body: dict, extra_chars: int) -> dict:
+    text = _user_text(body)
+    m = _ROW_RE.search(text)
+    q, r = (m.group(1), m.group(2)) if m else ("", "")
+    pad = ("x" * extra_chars) if extra_chars else ""
+    return {
+        "pregunta_limpia": " ".join(q.split()),
+        "respuesta_limpia": " ".join(r.split()),
+        "entonacion_p": "Tono neutro, ritmo pausado." + pad,
+        "entonacion_r": "Tono sereno, pausas breves." + pad,
+    }
+
+
+def _response_object(body: dict, payload: dict, cfg: FakeConfig) -> dict:
+    text = json.dumps(payload, ensure_ascii=False)
+    # prompt as the provider sees it: instructions, then each message with its role
+    prompt = (body.get("instructions") or "") + _user_text(body, roles=True)
+    in_tokens = max(1, len(prompt) // CHARS_PER_TOKEN)
+    cached = min(in_tokens, cfg.cached_tokens(prompt))
+    cfg.count_usage(in_tokens, cached)
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model", "fake"),
+        "status": "completed",
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "output": [
+            {
+                "type": "message",
+                "id": f"msg_{uuid.uuid4().hex}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }
+        ],
+        "usage": {
+            "input_tokens": in_tokens,
+            "input_tokens_details": {"cached_tokens": cached},
+            "output_tokens": max(1, len(text) // 4),
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": in_tokens + max(1, len(text) // 4),
+        },
+    }
+
+
+def _stream_events(response: dict, chunk_chars: int):
+    """Responses API stream for a finished `response` object: (event type, payload) pairs."""
+    message = response["output"][0]
+    text = message["content"][0]["text"]
+    ids = {"item_id": message["id"], "output_index": 0, "content_index": 0}
+    yield "response.created", {"response": {**response, "status": "in_progress", "output": [], "usage": None}}
+    yield "response.output_item.added", {"output_index": 0, "item": {**message, "status": "in_progress", "content": []}}
+    yield "response.content_part.added", {**ids, "part": {"type": "output_text", "text": "", "annotations": []}}
+    for i in range(0, len(text), chunk_chars):
+        yield "response.output_text.delta", {**ids, "delta": text[i:i + chunk_chars], "logprobs": []}
+    yield "response.output_text.done", {**ids, "text": text, "logprobs": []}
+    yield "response.content_part.done", {**ids, "part": message["content"][0]}
+    yield "response.output_item.done", {"output_index": 0, "item": message}
+    yield "response.completed", {"response": response}
+
+
+def make_handler(cfg: FakeConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):  # silence per-request logging
+            pass
+
+        def _json(self, status: int, obj: dict, headers: dict | None = None) -> None:
+            data = json.dumps(obj).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/_stats":
+                with cfg.lock:
+                    return self._json(200, dict(cfg.stats))
+            self._json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            path = self.path.split("?")[0].rstrip("/")
+            if path.endswith("/audio/speech"):
+                kind = "speech"
+            elif path.endswith("/responses"):
+                kind = "responses"
+            else:
+                return self._json(404, {"error": {"message": f"unsupported path {self.path}"}})
+            cfg.bump(kind)
+            delay, error = cfg.draw()
+            time.sleep(delay)
+            if error:
+                cfg.bump(error)
+                return self._json(
+                    int(error),
+                    {"error": {"message": f"injected {error}", "type": "fake_error", "code": error}},
+                    headers={"retry-after-ms": "20"},
+                )
+            if kind == "speech":
+                frames = max(1, int(cfg.audio_kb * 1024 // len(MP3_FRAME)))
+                data = MP3_FRAME * frames
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/mpeg")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            response = _response_object(body, _llm_output(body, cfg.llm_extra_chars), cfg)
+            if body.get("stream"):
+                return self._stream(response)
+            text = response["output"][0]["content"][0]["text"]
+            time.sleep(cfg.token_ms / 1000 * -(-len(text) // cfg.stream_chunk_chars))
+            self._json(200, response)
+
+        def _stream(self, response: dict) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for seq, (kind, payload) in enumerate(_stream_events(response, cfg.stream_chunk_chars)):
+                if kind == "response.output_text.delta":
+                    time.sleep(cfg.token_ms / 1000)
+                data = f"event: {kind}\ndata: {json.dumps({'type': kind, 'sequence_number': seq, **payload})}\n\n".encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def serve(cfg: FakeConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the fake server in a daemon thread and return it (`server.server_port`)."""
+    server = ThreadingHTTPServer((host, port), make_handler(cfg))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
+
+
+def add_arguments(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--latency-ms", type=float, default=50, help="latencia base por llamada")
+    ap.add_argument("--jitter-ms", type=float, default=0, help="variación uniforme +/- sobre la latencia")
+    ap.add_argument("--error-429", type=float, default=0.0, help="probabilidad de responder 429")
+    ap.add_argument("--error-500", type=float, default=0.0, help="probabilidad de responder 500")
+    ap.add_argument("--audio-kb", type=float, default=32, help="tamaño del MP3 devuelto por audio.speech")
+    ap.add_argument("--llm-extra-chars", type=int, default=0, help="caracteres extra en las entonaciones devueltas")
+    ap.add_argument("--cache-min-tokens", type=int, default=1024,
+                    help="prefijo mínimo (tokens) para reportar cached_tokens; 0 desactiva la caché simulada")
+    ap.add_argument("--token-ms", type=float, default=0, help="tiempo de generación por trozo de salida (con o sin stream)")
+    ap.add_argument("--stream-chunk-chars", type=int, default=8, help="caracteres por trozo de salida (un delta en las respuestas con stream)")
+    ap.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_429=args.error_429,
+        error_500=args.error_500,
+        audio_kb=args.audio_kb,
+        llm_extra_chars=args.llm_extra_chars,
+        cache_min_tokens=args.cache_min_tokens,
+        token_ms=args.token_ms,
+        stream_chunk_chars=args.stream_chunk_chars,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8999)
+    add_arguments(ap)
+    args = ap.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config_from_args(args)))
+    server.daemon_threads = True
+    print(f"fake OpenAI listening on http://{args.host}:{server.server_port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+"""Reproducible performance benchmarks for the backend API.
+
+Runs the FastAPI app (uvicorn, in-process) against the local fake OpenAI server
+(`benchmarks.fake_openai`, started as a subprocess) on a temporary voices
+directory, so no real API credits are used and no real projects are touched.
+
+Uso (desde `backend/`):
+
+    python -m benchmarks.run --out bench.json
+    python -m benchmarks.run --scenarios bulk_llm,bulk_tts --rows 300 --latency-ms 120 --jitter-ms 60 --error-429 0.02
+
+Scenarios:
+
+- `upload`       POST /api/upload with a PDF (`--pdf`, defaults to the sample in the repo).
+- `list_records` GET /api/records on a `--rows` project, `--concurrency` clients.
+- `patch_storm`  concurrent PATCH /api/records/{num}; reports lost updates.
+- `llm_one`      single-record cleanup, one at a time on up to 20 rows:
+                 POST /api/llm/process/{pid}/{num} (blocking) vs its `/stream`
+                 SSE variant; reports time to first delta and to the saved record.
+- `speculative`  reviewer loop on up to 10 rows with audio: PATCH `respuesta`,
+                 "press play" `--review-ms` later and regenerate if the mp3 is
+                 stale; with and without speculative pre-synthesis.
+- `bulk_llm`     POST /api/llm/start (with a `--project-prompt-chars` project prompt)
+                 and wait for every row; also reports the prompt-cache usage.
+- `bulk_tts`     POST /api/tts/start and wait for every row.
+
+Output is one JSON document (`--out` or stdout) with run metadata and, per
+scenario: ops, rows, elapsed_s, rows_per_s, latency_ms p50/p95/p99/max,
+errors and peak_rss_kb (high-water mark of the API process so far). The fake
+provider counters (requests, errors, input/cached tokens) go in `meta.provider_stats`.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from benchmarks import fake_openai
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_PDF = REPO_ROOT / "Entrevista-con-Lacertaun-ser-reptiliano-intraterrestre.pdf"
+SCENARIOS = ("upload", "list_records", "patch_storm", "llm_one", "speculative", "bulk_llm", "bulk_tts")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    xs = sorted(samples)
+
+    def pct(p: float) -> float:
+        return round(xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))] * 1000, 2)
+
+    return {"p50": pct(50), "p95": pct(95), "p99": pct(99), "max": round(xs[-1] * 1000, 2)}
+
+
+def peak_rss_kb() -> int:
+    # ru_maxrss is KB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def synthetic_text(rows: int, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    words = "el la de que y en un una por con para como pero su planeta especie verdad tiempo años".split()
+    blocks = []
+    for _ in range(rows):
+        q = " ".join(rnd.choices(words, k=rnd.randint(6, 20)))
+        r = " ".join(rnd.choices(words, k=rnd.randint(30, 120)))
+        blocks.append(f"Pregunta: {q}?\nRespuesta: {r}.")
+    return "\n".join(blocks)
+
+
+@contextmanager
+def fake_provider(args: argparse.Namespace):
+    port = free_port()
+    cmd = [
+        sys.executable, "-m", "benchmarks.fake_openai", "--port", str(port),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--error-429", str(args.error_429), "--error-500", str(args.error_500),
+        "--audio-kb", str(args.audio_kb), "--llm-extra-chars", str(args.llm_extra_chars),
+        "--cache-min-tokens", str(args.cache_min_tokens), "--token-ms", str(args.token_ms),
+        "--stream-chunk-chars", str(args.stream_chunk_chars),
+    ]
+    if args.seed is not None:
+        cmd += ["--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd, cwd=Path(__file__).resolve().parents[1], stdout=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        import httpx
+
+        for _ in range(100):
+            try:
+                httpx.get(base + "/_stats", timeout=0.5)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.05)
+        yield base
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+@contextmanager
+def api_server():
+    import uvicorn
+    from app.main import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    t = threading.Thread(target=server.run, name="bench-api", daemon=True)
+    t.start()
+    while not server.started:
+        time.sleep(0.02)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        t.join(timeout=10)
+
+
+@contextmanager
+def timed_calls(module, attr: str, samples: list, errors: list, done: threading.Semaphore):
+    """Record the duration of every call to `module.attr` (per-row latency of bulk jobs)."""
+    original = getattr(module, attr)
+
+    def wrapper(*a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return original(*a, **kw)
+        except Exception as e:
+            errors.append(str(e))
+            raise
+        finally:
+            samples.append(time.perf_counter() - t0)
+            done.release()
+
+    setattr(module, attr, wrapper)
+    try:
+        yield
+    finally:
+        setattr(module, attr, original)
+
+
+def seed_project(client, rows: int) -> str:
+    from app.services import csv_store
+
+    pid = client.post("/api/projects", json={"title": f"bench {rows} rows"}).json()["project_id"]
+    csv_store.create_csv_from_text(synthetic_text(rows), pid, overwrite=True)
+    return pid
+
+
+def run_concurrent(fn, n: int, concurrency: int) -> tuple[list[float], int, float]:
+    samples: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        nonlocal errors
+        t0 = time.perf_counter()
+        ok = fn(i)
+        dt = time.perf_counter() - t0
+        with lock:
+            samples.append(dt)
+            if not ok:
+                errors += 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        list(ex.map(one, range(n)))
+    return samples, errors, time.perf_counter() - t0
+
+
+def result(name: str, ops: int, rows: int, elapsed: float, samples: list[float], errors: int, **extra) -> dict:
+    out = {
+        "scenario": name,
+        "ops": ops,
+        "rows": rows,
+        "elapsed_s": round(elapsed, 4),
+        "rows_per_s": round(rows / elapsed, 2) if elapsed > 0 else None,
+        "latency_ms": percentiles(samples),
+        "errors": errors,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+    out.update(extra)
+    return out
+
+
+def scenario_upload(client, args) -> dict:
+    pdf = Path(args.pdf)
+    data = pdf.read_bytes()
+    pid = client.post("/api/projects", json={"title": "bench upload"}).json()["project_id"]
+    rows = 0
+
+    def one(_i: int) -> bool:
+        nonlocal rows
+        r = client.post("/api/upload", files={"file": (pdf.name, data, "application/pdf")}, data={"project_id": pid})
+        if r.status_code == 200:
+            rows = r.json().get("pairs", rows)
+        return r.status_code == 200
+
+    samples, errors, elapsed = run_concurrent(one, args.uploads, 1)
+    return result("upload", args.uploads, rows * args.uploads, elapsed, samples, errors, pdf_bytes=len(data))
+
+
+def scenario_list_records(client, args) -> dict:
+    pid = seed_project(client, args.rows)
+    samples, errors, elapsed = run_concurrent(
+        lambda i: client.get(f"/api/records/{pid}").status_code == 200, args.requests, args.concurrency
+    )
+    return result("list_records", args.requests, args.rows * args.requests, elapsed, samples, errors)
+
+
+def scenario_patch_storm(client, args) -> dict:
+    pid = seed_project(client, args.rows)
+    n = min(args.requests, args.rows)
+
+    def one(i: int) -> bool:
+        return client.patch(f"/api/records/{pid}/{i + 1}", json={"notas": f"bench-{i}"}).status_code == 200
+
+    samples, errors, elapsed = run_concurrent(one, n, args.concurrency)
+    records = client.get(f"/api/records/{pid}").json()
+    notes = {int(r["num"]): r.get("notas") for r in records}
+    lost = sum(1 for i in range(n) if notes.get(i + 1) != f"bench-{i}")
+    return result("patch_storm", n, n, elapsed, samples, errors, lost_updates=lost)
+
+
+def _bulk(client, args, name: str, start_path: str, module, attr: str, body: dict | None = None) -> tuple[str, dict]:
+    pid = seed_project(client, args.rows)
+    samples: list[float] = []
+    failures: list[str] = []
+    done = threading.Semaphore(0)
+    with timed_calls(module, attr, samples, failures, done):
+        t0 = time.perf_counter()
+        client.post(start_path.format(pid=pid), json=body or {})
+        for _ in range(args.rows):
+            if not done.acquire(timeout=args.timeout):
+                break
+        elapsed = time.perf_counter() - t0
+    return pid, result(name, len(samples), len(samples), elapsed, samples, len(failures))
+
+
+def scenario_llm_one(client, args) -> dict:
+    pid = seed_project(client, args.rows)
+    nums = [r["num"] for r in client.get(f"/api/records/{pid}").json()][:20]
+    blocking, first, complete = [], [], []
+    errors = 0
+    t0 = time.perf_counter()
+    for num in nums:
+        t = time.perf_counter()
+        r = client.post(f"/api/llm/process/{pid}/{num}", json={})
+        blocking.append(time.perf_counter() - t)
+        errors += r.status_code != 200
+        t = time.perf_counter()
+        saved = False
+        with client.stream("POST", f"/api/llm/process/{pid}/{num}/stream", json={}) as resp:
+            for line in resp.iter_lines():
+                if line == "event: delta" and len(first) < len(complete) + 1:
+                    first.append(time.perf_counter() - t)
+                elif line == "event: record":
+                    saved = True
+        complete.append(time.perf_counter() - t)
+        errors += not saved
+    elapsed = time.perf_counter() - t0
+    return result(
+        "llm_one", 2 * len(nums), len(nums), elapsed, blocking, errors,
+        stream_first_delta_ms=percentiles(first), stream_complete_ms=percentiles(complete),
+    )
+
+
+def scenario_speculative(client, args) -> dict:
+    from app.utils import get_project_dir
+
+    out = {}
+    for mode in ("off", "on"):
+        pid = seed_project(client, args.rows)
+        nums = [r["num"] for r in client.get(f"/api/records/{pid}").json()][:10]
+        for num in nums:
+            client.post(f"/api/tts/{pid}/{num}", json={"part": "respuesta"})
+        if mode == "on":
+            client.post(f"/api/projects/{pid}/info", json={"speculative_tts": {"debounce_ms": 500}})
+        waits, ready = [], 0
+        for num in nums:
+            mp3 = get_project_dir(pid) / str(num) / f"r{num}.mp3"
+            edited = time.time()
+            client.patch(f"/api/records/{pid}/{num}", json={"respuesta": f"Respuesta revisada {num}."})
+            time.sleep(args.review_ms / 1000)
+            # play: fresh audio is served as is, stale audio has to be regenerated first
+            t = time.perf_counter()
+            if mp3.stat().st_mtime >= edited:
+                ready += 1
+            else:
+                client.post(f"/api/tts/{pid}/{num}", json={"part": "respuesta"})
+            waits.append(time.perf_counter() - t)
+        out[mode] = {"rows": len(nums), "ready_at_play": ready, "play_wait_ms": percentiles(waits)}
+    return {"scenario": "speculative", "review_ms": args.review_ms, **out, "speculative_stats": client.get("/api/admin/speculative").json()}
+
+
+def scenario_bulk_llm(client, args) -> dict:
+    from app.services import llm_processing
+
+    # long project prompt: the shared prefix the provider can cache across rows
+    prompt = ("Entrevista de divulgación, registro cercano y claro. " * (args.project_prompt_chars // 52 + 1))[:args.project_prompt_chars]
+    pid, res = _bulk(client, args, "bulk_llm", "/api/llm/start/{pid}", llm_processing, "process_one", {"project_prompt": prompt})
+    res["prompt_cache"] = client.get(f"/api/llm/prompt/{pid}", params={"project_prompt": prompt}).json()["usage"]
+    return res
+
+
+def scenario_bulk_tts(client, args) -> dict:
+    from app.routers import tts
+
+    return _bulk(client, args, "bulk_tts", "/api/tts/start/{pid}", tts, "synthesize_block")[1]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"lista separada por comas ({', '.join(SCENARIOS)})")
+    ap.add_argument("--rows", type=int, default=100, help="filas del proyecto sintético")
+    ap.add_argument("--requests", type=int, default=200, help="peticiones en list_records / patch_storm")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--uploads", type=int, default=5)
+    ap.add_argument("--pdf", default=str(DEFAULT_PDF))
+    ap.add_argument("--review-ms", type=int, default=2000, help="tiempo entre editar y pulsar play en el escenario speculative")
+    ap.add_argument("--project-prompt-chars", type=int, default=6000, help="longitud del project_prompt en bulk_llm")
+    ap.add_argument("--timeout", type=float, default=300, help="espera máxima por fila en los escenarios bulk")
+    ap.add_argument("--out", help="fichero JSON de salida (por defecto stdout)")
+    fake_openai.add_arguments(ap)
+    args = ap.parse_args()
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        ap.error(f"escenarios desconocidos: {', '.join(sorted(unknown))}")
+
+    voices_dir = tempfile.mkdtemp(prefix="entona-bench-")
+    os.environ["VOICES_DIR"] = voices_dir
+    with fake_provider(args) as provider:
+        os.environ["OPENAI_API_BASE"] = provider + "/v1"
+        os.environ["OPENAI_API_KEY"] = "bench"
+        import httpx
+
+        with api_server() as base, httpx.Client(base_url=base, timeout=args.timeout) as client:
+            results = []
+            for name in names:
+                print(f"running {name}...", file=sys.stderr)
+                results.append(globals()[f"scenario_{name}"](client, args))
+            provider_stats = httpx.get(provider + "/_stats").json()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "voices_dir": voices_dir,
+            "args": {k: v for k, v in vars(args).items() if k != "out"},
+            "provider_stats": provider_stats,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Concurrency stress test for a multi-worker deployment.
+
+Starts the API with `uvicorn --workers N` (plus the fake OpenAI server) on a
+temporary voices directory and hammers one project from many clients at once,
+then checks the files on disk:
+
+- `patch_storm`   concurrent PATCH of distinct rows, spread over the workers;
+                  every note must survive (no lost updates in entrevista.csv).
+- `info_storm`    concurrent POST /projects/{pid}/info with distinct keys; every
+                  key must be in the .info and the file must be valid JSON.
+- `status_storm`  `mark_status_processed` from `--procs` separate processes on
+                  distinct rows; every row must end up processed.
+- `tts_race`      concurrent tts_one on the same file with different voices;
+                  the mp3 must be complete (whole frames) and no temp file left.
+- `logs`          every line of the project log must hold exactly one entry.
+
+Uso (desde `backend/`):
+
+    python -m benchmarks.stress_workers --workers 4 --rows 60 --concurrency 32
+
+Prints a JSON report and exits with status 1 if any check fails.
+"""
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from benchmarks import fake_openai
+from benchmarks.run import fake_provider, free_port, synthetic_text
+
+LOG_ENTRY = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\+00:00Z \[[A-Z]+\] ")
+
+
+@contextmanager
+def api_workers(workers: int, env: dict):
+    port = free_port()
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=Path(__file__).resolve().parents[1], env=env)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        import httpx
+
+        for _ in range(200):
+            try:
+                httpx.get(base + "/api/projects", timeout=0.5)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.05)
+        yield base
+    finally:
+        proc.terminate()
+        proc.wait(timeout=20)
+
+
+def hammer(fn, n: int, concurrency: int) -> tuple[int, float]:
+    """Run fn(i) for i in range(n) from `concurrency` threads. Returns (errors, elapsed)."""
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        oks = list(ex.map(fn, range(n)))
+    return oks.count(False), time.perf_counter() - t0
+
+
+def _mark_processed(args: tuple[str, list[int]]) -> int:
+    from app.services import csv_store
+
+    project_id, nums = args
+    errors = 0
+    for num in nums:
+        try:
+            csv_store.mark_status_processed(project_id, num)
+        except Exception:
+            # e.g. a torn read of a status CSV being rewritten by another process
+            errors += 1
+    return errors
+
+
+def check(name: str, ok: bool, **detail) -> dict:
+    return {"check": name, "ok": bool(ok), **detail}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    ap.add_argument("--procs", type=int, default=4, help="processes writing the status CSV")
+    ap.add_argument("--rows", type=int, default=60)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--info-keys", type=int, default=40)
+    ap.add_argument("--tts-requests", type=int, default=24)
+    fake_openai.add_arguments(ap)
+    args = ap.parse_args()
+
+    voices_dir = tempfile.mkdtemp(prefix="entona-stress-")
+    os.environ["VOICES_DIR"] = voices_dir
+    import httpx
+    from app.services import csv_store
+    from app.utils import create_project, get_info_path, get_project_dir
+
+    pid = create_project()
+    csv_store.create_csv_from_text(synthetic_text(args.rows), pid, overwrite=True)
+    checks = []
+
+    with fake_provider(args) as provider:
+        env = dict(os.environ, OPENAI_API_BASE=provider + "/v1", OPENAI_API_KEY="stress")
+        with api_workers(args.workers, env) as base, httpx.Client(base_url=base, timeout=120) as client:
+            # patch_storm
+            errors, elapsed = hammer(
+                lambda i: client.patch(f"/api/records/{pid}/{i + 1}", json={"notas": f"stress-{i}"}).status_code == 200,
+                args.rows, args.concurrency,
+            )
+            try:
+                notes = {int(r["num"]): r["notas"] for r in csv_store.read_records(pid).to_dicts()}
+                corrupt = False
+            except Exception:
+                # interleaved writes from two workers leave an unparseable CSV
+                notes, corrupt = {}, True
+            lost = sum(1 for i in range(args.rows) if notes.get(i + 1) != f"stress-{i}")
+            checks.append(check("patch_storm", errors == 0 and lost == 0, errors=errors, lost_updates=lost, corrupt_csv=corrupt, elapsed_s=round(elapsed, 3)))
+            if corrupt:
+                csv_store.create_csv_from_text(synthetic_text(args.rows), pid, overwrite=True)
+
+            # info_storm
+            errors, elapsed = hammer(
+                lambda i: client.post(f"/api/projects/{pid}/info", json={f"stress_{i}": i}).status_code == 200,
+                args.info_keys, args.concurrency,
+            )
+            try:
+                raw = json.loads(get_info_path(pid).read_text(encoding="utf-8"))
+                missing = sum(1 for i in range(args.info_keys) if raw.get(f"stress_{i}") != i)
+            except ValueError:
+                missing = args.info_keys
+            checks.append(check("info_storm", errors == 0 and missing == 0, errors=errors, missing_keys=missing, elapsed_s=round(elapsed, 3)))
+
+            # status_storm
+            csv_store.init_status_csv(pid)
+            nums = list(range(1, args.rows + 1))
+            chunks = [(pid, nums[i::args.procs]) for i in range(args.procs)]
+            t0 = time.perf_counter()
+            with multiprocessing.get_context("spawn").Pool(args.procs) as pool:
+                errors = sum(pool.map(_mark_processed, chunks))
+            status = csv_store.read_status(pid)
+            checks.append(check("status_storm", errors == 0 and status["processed"] == args.rows, errors=errors, **status, elapsed_s=round(time.perf_counter() - t0, 3)))
+
+            # tts_race
+            voices = ["alloy", "ash", "coral", "echo", "onyx", "sage"]
+            errors, elapsed = hammer(
+                lambda i: client.post(f"/api/tts/{pid}/1", json={"part": "pregunta", "voice_override": voices[i % len(voices)]}).status_code == 200,
+                args.tts_requests, args.concurrency,
+            )
+            mp3 = get_project_dir(pid) / "1" / "p1.mp3"
+            data = mp3.read_bytes() if mp3.exists() else b""
+            whole = bool(data) and data[:2] == fake_openai.MP3_FRAME[:2] and len(data) % len(fake_openai.MP3_FRAME) == 0
+            leftovers = [p.name for p in Path(voices_dir).rglob("*.tmp")]
+            checks.append(check("tts_race", errors == 0 and whole and not leftovers, errors=errors, mp3_bytes=len(data), tmp_files=leftovers, elapsed_s=round(elapsed, 3)))
+
+    # logs
+    entries = bad = 0
+    for f in (get_project_dir(pid) / ".log").glob("*.log"):
+        for line in f.read_text(encoding="utf-8").splitlines():
+            n = len(LOG_ENTRY.findall(line))
+            entries += n
+            if n > 1 or (n == 1 and not LOG_ENTRY.match(line)):
+                bad += 1
+    checks.append(check("logs", bad == 0 and entries > 0, entries=entries, interleaved_lines=bad))
+
+    report = {"workers": args.workers, "procs": args.procs, "rows": args.rows, "voices_dir": voices_dir, "checks": checks}
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if all(c["ok"] for c in checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
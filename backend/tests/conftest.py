@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# app.utils fija BASE_VOICES_DIR al importarse: los tests usan un directorio temporal
+os.environ.setdefault("VOICES_DIR", tempfile.mkdtemp(prefix="entona-tests-"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
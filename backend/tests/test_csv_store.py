@@ -0,0 +1,14 @@
+from app.services import csv_store
+from app.utils import create_project
+
+
+def test_update_record_changes_reports_changed_columns():
+    pid = create_project()
+    csv_store.create_csv_from_text("Pregunta: ¿Uno?\nRespuesta: Sí.", pid, overwrite=True)
+    rec = csv_store.get_record(pid, 1)
+
+    updated, changed = csv_store.update_record_changes(pid, 1, pregunta=rec.pregunta, respuesta="No.", notas="x")
+
+    assert updated["respuesta"] == "No."
+    assert changed == ["respuesta", "notas"]
+    assert csv_store.update_record_changes(pid, 1, respuesta="No.")[1] == []
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from app.config import settings
+from app.services.dispatcher import BULK, ProviderPool
+
+
+def _waiter(pool: ProviderPool, project_id: str, order: list) -> threading.Thread:
+    def run():
+        pool.acquire(BULK, project_id)
+        order.append(project_id)
+
+    t = threading.Thread(target=run)
+    t.start()
+    # wait until it is queued, so the FIFO order is known
+    while not any(w.project_id == project_id for w in pool._waiters):
+        time.sleep(0.001)
+    return t
+
+
+def test_past_calls_do_not_lower_priority():
+    pool = ProviderPool("test", 1)
+    for _ in range(100):
+        pool.acquire(BULK, "old")
+        pool.release("old")
+    pool.acquire(BULK, "holder")
+    order: list = []
+    threads = [_waiter(pool, "old", order), _waiter(pool, "new", order)]
+
+    pool.release("holder")
+    threads[0].join(1)
+    pool.release(order[0])
+    threads[1].join(1)
+
+    assert order == ["old", "new"]
+
+
+def test_project_with_fewer_calls_in_flight_goes_first():
+    pool = ProviderPool("test", 2)
+    pool.acquire(BULK, "a")
+    pool.acquire(BULK, "a")
+    order: list = []
+    threads = [_waiter(pool, "a", order), _waiter(pool, "b", order)]
+
+    pool.release("a")
+    for t in threads:
+        t.join(0.2)
+
+    assert order == ["b"]
+    pool.release("a")
+    threads[0].join(1)
+    assert order == ["b", "a"]
+    pool.release("a")
+    pool.release("b")
+    assert pool._active == {}
+
+
+def test_bulk_local_tts_uses_every_worker():
+    from app.services import dispatcher
+
+    pool = dispatcher.get_pool("tts_local")
+
+    # bulk calls may take every worker process of the local pool
+    assert pool._limit(BULK) == settings.LOCAL_TTS_WORKERS
@@ -0,0 +1,37 @@
+import threading
+import time
+
+from app.services import profiler
+from app.utils import create_project
+
+
+def test_stop_during_a_sampler_tick_keeps_the_written_profile(monkeypatch):
+    pid = create_project()
+    in_tick, resume = threading.Event(), threading.Event()
+    codes = profiler._codes
+
+    def paused_codes(frame):
+        # the sampler walked a stack and is about to record it
+        in_tick.set()
+        resume.wait(5)
+        return codes(frame)
+
+    monkeypatch.setattr(profiler, "_codes", paused_codes)
+    done = threading.Event()
+    worker = threading.Thread(target=done.wait, name="busy")
+    worker.start()
+    try:
+        sess = profiler._start(profiler.Session(pid, "job", "test", [], 5, pinned=[worker.ident]))
+        assert in_tick.wait(5)
+
+        meta = profiler.stop(sess.id)
+        resume.set()
+        # the sampler finishes its tick: nothing is added to the stopped session
+        time.sleep(0.2)
+
+        assert sess.done.is_set()
+        assert sess.samples == meta["samples"] == sum(sess.stacks.values())
+    finally:
+        resume.set()
+        done.set()
+        worker.join()
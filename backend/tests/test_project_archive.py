@@ -0,0 +1,88 @@
+import hashlib
+import io
+import json
+import tarfile
+
+import pytest
+
+from app.services import audio_store, csv_store, project_archive, project_catalog, project_info
+from app.utils import BASE_VOICES_DIR, create_project
+
+MP3 = b"\xff\xfb\x90\x64" + bytes(413)
+
+
+def _project(audio: dict[str, bytes]) -> str:
+    pid = create_project()
+    csv_store.create_csv_from_text("Pregunta: ¿Uno?\nRespuesta: Sí.\nPregunta: ¿Dos?\nRespuesta: No.", pid, overwrite=True)
+    project_info.write_info(pid, {"title": "original"})
+    store = audio_store.get_store()
+    for rel, data in audio.items():
+        with store.writer(f"{pid}/{rel}") as blob:
+            blob.write(data)
+    return pid
+
+
+def _add(tar: tarfile.TarFile, name: str, data: bytes, sha: str | None = None) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.pax_headers = {project_archive.SHA_KEY: sha or hashlib.sha256(data).hexdigest()}
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _archive(source_id: str, corrupt_last: bool) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w", format=tarfile.PAX_FORMAT) as tar:
+        manifest = {"format": project_archive.FORMAT, "version": project_archive.VERSION, "project_id": source_id}
+        _add(tar, project_archive.MANIFEST, json.dumps(manifest).encode())
+        _add(tar, project_archive.INFO, json.dumps({"title": "importado"}).encode())
+        _add(tar, project_archive.RECORDS, b"num,pregunta,respuesta\n1,Nueva,Otra\n")
+        _add(tar, "audio/1/p1.mp3", MP3 + b"\x01")
+        _add(tar, "audio/2/p2.mp3", MP3 + b"\x02", sha="0" * 64 if corrupt_last else None)
+    return buf.getvalue()
+
+
+def test_corrupt_archive_leaves_existing_project_untouched():
+    pid = _project({"1/p1.mp3": MP3 + b"old1", "2/p2.mp3": MP3 + b"old2"})
+    csv_before = csv_store.read_records(pid)
+    info_before = project_info.read_raw(pid)
+
+    with pytest.raises(project_archive.ArchiveError):
+        project_archive.import_archive(io.BytesIO(_archive(pid, corrupt_last=True)))
+
+    store = audio_store.get_store()
+    assert store.read(f"{pid}/1/p1.mp3") == MP3 + b"old1"
+    assert store.read(f"{pid}/2/p2.mp3") == MP3 + b"old2"
+    assert [(r.pregunta, r.respuesta) for r in csv_store.read_records(pid)] == [(r.pregunta, r.respuesta) for r in csv_before]
+    assert project_info.read_raw(pid) == info_before
+    assert not any((BASE_VOICES_DIR / project_archive.STAGING_DIR).iterdir())
+
+
+def test_corrupt_archive_does_not_create_project():
+    with pytest.raises(project_archive.ArchiveError):
+        project_archive.import_archive(io.BytesIO(_archive("src", corrupt_last=True)), project_id="newproj")
+
+    assert not (BASE_VOICES_DIR / "newproj").exists()
+    assert "newproj" not in {p["id"] for p in project_catalog.list_projects()[0]}
+
+
+def test_valid_archive_is_applied():
+    pid = _project({"1/p1.mp3": MP3 + b"old1", "2/p2.mp3": MP3 + b"old2"})
+
+    result = project_archive.import_archive(io.BytesIO(_archive(pid, corrupt_last=False)))
+
+    store = audio_store.get_store()
+    assert result["audio_written"] == 2 and not result["created"]
+    assert store.read(f"{pid}/1/p1.mp3") == MP3 + b"\x01"
+    assert store.read(f"{pid}/2/p2.mp3") == MP3 + b"\x02"
+    assert [r.pregunta for r in csv_store.read_records(pid)] == ["Nueva"]
+    assert project_info.read_raw(pid)["title"] == "importado"
+
+
+def test_reimport_skips_identical_audio():
+    pid = _project({})
+    data = _archive(pid, corrupt_last=False)
+    project_archive.import_archive(io.BytesIO(data))
+
+    result = project_archive.import_archive(io.BytesIO(data))
+
+    assert result["audio_skipped"] == 2 and result["audio_written"] == 0
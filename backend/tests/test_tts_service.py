@@ -0,0 +1,28 @@
+from app.config import settings
+from app.services import project_info
+from app.services.tts_service import project_tts
+from app.utils import create_project
+
+
+def test_project_tts_uses_per_role_voices():
+    pid = create_project()
+    project_info.write_info(pid, {"interviewer": {"voice": "ash"}, "interviewee": {"voice": "coral"}})
+
+    provider, voice_q, voice_r = project_tts(pid)
+
+    assert provider.name == "openai"
+    assert (voice_q, voice_r) == ("ash", "coral")
+
+
+def test_project_tts_accepts_legacy_voices_key():
+    pid = create_project()
+    project_info.write_info(pid, {"voices": {"interviewer": "ash", "interviewee": "nova"}})
+
+    assert project_tts(pid)[1:] == ("ash", "nova")
+
+
+def test_project_tts_defaults_to_configured_env_voices():
+    pid = create_project()
+    project_info.write_info(pid, {"title": "sin voces"})
+
+    assert project_tts(pid)[1:] == (settings.DEFAULT_VOICE_Q, settings.DEFAULT_VOICE_R)
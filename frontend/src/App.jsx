@@ -1,8 +1,10 @@
 import React, { useEffect, useState, useCallback, useRef, useMemo } from "react";
-import { listProjects, listRecords, llmProcess, startTtsAll, checkTtsStatus, getTtsStatusRows, startLlm, checkLlmStatus, getLlmStatusRows } from "./api";
-import { deleteProject } from "./api";
+import { listProjects, listRecords, llmProcess, startTtsAll, checkTtsStatus, getTtsStatusRows, startLlm, checkLlmStatus, getLlmStatusRows, getRun, pauseRun, resumeRun, cancelRun } from "./api";
+import { deleteProject, getAudioTimeline } from "./api";
 import Uploader from "./components/Uploader";
+import BatchUploader from "./components/BatchUploader";
 import RecordCard from "./components/RecordCard";
+import SearchPanel from "./components/SearchPanel";
 import Toast from "./components/Toast";
 import LanguageConfigModal from "./components/LanguageConfigModal";
 import PromptModal from "./components/PromptModal";
@@ -14,10 +16,13 @@ export default function App() {
   const [projects, setProjects] = useState([]);
   const [selected, setSelected] = useState(null); // project_id
   const [records, setRecords] = useState([]);
+  // num -> bloque de /api/audio/{pid}/timeline (duración, bytes y picos de cada parte)
+  const [audioBlocks, setAudioBlocks] = useState(null);
   const [toast, setToast] = useState("");
   const [busy, setBusy] = useState(false);
   const [busyAction, setBusyAction] = useState(null);
   const [processedCount, setProcessedCount] = useState(0);
+  const [runState, setRunState] = useState(null);
   const [totalCount, setTotalCount] = useState(0);
   const [showLog, setShowLog] = useState(false);
   const [statusRows, setStatusRows] = useState([]);
@@ -38,8 +43,13 @@ export default function App() {
 
   const fetchRecords = useCallback(async (project_id) => {
     if (!project_id) return;
-    const res = await listRecords(project_id);
+    const [res, tl] = await Promise.all([
+      listRecords(project_id),
+      // metadatos de audio de todo el proyecto en una petición (si falla, cada tarjeta hace sus HEAD)
+      getAudioTimeline(project_id).catch(() => null),
+    ]);
     setRecords(res.data);
+    setAudioBlocks(tl ? Object.fromEntries(tl.data.blocks.map((b) => [b.num, b])) : null);
   }, []);
 
   const onDeleteProject = async () => {
@@ -111,10 +121,48 @@ export default function App() {
     }
     if (finalProcessed !== null) setProcessedCount(finalProcessed);
     if (finalTotal !== null) setTotalCount(finalTotal);
+    setRunState(null);
     setBusy(false);
     setBusyAction(null);
   };
 
+  // estado de la ejecución masiva; true si ha terminado cancelada (y deja de consultar)
+  const checkRunCancelled = async (processed, total) => {
+    try {
+      const run = (await getRun(selected)).data.run;
+      setRunState(run ? run.state : null);
+      if (run && run.state === "cancelled") {
+        stopPolling(processed, total);
+        notify("Ejecución cancelada");
+        fetchRecords(selected);
+        return true;
+      }
+    } catch (e) {
+      console.error("Error consultando la ejecución", e);
+    }
+    return false;
+  };
+
+  const toggleRunPause = async () => {
+    try {
+      const res = runState === "paused" ? await resumeRun(selected) : await pauseRun(selected);
+      setRunState(res.data.run ? res.data.run.state : null);
+    } catch (e) {
+      console.error(e);
+      notify("No se pudo cambiar el estado de la ejecución", "error");
+    }
+  };
+
+  const cancelCurrentRun = async () => {
+    try {
+      const res = await cancelRun(selected);
+      setRunState(res.data.run ? res.data.run.state : null);
+    } catch (e) {
+      console.error(e);
+      notify("No se pudo cancelar la ejecución", "error");
+    }
+  };
+
   const runLLM = async () => {
     // Abrir modal para pedir prompt al usuario
     setShowPromptModal(true);
@@ -141,6 +189,7 @@ export default function App() {
           const { processed, total } = res.data;
           setProcessedCount(processed);
           setTotalCount(total);
+          if (await checkRunCancelled(processed, total)) return;
           if (total === 0 || processed >= total) {
             // set final values and stop polling reliably
             stopPolling(processed, total);
@@ -187,6 +236,7 @@ export default function App() {
           const { processed, total } = res.data;
           setProcessedCount(processed);
           setTotalCount(total);
+          if (await checkRunCancelled(processed, total)) return;
           if (total === 0 || processed >= total) {
             stopPolling(processed, total);
             notify("Audios generados");
@@ -226,12 +276,14 @@ export default function App() {
           <div className="mb-8">
             <div className="flex items-center justify-between mb-4">
               <h2 className="text-lg font-semibold">Proyectos</h2>
-              <div>
+              <div className="flex items-center gap-2">
+                <BatchUploader onDone={fetchProjects} onToast={notify} />
                 <button onClick={() => setShowNewProject(true)} className="px-3 py-2 rounded-2xl bg-emerald-600 text-white">
                   ➕ Nuevo proyecto
                 </button>
               </div>
             </div>
+            <SearchPanel projects={projects} onOpen={(project_id) => setSelected(project_id)} />
             <table className="w-full bg-white rounded-xl shadow">
               <thead>
                 <tr className="bg-gray-100">
@@ -328,6 +380,12 @@ export default function App() {
                   <div className="text-sm">
                     {processedCount}/{totalCount}
                   </div>
+                  <button onClick={toggleRunPause} disabled={runState === "cancelling"} className="px-2 py-1 rounded-md bg-white border text-xs disabled:opacity-50">
+                    {runState === "paused" ? "▶ Reanudar" : "⏸ Pausar"}
+                  </button>
+                  <button onClick={cancelCurrentRun} disabled={runState === "cancelling"} className="px-2 py-1 rounded-md bg-white border text-xs text-red-700 disabled:opacity-50">
+                    {runState === "cancelling" ? "Cancelando…" : "✕ Cancelar"}
+                  </button>
                 </div>
               )}
             </div>
@@ -348,7 +406,7 @@ export default function App() {
                 <div className="text-gray-500">Sube un PDF para comenzar…</div>
               ) : (
                 records.map((r) => (
-                  <RecordCard key={r.num} rec={r} onChange={(newRec) => setRecords((prev) => prev.map((x) => (x.num === newRec.num ? newRec : x)))} apiBase={API} projectId={selected} />
+                  <RecordCard key={r.num} rec={r} onChange={(newRec) => setRecords((prev) => prev.map((x) => (x.num === newRec.num ? newRec : x)))} apiBase={API} projectId={selected} audio={audioBlocks ? audioBlocks[r.num] || null : undefined} />
                 ))
               )}
             </div>
@@ -12,16 +12,60 @@ export const uploadPdf = (file, project_id = null) => {
   return api.post("/api/upload", data, { headers: { "Content-Type": "multipart/form-data" } });
 };
 
-export const listProjects = () => api.get("/api/projects");
+// varios PDFs (o zips) -> un proyecto por PDF; responde con el lote, el progreso en getUploadBatch
+export const uploadBatch = (files) => {
+  const data = new FormData();
+  for (const f of files) data.append("files", f);
+  return api.post("/api/upload/batch", data, { headers: { "Content-Type": "multipart/form-data" } });
+};
+export const getUploadBatch = (batch_id) => api.get(`/api/upload/batch/${batch_id}`);
+
+// params (opcional): { q, sort, order, offset, limit }; el total llega en la cabecera X-Total-Count
+export const listProjects = (params) => api.get("/api/projects", { params });
 export const listRecords = (project_id) => api.get(`/api/records/${project_id}`);
 export const patchRecord = (project_id, num, body) => api.patch(`/api/records/${project_id}/${num}`, body);
 export const llmProcess = (project_id, opts) => api.post(`/api/llm/process/${project_id}`, opts);
 export const llmProcessOne = (project_id, num, opts) => api.post(`/api/llm/process/${project_id}/${num}`, opts);
+// Igual que llmProcessOne, pero recibe la salida del LLM por SSE según se genera.
+// onEvent(event, data): "delta" {field, text} | "record" {record} | "error" {detail}
+export const streamLlmProcessOne = async (project_id, num, opts, onEvent, signal) => {
+  const res = await fetch(`${API_URL}/api/llm/process/${project_id}/${num}/stream`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+    body: JSON.stringify(opts || {}),
+    signal,
+  });
+  if (!res.ok) {
+    const err = await res.json().catch(() => ({}));
+    throw new Error(err.detail || `HTTP ${res.status}`);
+  }
+  const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buf = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += value;
+    let end;
+    while ((end = buf.indexOf("\n\n")) >= 0) {
+      const block = buf.slice(0, end);
+      buf = buf.slice(end + 2);
+      let event = "message";
+      const data = [];
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data.push(line.slice(5).trimStart());
+      }
+      if (data.length) onEvent(event, JSON.parse(data.join("\n")));
+    }
+  }
+};
 export const startLlm = (project_id, body) => api.post(`/api/llm/start/${project_id}`, body || {});
 export const checkLlmStatus = (project_id) => api.get(`/api/llm/check_status/${project_id}`);
 export const getLlmStatusRows = (project_id) => api.get(`/api/llm/status_rows/${project_id}`);
+// Plantillas efectivas del prompt, prefijo cacheable y uso de cached_tokens del proyecto
+export const getLlmPrompt = (project_id, project_prompt) => api.get(`/api/llm/prompt/${project_id}`, { params: { project_prompt } });
 export const ttsAll = (project_id) => api.post(`/api/tts/all/${project_id}`);
-export const startTtsAll = (project_id) => api.post(`/api/tts/start/${project_id}`);
+export const startTtsAll = (project_id, body) => api.post(`/api/tts/start/${project_id}`, body);
 export const checkTtsStatus = (project_id) => api.get(`/api/tts/check_status/${project_id}`);
 export const getTtsStatusRows = (project_id) => api.get(`/api/tts/status_rows/${project_id}`);
 export const ttsOne = (project_id, num, body) => api.post(`/api/tts/${project_id}/${num}`, body);
@@ -34,3 +78,26 @@ export const createProject = (body) => api.post(`/api/projects`, body);
 export const deleteProject = (project_id) => api.delete(`/api/projects/${project_id}`);
 
 
+
+// Pipeline LLM -> TTS solapado (body opcional: overwrite_texts, overwrite_prompts, project_prompt, llm_workers, tts_workers, queue_size)
+export const startPipeline = (project_id, body) => api.post(`/api/pipeline/start/${project_id}`, body || {});
+// Ejecución masiva en curso (TTS, LLM o pipeline): estado, pausa, reanudación y cancelación
+export const getRun = (project_id) => api.get(`/api/runs/${project_id}`);
+export const pauseRun = (project_id) => api.post(`/api/runs/${project_id}/pause`);
+export const resumeRun = (project_id) => api.post(`/api/runs/${project_id}/resume`);
+export const cancelRun = (project_id) => api.post(`/api/runs/${project_id}/cancel`);
+export const checkPipelineStatus = (project_id) => api.get(`/api/pipeline/check_status/${project_id}`);
+export const getPipelineStatusRows = (project_id) => api.get(`/api/pipeline/status_rows/${project_id}`);
+
+// Export en streaming (format: "ndjson" | "json"); URLs directas para descargar con <a href> o fetch
+export const exportRecordsUrl = (project_id, format = "ndjson") => `${API_URL}/api/export/${project_id}/records?format=${format}`;
+export const exportStatusUrl = (project_id, format = "ndjson") => `${API_URL}/api/export/${project_id}/status?format=${format}`;
+
+// Edición en lote: { updates: [{ num, fields }], find_replace?: { find, replace, columns, regex, case_sensitive, nums }, all_or_nothing, dry_run }
+export const batchUpdateRecords = (project_id, body) => api.post(`/api/records/${project_id}/batch`, body);
+
+// Línea de tiempo de audio del proyecto: duración, bytes y picos de cada parte (params: peaks, gap_ms)
+export const getAudioTimeline = (project_id, params) => api.get(`/api/audio/${project_id}/timeline`, { params });
+
+// Búsqueda de texto completo en todos los proyectos: { q, project: [ids], field: [columnas], raw, limit, offset }
+export const searchRecords = (params) => api.get(`/api/search`, { params, paramsSerializer: { indexes: null } });
@@ -0,0 +1,50 @@
+import React, { useRef, useState } from "react";
+import { uploadBatch, getUploadBatch } from "../api";
+
+// Sube varios PDFs (o un zip) y crea un proyecto por PDF; muestra el progreso del lote.
+export default function BatchUploader({ onDone, onToast }) {
+  const ref = useRef();
+  const [progress, setProgress] = useState(null);
+
+  const onChange = async (e) => {
+    const files = Array.from(e.target.files || []);
+    if (!files.length) return;
+    try {
+      const { data } = await uploadBatch(files);
+      let state = data;
+      setProgress(state.summary);
+      while (state.state !== "done") {
+        await new Promise((r) => setTimeout(r, 1000));
+        state = (await getUploadBatch(data.id)).data;
+        setProgress(state.summary);
+      }
+      const { done, failed } = state.summary;
+      onToast(`${done} proyectos creados${failed ? `, ${failed} ficheros con error` : ""}`, failed ? "error" : undefined);
+      for (const f of state.files.filter((f) => f.status === "failed")) console.warn(`${f.name}: ${f.error}`);
+      onDone?.();
+    } catch (e) {
+      console.error(e);
+      onToast("Error al subir los PDFs", "error");
+    } finally {
+      setProgress(null);
+      ref.current.value = "";
+    }
+  };
+
+  return (
+    <label className="inline-flex items-center gap-2 cursor-pointer px-3 py-2 rounded-2xl bg-indigo-600 text-white">
+      <span>
+        {progress ? `Importando ${progress.done + progress.failed}/${progress.total}…` : "📚 Importar PDFs"}
+      </span>
+      <input
+        ref={ref}
+        type="file"
+        className="hidden"
+        multiple
+        accept="application/pdf,application/zip,.zip"
+        disabled={!!progress}
+        onChange={onChange}
+      />
+    </label>
+  );
+}
@@ -3,9 +3,28 @@ import InlineEditable from "./InlineEditable";
 import NotesPanel from "./NotesPanel";
 import PromptModal from "./PromptModal";
 import Toast from "./Toast";
-import { patchRecord, ttsOne, listRecords, llmProcessOne } from "../api";
+import { patchRecord, ttsOne, listRecords, streamLlmProcessOne } from "../api";
 
-export default function RecordCard({ rec, onChange, apiBase, projectId }) {
+// Forma de onda aproximada a partir de los picos (0-255) del índice de audio
+function Waveform({ peaks, width = 120, height = 24 }) {
+  if (!peaks || peaks.length === 0) return null;
+  const step = width / peaks.length;
+  return (
+    <svg width={width} height={height} className="text-gray-400" aria-hidden="true">
+      {peaks.map((v, i) => {
+        const h = Math.max(1, (v / 255) * height);
+        return <rect key={i} x={i * step} y={(height - h) / 2} width={Math.max(1, step - 0.5)} height={h} fill="currentColor" />;
+      })}
+    </svg>
+  );
+}
+
+const fmtDuration = (ms) => {
+  const s = Math.round(ms / 1000);
+  return `${Math.floor(s / 60)}:${String(s % 60).padStart(2, "0")}`;
+};
+
+export default function RecordCard({ rec, onChange, apiBase, projectId, audio }) {
   const [openPrompt, setOpenPrompt] = useState(null); // "pregunta" | "respuesta" | null
   const [modalInitialText, setModalInitialText] = useState("");
 
@@ -24,6 +43,8 @@ export default function RecordCard({ rec, onChange, apiBase, projectId }) {
       // eslint-disable-next-line no-console
       console.debug("RecordCard: calling patchRecord", { projectId, num: rec.num, updated });
       const res = await patchRecord(projectId, rec.num, updated);
+      // el audio puede regenerarse en segundo plano (pre-síntesis especulativa): no reutilizar el mp3 en caché
+      bumpAudio(field);
       // eslint-disable-next-line no-console
       console.debug("RecordCard: patchRecord response", res && res.data ? res.data : res);
       // fetch authoritative data from server to avoid any client-side drift
@@ -50,14 +71,19 @@ export default function RecordCard({ rec, onChange, apiBase, projectId }) {
   const [processingAction, setProcessingAction] = useState(null);
   const gridColsClass = notesOpen ? "md:grid-cols-3" : "md:grid-cols-2";
 
-  // base URLs for audio files (without cache-busting)
-  const basePlayUrlP = `${apiBase}/voices/${projectId}/${rec.num}/p${rec.num}.mp3`;
-  const basePlayUrlR = `${apiBase}/voices/${projectId}/${rec.num}/r${rec.num}.mp3`;
+  // base URLs for audio files (without cache-busting); the API redirects to
+  // the file (/voices on disk, public or presigned URL with the S3 store)
+  const basePlayUrlP = `${apiBase}/api/audio/${projectId}/${rec.num}/pregunta`;
+  const basePlayUrlR = `${apiBase}/api/audio/${projectId}/${rec.num}/respuesta`;
   // version query params to force browser to reload updated audio
   const [audioVerP, setAudioVerP] = useState(0);
   const [audioVerR, setAudioVerR] = useState(0);
   const playUrlP = audioVerP ? `${basePlayUrlP}?v=${audioVerP}` : basePlayUrlP;
   const playUrlR = audioVerR ? `${basePlayUrlR}?v=${audioVerR}` : basePlayUrlR;
+  const bumpAudio = (field) => {
+    if (field === "pregunta" || field === "entonacion_p") setAudioVerP(Date.now());
+    if (field === "respuesta" || field === "entonacion_r") setAudioVerR(Date.now());
+  };
 
   const regen = async (part, promptText, language = null, accent = null) => {
     setProcessing(true);
@@ -91,18 +117,41 @@ export default function RecordCard({ rec, onChange, apiBase, projectId }) {
       overwrite_prompts: mode !== "texto",
       part: whichPart === "pregunta" ? (mode === "both" ? "both" : "pregunta") : mode === "both" ? "both" : "respuesta",
     };
+    // campos de la salida del LLM que se aplicarán al registro (igual que en el backend)
+    const inPart = (p) => body.part === "both" || body.part === p;
+    const target = {
+      pregunta_limpia: body.overwrite_texts && inPart("pregunta") ? "pregunta" : null,
+      respuesta_limpia: body.overwrite_texts && inPart("respuesta") ? "respuesta" : null,
+      entonacion_p: body.overwrite_prompts && inPart("pregunta") ? "entonacion_p" : null,
+      entonacion_r: body.overwrite_prompts && inPart("respuesta") ? "entonacion_r" : null,
+    };
+    const partial = {};
+    let saved = null;
+    let failed = null;
     try {
       setProcessing(true);
       setProcessingAction(`${whichPart}-${mode}`);
-      const res = await llmProcessOne(projectId, rec.num, body);
-      // actualizar registro con respuesta del servidor
-      if (res && res.data && res.data.record) {
-        onChange(res.data.record);
-        setToast({ text: "Reprocesado por LLM correctamente.", type: "success" });
-      }
+      // mostrar el texto según lo genera el modelo; se guarda solo al recibir `record`
+      await streamLlmProcessOne(projectId, rec.num, body, (event, data) => {
+        if (event === "delta" && target[data.field]) {
+          const key = target[data.field];
+          partial[key] = (partial[key] || "") + data.text;
+          onChange({ ...rec, ...partial });
+        } else if (event === "record") {
+          saved = data.record;
+        } else if (event === "error") {
+          failed = data.detail;
+        }
+      });
+      if (!saved) throw new Error(failed || "Respuesta del LLM incompleta");
+      onChange(saved);
+      Object.values(target).forEach((key) => key && bumpAudio(key));
+      setToast({ text: "Reprocesado por LLM correctamente.", type: "success" });
       setProcessing(false);
       setProcessingAction(null);
     } catch (e) {
+      // el registro no se ha guardado: volver a los valores anteriores
+      onChange(rec);
       setProcessing(false);
       setProcessingAction(null);
       // eslint-disable-next-line no-console
@@ -130,10 +179,30 @@ export default function RecordCard({ rec, onChange, apiBase, projectId }) {
   };
 
   useEffect(() => {
+    // con la línea de tiempo del proyecto (audio) no hace falta un HEAD por parte
+    if (audio !== undefined) {
+      setHasAudioP(Boolean(audio && audio.pregunta));
+      setHasAudioR(Boolean(audio && audio.respuesta));
+      return;
+    }
     // comprobar al montar y cuando cambie el record
     checkAll();
     // eslint-disable-next-line react-hooks/exhaustive-deps
-  }, [rec.num, apiBase]);
+  }, [rec.num, apiBase, audio]);
+
+  const audioInfo = (part) => {
+    const meta = audio && audio[part];
+    if (!meta) return null;
+    return (
+      <div className="flex items-center gap-2 text-xs text-gray-500" title={`${meta.bytes} bytes`}>
+        <Waveform peaks={meta.peaks} />
+        <span>{fmtDuration(meta.duration_ms)}</span>
+        {meta.provider === "local" ? (
+          <span className="px-1.5 rounded bg-amber-100 text-amber-800" title="Generado con la voz local (offline)">borrador</span>
+        ) : null}
+      </div>
+    );
+  };
 
   return (
     <div className="rounded-2xl bg-white shadow p-4 border border-gray-100">
@@ -151,7 +220,8 @@ export default function RecordCard({ rec, onChange, apiBase, projectId }) {
         <div className="rounded-xl p-3 bg-gray-50">
           {hasAudioP && (
             <div className="flex items-center gap-2">
-              <audio controls src={playUrlP} className="h-8 mt-2 mb-2" />
+              <audio controls preload="none" src={playUrlP} className="h-8 mt-2 mb-2" />
+              {audioInfo("pregunta")}
               <button
                 className="px-2 py-1 rounded-xl bg-red-500 text-white text-xs"
                 onClick={async () => {
@@ -229,7 +299,8 @@ export default function RecordCard({ rec, onChange, apiBase, projectId }) {
         <div className="rounded-xl p-3 bg-gray-50">
           {hasAudioR && (
             <div className="flex items-center gap-2">
-              <audio controls src={playUrlR} className="h-8 mt-2 mb-2" />
+              <audio controls preload="none" src={playUrlR} className="h-8 mt-2 mb-2" />
+              {audioInfo("respuesta")}
               <button
                 className="px-2 py-1 rounded-xl bg-red-500 text-white text-xs"
                 onClick={async () => {
@@ -0,0 +1,79 @@
+import React, { useEffect, useState } from "react";
+import { searchRecords } from "../api";
+
+const FIELD_LABELS = {
+  pregunta: "Pregunta",
+  respuesta: "Respuesta",
+  entonacion_p: "Entonación (Q)",
+  entonacion_r: "Entonación (R)",
+  notas: "Notas",
+};
+
+// snippet: lista de trozos; los impares son la coincidencia
+function Snippet({ parts }) {
+  return (
+    <span>
+      {parts.map((t, i) => (i % 2 ? <mark key={i} className="bg-yellow-200 rounded px-0.5">{t}</mark> : <span key={i}>{t}</span>))}
+    </span>
+  );
+}
+
+export default function SearchPanel({ projects, onOpen }) {
+  const [q, setQ] = useState("");
+  const [res, setRes] = useState(null);
+  const [error, setError] = useState("");
+
+  useEffect(() => {
+    if (!q.trim()) {
+      setRes(null);
+      setError("");
+      return;
+    }
+    // pequeño debounce mientras se escribe
+    const t = setTimeout(async () => {
+      try {
+        const r = await searchRecords({ q, limit: 30 });
+        setRes(r.data);
+        setError("");
+      } catch (e) {
+        setError(e?.response?.data?.detail || "Error en la búsqueda");
+      }
+    }, 250);
+    return () => clearTimeout(t);
+  }, [q]);
+
+  const title = (pid) => projects.find((p) => p.id === pid)?.title?.trim() || pid;
+
+  return (
+    <div className="mb-6">
+      <input
+        type="search"
+        className="w-full rounded-xl border px-3 py-2"
+        placeholder='Buscar en todos los bloques (palabras o "frase exacta")…'
+        value={q}
+        onChange={(e) => setQ(e.target.value)}
+      />
+      {error && <div className="mt-2 text-sm text-red-600">{error}</div>}
+      {res && (
+        <div className="mt-2 bg-white rounded-xl shadow divide-y">
+          <div className="p-2 text-xs text-gray-500">
+            {res.total} bloques en {Object.keys(res.projects).length} proyectos · {res.took_ms} ms
+            {!res.ranked && " · demasiadas coincidencias para ordenar por relevancia"}
+          </div>
+          {res.results.map((r) => (
+            <button key={`${r.project_id}-${r.num}`} className="block w-full text-left p-2 hover:bg-gray-50" onClick={() => onOpen(r.project_id, r.num)}>
+              <div className="text-sm font-medium">
+                {title(r.project_id)} · Bloque #{r.num}
+              </div>
+              {Object.entries(r.snippets).map(([field, parts]) => (
+                <div key={field} className="text-xs text-gray-600">
+                  <span className="font-semibold">{FIELD_LABELS[field] || field}:</span> <Snippet parts={parts} />
+                </div>
+              ))}
+            </button>
+          ))}
+        </div>
+      )}
+    </div>
+  );
+}